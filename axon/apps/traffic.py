@@ -4,17 +4,21 @@
 # The full license information can be found in LICENSE.txt
 # in the root directory of this project.
 
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
 import logging
-from uuid import uuid4
 
 from axon.apps.base import app_registry, BaseApp, exposed, exposify
-from axon.common.monit_queues import get_exchange
-from axon.common.subscribers import SQLRecorder, WavefrontDirectRecorder
+from axon.common.config import EXCHANGE_SHM_TRANSPORT, \
+    RULES_LOAD_CHUNK_SIZE
+from axon.common.monit_queues import get_exchange, merge_counters
+from axon.common.subscribers import LoopLagRecorder, SQLRecorder, \
+    WavefrontDirectRecorder
 from axon.traffic.controller import TrafficController
 from axon.traffic.record_store import TrafficRecordStore
+from axon.traffic.rules_cache import CachedTrafficRulesStore
+from axon.traffic.rules_loader import TrafficRulesLoader
 from axon.traffic.rules_store import TrafficRulesStore
-from axon.traffic.traffic_objects import TrafficRule, TrafficServer
+from axon.traffic.servers.profiles import create_response_profile
 
 
 @exposify
@@ -24,8 +28,8 @@ class TrafficApp(BaseApp):
 
     def __init__(self):
         self.log = logging.getLogger(__name__)
-        self._rules_store = TrafficRulesStore(
-            "sqlite:////Users/singhpradeep/.axon/rules.db")
+        self._rules_store = CachedTrafficRulesStore(TrafficRulesStore(
+            "sqlite:////Users/singhpradeep/.axon/rules.db"))
         self._record_store = TrafficRecordStore(
             "sqlite:////Users/singhpradeep/.axon/records.db")
         record_db_subscriber = SQLRecorder(self._record_store)
@@ -33,18 +37,26 @@ class TrafficApp(BaseApp):
             '',
             "", "pradeeps-mac",
             tags={"datacenter": "pradeeps-tes"})
-        traffic_exchange = get_exchange('traffic')
+        # Counters of all workers reach recorders as one snapshot
+        traffic_exchange = get_exchange('traffic', merge_counters,
+                                        EXCHANGE_SHM_TRANSPORT)
         traffic_exchange.attach(record_db_subscriber, 30)
         traffic_exchange.attach(wavefront_subscriber, 30)
-        self._traffic_controller = TrafficController(traffic_exchange)
+        self._loop_lag_recorder = LoopLagRecorder()
+        lag_exchange = get_exchange('loop_lag')
+        lag_exchange.attach(self._loop_lag_recorder, 0)
+        self._traffic_controller = TrafficController(
+            traffic_exchange, lag_exchange=lag_exchange)
 
     def initialize(self):
+        self._traffic_controller.warm_up()
         self.start_servers()
         self.start_clients()
 
     def shutdown(self):
         self.stop_clients()
         self.start_servers()
+        self._traffic_controller.stop_warm_pools()
 
     @exposed
     def add_server(self, protocol, port, endpoint, namespace=None):
@@ -182,53 +194,77 @@ class TrafficApp(BaseApp):
         """
         self._rules_store.enable_servers(endpoint, port, protocol)
 
+    @exposed
+    def set_servers_response_profile(self, response_profile, endpoint=None,
+                                     port=None, protocol=None):
+        """
+        Set response profile of servers matching given criteria. Takes
+        effect when the servers are started next time.
+        :param response_profile: response profile config or None to
+                                 restore default responses, e.g.
+                                 {'type': 'file', 'path': '/tmp/1m.bin'}
+        :type response_profile: dict
+        :param endpoint: endpoint for which servers will be updated
+        :type endpoint: str
+        :param port: port for which servers will be updated
+        :type port: int
+        :param protocol: protocol for which servers will be updated
+        :type protocol: str
+        """
+        if response_profile:
+            # Validate the profile before storing it
+            create_response_profile(response_profile)
+        self._rules_store.update_response_profile(
+            response_profile, endpoint, port, protocol)
+
     @exposed
     def register_traffic(self, traffic_configs):
         """
-        Register Traffic in with Axon. Axon Stores all the traffic configuration
-        in database, it does not starts any traffic as part of this API.
-        Duplicate rules which are already registered with Axon Will be ignored
+        Register Traffic in with Axon. Axon Stores all the traffic
+        configuration in database, it does not starts any traffic as part of
+        this API. Duplicate rules which are already registered with Axon Will
+        be ignored
         :param traffic_configs: traffic configuration
         :type traffic_configs: list
+        Server tuples can carry an optional response profile as third
+        element, see axon.traffic.servers.profiles.
         Example:
         traffic_config = [{
             'endpoint': '127.0.0.1',
-            'servers': [(8080, 'HTTP'), (8585, 'TCP'), (9000, 'UDP')],
+            'servers': [(8080, 'HTTP'), (8585, 'TCP'), (9000, 'UDP'),
+                        (8081, 'HTTP', {'type': 'fixed', 'size': 9000})],
             'clients': [('127.0.0.1', 8585, 'TCP', True, True, 10),
                         ('127.0.0.1', 9000, 'UDP', True, True, 10),
                         ('127.0.0.1', 8000, 'HTTP', True, True, 10)]
         }]
         """
-        self.log.info("Register traffic called with config %s" %
-                      traffic_configs)
-        servers = []
-        clients = []
-        current_servers = self._rules_store.get_servers()
-        current_clients = self._rules_store.get_clients()
-        for config in traffic_configs:
-            endpoint = config['endpoint']
-            for item in config['servers']:
-                server_rule = TrafficServer(uuid4().hex, endpoint,
-                                            item[0], item[1])
-                servers.append(server_rule)
-            for item in config['clients']:
-                client_rule = TrafficRule(uuid4().hex, endpoint,
-                                          item[0], item[1], item[2],
-                                          item[3], item[4], item[5])
-                clients.append(client_rule)
-
-        # Remove redundant Rules
-        servers = list(OrderedDict.fromkeys(servers))
-        clients = list(OrderedDict.fromkeys(clients))
-
-        # remove Existing rules
-        servers = list(set(servers) - set(current_servers))
-        clients = list(set(clients) - set(current_clients))
-
-        if servers:
-            self._rules_store.add_server_batch(servers)
-        if clients:
-            self._rules_store.add_client_batch(clients)
+        self.log.info("Register traffic called with %d configs" %
+                      len(traffic_configs))
+        TrafficRulesLoader(self._rules_store).load(traffic_configs)
+
+    @exposed
+    def register_traffic_stream(self, traffic_configs, progress_callback=None,
+                                chunk_size=RULES_LOAD_CHUNK_SIZE):
+        """
+        Register traffic configs in chunks, for policies too large to be
+        sent and deduplicated in one go. Memory used is bounded by
+        chunk_size rules, whatever the size of the policy.
+        :param traffic_configs: iterator or generator of traffic configs in
+                                format of register_traffic, or path of a
+                                file on agent with one JSON config per line
+        :type traffic_configs: iterable or str
+        :param progress_callback: called with counters of received and
+                                  added rules after every chunk
+        :type progress_callback: callable
+        :param chunk_size: number of rules registered per batch
+        :type chunk_size: int
+        :return: number of servers and clients received and added
+        :rtype: dict
+        """
+        if isinstance(traffic_configs, str):
+            traffic_configs = TrafficRulesLoader.read_configs(traffic_configs)
+        loader = TrafficRulesLoader(self._rules_store, chunk_size)
+        return loader.load(traffic_configs, progress_callback)
 
     @exposed
     def register_servers(self, endpoint, servers):
@@ -239,23 +275,13 @@ class TrafficApp(BaseApp):
         :param servers: list of server tuple
         :type servers: list
 
-        Example: Servers
-        [(8585, 'TCP'), ('9090', 'UDP')]
+        Example: Servers (port, protocol, optional response profile)
+        [(8585, 'TCP'), ('9090', 'UDP'),
+         (8080, 'HTTP', {'type': 'random', 'min_size': 64,
+                         'max_size': 9000, 'distribution': 'normal'})]
         """
-        servers_list = list()
-        current_servers = self._rules_store.get_servers(endpoint=endpoint)
-        for server in servers:
-            server_rule = TrafficServer(uuid4().hex, endpoint,
-                                        server[0], server[1])
-            servers_list.append(server_rule)
-
-        # Remove redundant Rules
-        servers_list = list(OrderedDict.fromkeys(servers_list))
-
-        # remove Existing rules
-        servers_list = list(set(servers_list) - set(current_servers))
-        if servers_list:
-            self._rules_store.add_server_batch(servers_list)
+        TrafficRulesLoader(self._rules_store).load(
+            [{'endpoint': endpoint, 'servers': servers}])
 
     @exposed
     def register_clients(self, endpoint, clients):
@@ -272,22 +298,8 @@ class TrafficApp(BaseApp):
          ('127.0.0.1', 9000, 'UDP', True, True, 10),
          ('127.0.0.1', 8000, 'HTTP', True, True, 10)]
         """
-        clients_list = list()
-        current_clients = self._rules_store.get_clients(source=endpoint)
-        for client in clients:
-            client_rule = TrafficRule(uuid4().hex, endpoint, client[0],
-                                      client[1], client[2], client[3],
-                                      client[4], client[5])
-            clients_list.append(client_rule)
-
-        # Remove redundant Rules
-        clients_list = list(OrderedDict.fromkeys(clients_list))
-
-        # remove Existing rules
-        clients_list = list(set(clients_list) - set(current_clients))
-
-        if clients_list:
-            self._rules_store.add_client_batch(clients_list)
+        TrafficRulesLoader(self._rules_store).load(
+            [{'endpoint': endpoint, 'clients': clients}])
 
     @exposed
     def get_traffic_rules(self, endpoint=None):
@@ -301,6 +313,8 @@ class TrafficApp(BaseApp):
         result = defaultdict(dict)
         for server in servers:
             server_tuple = (server.port, server.protocol)
+            if server.response_profile:
+                server_tuple += (server.response_profile,)
             if result[server.endpoint].get('servers'):
                 result[server.endpoint]['servers'].append(server_tuple)
             else:
@@ -341,6 +355,74 @@ class TrafficApp(BaseApp):
         print(server_rules)
         self._traffic_controller.start_servers(server_rules)
 
+    @exposed
+    def get_server_connection_stats(self):
+        """
+        Get active, queued and shed connection counts of every running
+        server listener
+        """
+        return self._traffic_controller.get_server_connection_stats()
+
+    @exposed
+    def get_loop_lag(self):
+        """
+        Get latest event loop lag percentiles, in seconds, reported by
+        every traffic worker. Rising lag means a worker is overloaded and
+        its measurements should not be trusted.
+        """
+        return self._loop_lag_recorder.get_reports()
+
+    @exposed
+    def sync_workers(self):
+        """
+        Send missed rule updates to traffic workers whose rules are out of
+        date with the controller
+        :return: uids of server and client workers which were out of date
+        :rtype: dict
+        """
+        return {
+            'servers': self._traffic_controller.sync_workers("server"),
+            'clients': self._traffic_controller.sync_workers("client")}
+
+    @exposed
+    def get_worker_placement(self):
+        """
+        Get number of rules placed on each traffic worker and placement
+        skew, the ratio of the busiest worker's rules to the mean
+        """
+        return {
+            'servers': self._traffic_controller.get_placement("server"),
+            'clients': self._traffic_controller.get_placement("client")}
+
+    @exposed
+    def get_worker_health(self):
+        """
+        Get liveness, last heartbeat and restart count of every traffic
+        worker. Workers found dead or silent are restarted automatically.
+        """
+        return self._traffic_controller.get_worker_health()
+
+    @exposed
+    def autoscale_workers(self):
+        """
+        Resize traffic worker pools now for their rule count, CPU usage
+        and event loop lag, instead of waiting for the periodic check
+        """
+        return {
+            'servers': self._traffic_controller.autoscale("server"),
+            'clients': self._traffic_controller.autoscale("client")}
+
+    @exposed
+    def rebalance_workers(self):
+        """
+        Move rules to the workers owning them on the placement ring
+        :return: number of server and client rules moved
+        :rtype: dict
+        """
+        return {
+            'servers': self._traffic_controller.rebalance("server"),
+            'clients': self._traffic_controller.rebalance("client")}
+
     @exposed
     def stop_servers(self, endpoint=None, port=None, protocol=None):
         """
@@ -419,8 +501,4 @@ if __name__ == "__main__":
     # import time
     # time.sleep(20)
     # app.start_clients()
-<<<<<<< HEAD
-    # time.sleep(120)
-=======
     # time.sleep(120)
->>>>>>> 3f76ed9e2e60b9bfc2b30dba4a9e40472ac91e7e
@@ -4,6 +4,7 @@
 # The full license information can be found in LICENSE.txt
 # in the root directory of this project.
 
+from multiprocessing import cpu_count
 import os
 import platform
 import socket
@@ -18,6 +19,116 @@ utils.setup_logging()
 REQUEST_QUEUE_SIZE = 100
 PACKET_SIZE = 1024
 ALLOW_REUSE_ADDRESS = True
+HTTP_RESPONSE_SIZE = os.environ.get('HTTP_RESPONSE_SIZE', None)
+HTTP_RESPONSE_SIZE = int(HTTP_RESPONSE_SIZE) if HTTP_RESPONSE_SIZE else None
+# Max concurrent connections per listener, 0 means no limit. Connections
+# are only counted unless a limit is set
+SERVER_MAX_CONNECTIONS = int(os.environ.get('SERVER_MAX_CONNECTIONS', 0))
+# What to do with connections above the limit, 'reject' or 'queue'
+SERVER_OVERLOAD_POLICY = os.environ.get('SERVER_OVERLOAD_POLICY', 'reject')
+SERVER_MAX_QUEUED_CONNECTIONS = int(
+    os.environ.get('SERVER_MAX_QUEUED_CONNECTIONS', 1000))
+
+
+# Worker RPC configs
+RPC_CALL_TIMEOUT = float(os.environ.get('RPC_CALL_TIMEOUT', 300))
+# Seconds between checks of worker health
+WORKER_SUPERVISOR_INTERVAL = float(
+    os.environ.get('WORKER_SUPERVISOR_INTERVAL', 5))
+# Seconds without heartbeat after which a worker is restarted
+WORKER_HEARTBEAT_TIMEOUT = float(
+    os.environ.get('WORKER_HEARTBEAT_TIMEOUT', 15))
+# Seconds between heartbeats of server workers
+WORKER_HEARTBEAT_INTERVAL = float(
+    os.environ.get('WORKER_HEARTBEAT_INTERVAL', 5))
+# Seconds a new worker has to send its first heartbeat
+WORKER_STARTUP_GRACE = float(os.environ.get('WORKER_STARTUP_GRACE', 30))
+# Threads per worker running read-only calls, rule updates run in order
+# on a thread of their connection
+RPC_SERVER_THREADS = int(os.environ.get('RPC_SERVER_THREADS', 4))
+# Max connections the controller keeps open to each worker
+RPC_CLIENT_POOL_SIZE = int(os.environ.get('RPC_CLIENT_POOL_SIZE', 4))
+# Send rule lists to workers as columns instead of pickled rule objects
+RPC_COMPACT_RULES = os.environ.get('RPC_COMPACT_RULES', 'True') == 'True'
+
+
+# Traffic rules configs
+# Rules registered per database batch while streaming traffic configs
+RULES_LOAD_CHUNK_SIZE = int(os.environ.get('RULES_LOAD_CHUNK_SIZE', 10000))
+# Rule set updates kept per worker to bring a lagging worker up to date,
+# older workers get all their rules again
+RULE_SET_HISTORY = int(os.environ.get('RULE_SET_HISTORY', 1000))
+# Points per worker on the consistent hash ring placing rules on workers
+CONSISTENT_HASH_REPLICAS = int(os.environ.get('CONSISTENT_HASH_REPLICAS', 160))
+
+
+# Worker autoscaling configs
+WORKER_MIN_COUNT = int(os.environ.get('WORKER_MIN_COUNT', 1))
+WORKER_MAX_COUNT = int(os.environ.get('WORKER_MAX_COUNT', cpu_count() or 1))
+# Rules a single worker is sized for, more rules add workers
+SERVER_RULES_PER_WORKER = int(os.environ.get('SERVER_RULES_PER_WORKER', 500))
+CLIENT_RULES_PER_WORKER = int(os.environ.get('CLIENT_RULES_PER_WORKER', 200))
+# CPU percent of a worker above which a worker is added, and below which
+# for all workers one is removed
+WORKER_CPU_HIGH = float(os.environ.get('WORKER_CPU_HIGH', 80))
+WORKER_CPU_LOW = float(os.environ.get('WORKER_CPU_LOW', 20))
+# p99 event loop lag in seconds of a server worker above which a worker
+# is added
+WORKER_LOOP_LAG_HIGH = float(os.environ.get('WORKER_LOOP_LAG_HIGH', 0.05))
+# Seconds between autoscaling checks, periodic autoscaling moves rules
+# between workers and stops idle ones, so it is off (0) unless enabled
+WORKER_AUTOSCALE_INTERVAL = float(
+    os.environ.get('WORKER_AUTOSCALE_INTERVAL', 0))
+# Idle started workers of each type kept ready to take on rules
+WORKER_WARM_POOL_SIZE = int(os.environ.get('WORKER_WARM_POOL_SIZE', 1))
+# Seconds to wait for a new worker to initialize
+WORKER_READY_TIMEOUT = float(os.environ.get('WORKER_READY_TIMEOUT', 30))
+# Pinning of workers to CPUs, 'none', 'core' or 'numa'
+WORKER_CPU_AFFINITY = os.environ.get('WORKER_CPU_AFFINITY', 'none')
+# CPUs workers may be pinned to, e.g. '2-15', all CPUs if not set
+WORKER_CPUS = os.environ.get('WORKER_CPUS', None)
+
+
+# Exchange configs
+# Message batches waiting for a subscriber before the overflow policy
+# applies
+EXCHANGE_SUBSCRIBER_QUEUE_SIZE = int(
+    os.environ.get('EXCHANGE_SUBSCRIBER_QUEUE_SIZE', 10))
+# 'block', 'drop_oldest' or 'coalesce'
+EXCHANGE_OVERFLOW_POLICY = os.environ.get('EXCHANGE_OVERFLOW_POLICY',
+                                          'drop_oldest')
+# Send traffic counters from workers through a shared memory ring buffer
+# instead of a pickling queue
+EXCHANGE_SHM_TRANSPORT = os.environ.get('EXCHANGE_SHM_TRANSPORT', False)
+EXCHANGE_SHM_TRANSPORT = True if EXCHANGE_SHM_TRANSPORT in [
+    'True', True] else False
+# Counter records the ring buffer holds, and max bytes of counter names
+EXCHANGE_SHM_RECORDS = int(os.environ.get('EXCHANGE_SHM_RECORDS', 65536))
+EXCHANGE_SHM_KEY_SIZE = int(os.environ.get('EXCHANGE_SHM_KEY_SIZE', 128))
+# Directory spooling batches subscribers failed to handle, no spooling
+# if not set
+EXCHANGE_SPOOL_DIR = os.environ.get('EXCHANGE_SPOOL_DIR', None)
+EXCHANGE_SPOOL_SEGMENT_SIZE = int(
+    os.environ.get('EXCHANGE_SPOOL_SEGMENT_SIZE', 8 * 1024 * 1024))
+EXCHANGE_SPOOL_MAX_BYTES = int(
+    os.environ.get('EXCHANGE_SPOOL_MAX_BYTES', 256 * 1024 * 1024))
+# Seconds between replays of spooled batches, doubling from min to max
+# while the subscriber keeps failing
+EXCHANGE_SPOOL_RETRY_MIN = float(
+    os.environ.get('EXCHANGE_SPOOL_RETRY_MIN', 1))
+EXCHANGE_SPOOL_RETRY_MAX = float(
+    os.environ.get('EXCHANGE_SPOOL_RETRY_MAX', 60))
+
+
+# Event loop health configs
+LOOP_LAG_SAMPLE_INTERVAL = float(
+    os.environ.get('LOOP_LAG_SAMPLE_INTERVAL', 0.1))
+LOOP_LAG_REPORT_INTERVAL = int(os.environ.get('LOOP_LAG_REPORT_INTERVAL', 30))
+# Lag in seconds above which a blocked loop is logged, 0 disables logging
+LOOP_SLOW_CALLBACK_THRESHOLD = float(
+    os.environ.get('LOOP_SLOW_CALLBACK_THRESHOLD', 0.1))
+EVENT_LOOP_DEBUG = os.environ.get('EVENT_LOOP_DEBUG', False)
+EVENT_LOOP_DEBUG = True if EVENT_LOOP_DEBUG in ['True', True] else False
 
 
 # Env Configs
@@ -37,9 +148,26 @@ WAVEFRONT_REPORT_PERC = float(os.environ.get('WAVEFRONT_REPORT_PERC', 1.0))
 NAMESPACE_MODE = os.environ.get("NAMESPACE_MODE", False)
 NAMESPACE_MODE = True if NAMESPACE_MODE in ['True', True] else False
 NAMESPACE_INTERFACE_NAME_PREFIXES = ["veth", "eth"]
+# When set, bind listeners of all namespaces from a helper thread and serve
+# them from the shared server worker loops instead of a process per server
+NAMESPACE_SHARED_LISTENERS = os.environ.get(
+    "NAMESPACE_SHARED_LISTENERS", False)
+NAMESPACE_SHARED_LISTENERS = True if NAMESPACE_SHARED_LISTENERS in \
+    ['True', True] else False
+# When set, create client sockets of all namespaces from a helper thread and
+# drive them from the shared client workers instead of a process per namespace
+NAMESPACE_SHARED_CLIENTS = os.environ.get("NAMESPACE_SHARED_CLIENTS", False)
+NAMESPACE_SHARED_CLIENTS = True if NAMESPACE_SHARED_CLIENTS in \
+    ['True', True] else False
 
 
 # Recorder Configs
 RECORDER = os.environ.get('RECORDER', None)
 RECORD_COUNT_UPDATER_SLEEP_INTERVAL = 30
 RECORD_UPDATER_THREAD_POOL_SIZE = 50
+# Durability of SQLite record stores, written in WAL journal mode
+RECORD_STORE_SQLITE_SYNCHRONOUS = os.environ.get(
+    'RECORD_STORE_SQLITE_SYNCHRONOUS', 'NORMAL')
+# Page cache of SQLite record store connections in KiB
+RECORD_STORE_SQLITE_CACHE_KB = int(
+    os.environ.get('RECORD_STORE_SQLITE_CACHE_KB', 64 * 1024))
@@ -50,3 +50,7 @@ class WebFrontException(AxonException):
 
 class ServerOperationException(AxonException):
     message = ('Failed to %(action)s on port %(port)s and protocol %(proto)s')
+
+
+class RPCTimeoutException(AxonException):
+    message = ('RPC call %(method)s timed out after %(timeout)s seconds')
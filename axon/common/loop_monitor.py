@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from collections import deque
+import logging
+from threading import Lock
+import time
+
+
+class LoopLagMonitor(object):
+    """
+    Measures health of an asyncio event loop by scheduling a callback
+    every `interval` seconds and recording how late it actually runs.
+    A late callback means something else held the loop, so samples above
+    `slow_callback_threshold` are logged as slow callbacks.
+
+    asyncio debug mode is only turned on when `debug` is True, as it
+    slows down the whole loop.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, loop, interval=0.1, slow_callback_threshold=None,
+                 debug=False, max_samples=10000):
+        self._loop = loop
+        self._interval = interval
+        self._threshold = slow_callback_threshold
+        self._debug = debug
+        self._samples = deque(maxlen=max_samples)
+        self._lock = Lock()
+        self._slow_callbacks = 0
+        self._handle = None
+        self._running = False
+
+    def start(self):
+        """Start sampling, safe to call from any thread"""
+        self._running = True
+        self._loop.call_soon_threadsafe(self._start)
+
+    def _start(self):
+        if self._debug:
+            self._loop.set_debug(True)
+            if self._threshold:
+                self._loop.slow_callback_duration = self._threshold
+        self._schedule()
+
+    def stop(self):
+        self._running = False
+        if self._handle:
+            self._loop.call_soon_threadsafe(self._handle.cancel)
+
+    def _schedule(self):
+        if not self._running:
+            return
+        expected = self._loop.time() + self._interval
+        self._handle = self._loop.call_at(expected, self._sample, expected)
+
+    def _sample(self, expected):
+        lag = max(0.0, self._loop.time() - expected)
+        slow = self._threshold and lag >= self._threshold
+        with self._lock:
+            self._samples.append(lag)
+            if slow:
+                self._slow_callbacks += 1
+        if slow:
+            self.log.warning("Event loop was blocked for %.3f seconds", lag)
+        self._schedule()
+
+    @staticmethod
+    def _percentile(ordered, percent):
+        index = int(round(percent / 100.0 * (len(ordered) - 1)))
+        return ordered[index]
+
+    def snapshot(self, reset=True):
+        """
+        Get lag percentiles, in seconds, of samples taken since last reset
+        :param reset: whether to clear samples after taking the snapshot
+        :type reset: bool
+        :return: lag statistics
+        :rtype: dict
+        """
+        with self._lock:
+            ordered = sorted(self._samples)
+            slow_callbacks = self._slow_callbacks
+            if reset:
+                self._samples.clear()
+                self._slow_callbacks = 0
+        stats = {'samples': len(ordered), 'slow_callbacks': slow_callbacks,
+                 'time': time.time()}
+        if not ordered:
+            stats.update({'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0})
+            return stats
+        stats.update({
+            'p50': self._percentile(ordered, 50),
+            'p90': self._percentile(ordered, 90),
+            'p99': self._percentile(ordered, 99),
+            'max': ordered[-1]})
+        return stats
@@ -98,4 +98,23 @@ class ExchangeReporter(Reporter):
             count_dict.update({key: count})
             counter.dec(count)
         if count_dict:
-            self._exchange.send(count_dict)
\ No newline at end of file
+            self._exchange.send(count_dict)
+
+
+class LoopLagReporter(Reporter):
+    """
+    Periodically publishes event loop lag percentiles of a worker,
+    measured by a LoopLagMonitor, to an exchange.
+    """
+
+    def __init__(self, monitor, exchange, worker_uid, worker_type,
+                 reporting_interval=30):
+        self._exchange = exchange
+        self._uid = worker_uid
+        self._worker_type = worker_type
+        super().__init__(monitor, reporting_interval)
+
+    def report(self, monitor):
+        stats = monitor.snapshot()
+        stats.update({'worker': self._uid, 'type': self._worker_type})
+        self._exchange.send(stats)
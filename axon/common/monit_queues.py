@@ -1,12 +1,24 @@
-from collections import defaultdict
+import atexit
+from collections import deque
 from contextlib import contextmanager
+import heapq
+import itertools
+import logging
+import math
 from multiprocessing import Queue
 import os
 import selectors
 import socket
-from threading import Event, Thread
+from threading import Condition, Event, Lock, Thread
 import time
 
+from axon.common.config import EXCHANGE_OVERFLOW_POLICY, \
+    EXCHANGE_SPOOL_DIR, EXCHANGE_SPOOL_RETRY_MAX, EXCHANGE_SPOOL_RETRY_MIN, \
+    EXCHANGE_SUBSCRIBER_QUEUE_SIZE
+from axon.common.shm_ring import SharedCounterRing
+from axon.common.spool import DiskSpool
+
+log = logging.getLogger(__name__)
 
 if hasattr(selectors, 'PollSelector'):
     _QueuePoller = selectors.PollSelector
@@ -17,14 +29,218 @@ else:
 _exchanges = {}
 
 
+def next_boundary(now, interval):
+    """First multiple of interval after now, flushes align on these"""
+    return (math.floor(now / interval) + 1) * interval
+
+
+class SubscriberDispatcher(Thread):
+    """
+    Delivers message batches of an exchange to one subscriber from a
+    dedicated thread. At most `queue_size` batches wait for delivery,
+    when the queue is full the overflow policy decides:
+
+      block - wait until the subscriber takes a batch, this also holds
+              back every other exchange
+      drop_oldest - drop the oldest waiting batch
+      coalesce - merge the batch into the newest waiting one using the
+                 subscriber's coalesce method
+
+    With a DiskSpool, batches the subscriber fails to handle are spooled
+    and replayed in order once the subscriber recovers, retrying with
+    exponential backoff. While batches are spooled new ones are spooled
+    behind them.
+    """
+    POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+    def __init__(self, subscriber, queue_size=EXCHANGE_SUBSCRIBER_QUEUE_SIZE,
+                 overflow_policy=EXCHANGE_OVERFLOW_POLICY, spool=None,
+                 retry_min=EXCHANGE_SPOOL_RETRY_MIN,
+                 retry_max=EXCHANGE_SPOOL_RETRY_MAX):
+        super().__init__()
+        if overflow_policy not in self.POLICIES:
+            raise ValueError("Unknown overflow policy %s" % overflow_policy)
+        self.daemon = True
+        self._subscriber = subscriber
+        self._queue_size = max(1, queue_size)
+        self._policy = overflow_policy
+        self._batches = deque()
+        self._condition = Condition()
+        self._stopped = False
+        self._stats = {'delivered': 0, 'dropped': 0, 'coalesced': 0,
+                       'failed': 0, 'spooled': 0, 'replayed': 0}
+        self._spool = spool
+        self._retry_min = retry_min
+        self._retry_max = retry_max
+        self._backoff = retry_min
+        self._retry_at = 0
+
+    def put(self, messages, timestamp=None):
+        """
+        Queue a batch of messages for delivery
+        :param timestamp: time the batch was flushed, now by default
+        :type timestamp: float
+        """
+        if not messages:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._condition:
+            if self._policy == 'block':
+                while len(self._batches) >= self._queue_size and \
+                        not self._stopped:
+                    self._condition.wait()
+            if self._stopped:
+                return
+            if len(self._batches) < self._queue_size:
+                self._batches.append((timestamp, messages))
+            elif self._policy == 'drop_oldest':
+                self._stats['dropped'] += len(self._batches.popleft()[1])
+                self._batches.append((timestamp, messages))
+            else:
+                pending = self._batches[-1][1] + messages
+                merged = self._subscriber.coalesce(pending)
+                self._stats['coalesced'] += len(pending) - len(merged)
+                # Merged batch is as recent as its newest part
+                self._batches[-1] = (timestamp, merged)
+            self._condition.notify_all()
+
+    def _replay_wait(self):
+        """Seconds until spooled batches are due, None if none are"""
+        if self._spool is None or not self._spool.pending():
+            return None
+        return max(0, self._retry_at - time.time())
+
+    def _retry_later(self):
+        self._retry_at = time.time() + self._backoff
+        self._backoff = min(self._backoff * 2, self._retry_max)
+
+    def _deliver(self, timestamp, messages):
+        if self._spool is not None and self._spool.pending():
+            # Keep order behind batches waiting for replay
+            self._spool.append((timestamp, messages))
+            self._stats['spooled'] += len(messages)
+            return
+        try:
+            self._subscriber.handle(messages, timestamp)
+            self._stats['delivered'] += len(messages)
+        except Exception:
+            if self._spool is None:
+                self._stats['failed'] += len(messages)
+                log.exception("Subscriber %s failed to handle %d messages",
+                              self._subscriber, len(messages))
+                return
+            log.warning("Subscriber %s failed to handle %d messages, "
+                        "spooling them", self._subscriber, len(messages),
+                        exc_info=True)
+            self._spool.append((timestamp, messages))
+            self._stats['spooled'] += len(messages)
+            self._retry_later()
+
+    def _replay(self):
+        """Deliver spooled batches until spool is empty or a batch fails"""
+        if self._spool is None or time.time() < self._retry_at:
+            return
+        while not self._batches:
+            batch = self._spool.peek()
+            if batch is None:
+                self._backoff = self._retry_min
+                return
+            # Replayed with the time it was flushed, not the time now
+            timestamp, messages = batch
+            try:
+                self._subscriber.handle(messages, timestamp)
+            except Exception:
+                log.warning("Subscriber %s still failing, retrying in %s "
+                            "seconds", self._subscriber, self._backoff)
+                self._retry_later()
+                return
+            self._spool.commit()
+            self._stats['replayed'] += len(messages)
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._batches and not self._stopped:
+                    wait = self._replay_wait()
+                    if wait == 0:
+                        break
+                    self._condition.wait(wait)
+                if self._stopped and not self._batches:
+                    break
+                batch = self._batches.popleft() if self._batches \
+                    else None
+                self._condition.notify_all()
+            if batch:
+                self._deliver(*batch)
+            self._replay()
+        if self._spool is not None:
+            self._spool.close()
+
+    def stop(self):
+        """Stop after delivering waiting batches"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        Get message counts, messages dropped on overflow or merged away by
+        coalescing, and waiting batches
+        :rtype: dict
+        """
+        with self._condition:
+            stats = dict(self._stats, queued=len(self._batches))
+        if self._spool is not None:
+            stats['spool'] = self._spool.stats()
+        return stats
+
+
+def merge_counters(total, message):
+    """
+    Merge a message into an aggregate in place. Numbers are summed, dicts,
+    e.g. histogram buckets, are merged recursively and any other value is
+    replaced by the latest one.
+    :param total: aggregate of previous messages
+    :type total: dict
+    :param message: message to add
+    :type message: dict
+    """
+    for key, value in message.items():
+        if isinstance(value, dict):
+            merge_counters(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and \
+                not isinstance(value, bool) and \
+                isinstance(total.get(key), (int, float)):
+            total[key] += value
+        else:
+            total[key] = value
+
+
 class Exchange(object):
     """
-    Exchange based on multiprocessing queue
+    Exchange based on multiprocessing queue. Messages are buffered once
+    for all subscribers sharing a `buffer_interval` and flushed to them
+    every interval by the timer of the ExchangeManager, or on every
+    message if the interval is 0. A subscriber attached mid interval
+    also gets messages buffered earlier in that interval.
+
+    With an aggregator, e.g. merge_counters, buffered messages are merged
+    into a single snapshot as they arrive, and subscribers get one
+    message per flush. Subscribers share the flushed messages and must
+    not modify them.
+
+    With a SharedCounterRing, counter messages, dicts of integers, sent
+    from forked processes are written to shared memory and read back
+    as one summed message per poll. Other messages use the queue.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, manager=None, aggregator=None, ring=None):
         self._queue = Queue()
         self._name = name
+        self._manager = manager
+        self._aggregator = aggregator
+        self._ring = ring
+        self._lock = Lock()
         if os.name == 'posix':
             self._putsocket, self._getsocket = socket.socketpair()
         else:
@@ -36,48 +252,191 @@ class Exchange(object):
             self._putsocket.connect(server.getsockname())
             self._getsocket, _ = server.accept()
             server.close()
-        self._subscribers = defaultdict(
-            lambda: {
-                'queue': list(),
-                'buffer_interval': 0,
-                'next_fire_time': 0})
-
-    def _send(self):
-        current_time = int(time.time())
-        for subscriber, details in self._subscribers.items():
-            print(current_time, " ", details['next_fire_time'])
-            if current_time >= details['next_fire_time']:
-                details['next_fire_time'] = (
-                        current_time + details['buffer_interval'])
-                messages = details['queue']
-                sending_thread = Thread(target=subscriber.handle,
-                                        args=(messages,))
-                sending_thread.daemon = True
-                sending_thread.start()
-                details['queue'] = list()
+        self._subscribers = {}
+        # Buffer and dispatchers of subscribers by buffer interval
+        self._groups = {}
+        self._spool_ids = set()
+
+    def _new_buffer(self):
+        return {} if self._aggregator else []
+
+    def _flush(self, group):
+        with self._lock:
+            messages = group['buffer']
+            group['buffer'] = self._new_buffer()
+            dispatchers = list(group['dispatchers'].values())
+        if self._aggregator:
+            messages = [messages] if messages else []
+        timestamp = time.time()
+        for dispatcher in dispatchers:
+            dispatcher.put(messages, timestamp)
+
+    def flush(self, task):
+        """Hand messages buffered for a subscriber to its dispatcher"""
+        details = self._subscribers.get(task)
+        if details:
+            self.poll()
+            self._flush(details['group'])
+
+    def poll(self):
+        """Receive counters written to the shared memory ring"""
+        if self._ring is not None:
+            counters = self._ring.read()
+            if counters:
+                self._add_message(counters)
+
+    def is_attached(self, task, details):
+        return self._subscribers.get(task) is details
 
     def _recieve(self):
         self._getsocket.recv(1)
-        message = self._queue.get()
-        for subscriber, details in self._subscribers.items():
-            details['queue'].append(message)
-        # TODO Change this into scheduling
-        self._send()
+        self._add_message(self._queue.get())
+
+    def _add_message(self, message):
+        with self._lock:
+            for group in self._groups.values():
+                if self._aggregator:
+                    self._aggregator(group['buffer'], message)
+                else:
+                    group['buffer'].append(message)
+            unbuffered = self._groups.get(0)
+        if unbuffered:
+            self._flush(unbuffered)
+
+    def _drain(self):
+        """Receive all messages sent so far without blocking"""
+        self.poll()
+        self._getsocket.setblocking(False)
+        try:
+            while True:
+                try:
+                    signals = self._getsocket.recv(4096)
+                except (BlockingIOError, InterruptedError):
+                    return
+                if not signals:
+                    return
+                for _ in signals:
+                    self._add_message(self._queue.get())
+        finally:
+            self._getsocket.setblocking(True)
 
     def fileno(self):
         return self._getsocket.fileno()
 
     def send(self, item):
+        if self._ring is not None and isinstance(item, dict) and \
+                self._ring.write(item):
+            return
         self._queue.put(item)
         self._putsocket.send(b'x')
 
-    def attach(self, task, buffer_interval=30):
-        self._subscribers[task]['buffer_interval'] = buffer_interval
-        self._subscribers[task]['next_fire_time'] = \
-            (int(time.time()) + buffer_interval)
+    def _reserve_spool_id(self, task, spool_id):
+        """Pick a spool id no other subscriber of the exchange has"""
+        if spool_id is None:
+            name = type(task).__name__
+            spool_id = name
+            for number in itertools.count(1):
+                if spool_id not in self._spool_ids:
+                    break
+                spool_id = '%s-%d' % (name, number)
+        elif spool_id in self._spool_ids:
+            raise ValueError("Spool id %s is used by another subscriber of "
+                             "exchange %s" % (spool_id, self.name))
+        self._spool_ids.add(spool_id)
+        return spool_id
+
+    def attach(self, task, buffer_interval=30,
+               queue_size=EXCHANGE_SUBSCRIBER_QUEUE_SIZE,
+               overflow_policy=EXCHANGE_OVERFLOW_POLICY,
+               spool_dir=EXCHANGE_SPOOL_DIR, spool_id=None):
+        """
+        Attach a subscriber
+        :param spool_dir: directory spooling batches the subscriber fails
+            to handle, in a sub directory per exchange and subscriber,
+            None disables spooling
+        :type spool_dir: str
+        :param spool_id: name of the spool sub directory of the subscriber,
+            unique within the exchange. By default the subscriber class
+            name, numbered in order of attach if the exchange has several
+            subscribers of the class
+        :type spool_id: str
+        """
+        if task in self._subscribers:
+            self.detach(task)
+        with self._lock:
+            spool_id = self._reserve_spool_id(task, spool_id)
+        spool = None
+        if spool_dir:
+            try:
+                spool = DiskSpool(os.path.join(spool_dir, self.name,
+                                               spool_id))
+            except Exception:
+                with self._lock:
+                    self._spool_ids.discard(spool_id)
+                raise
+        dispatcher = SubscriberDispatcher(task, queue_size, overflow_policy,
+                                          spool)
+        dispatcher.start()
+        with self._lock:
+            group = self._groups.setdefault(
+                buffer_interval,
+                {'buffer': self._new_buffer(), 'dispatchers': {}})
+            group['dispatchers'][task] = dispatcher
+            details = {'buffer_interval': buffer_interval,
+                       'dispatcher': dispatcher, 'group': group,
+                       'spool_id': spool_id}
+            self._subscribers[task] = details
+        if buffer_interval and self._manager:
+            self._manager.schedule(self, task, details)
 
     def detach(self, task):
-        del self._subscribers[task]
+        """
+        Detach a subscriber, messages buffered for it are still delivered
+        :return: dispatcher of the subscriber, it stops once done
+        :rtype: SubscriberDispatcher
+        """
+        with self._lock:
+            details = self._subscribers.pop(task)
+        group = details['group']
+        self._flush(group)
+        with self._lock:
+            del group['dispatchers'][task]
+            if not group['dispatchers']:
+                del self._groups[details['buffer_interval']]
+            self._spool_ids.discard(details['spool_id'])
+        details['dispatcher'].stop()
+        return details['dispatcher']
+
+    def close(self, timeout=None):
+        """
+        Receive pending messages, flush them to all subscribers and wait
+        up to timeout for subscribers to handle them
+        """
+        self._drain()
+        dispatchers = [self.detach(task) for task in list(self._subscribers)]
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+        deadline = None if timeout is None else time.time() + timeout
+        for dispatcher in dispatchers:
+            dispatcher.join(None if deadline is None else
+                            max(0, deadline - time.time()))
+
+    def get_stats(self):
+        """
+        Get delivery counters of every subscriber
+        :rtype: dict
+        """
+        return {str(task): details['dispatcher'].stats()
+                for task, details in list(self._subscribers.items())}
+
+    def get_ring_stats(self):
+        """
+        Get records written, read and dropped by the shared memory ring
+        :return: stats, None if exchange has no ring
+        :rtype: dict
+        """
+        return self._ring.stats() if self._ring is not None else None
 
     @contextmanager
     def subscribe(self, task):
@@ -99,31 +458,113 @@ class Exchange(object):
 
 
 class ExchangeManager(Thread):
+    """
+    Receives messages of all exchanges and flushes subscribers on their
+    buffer interval boundaries, using a single heap of next flush times
+    """
+
     def __init__(self):
         super().__init__()
         self.daemon = True
         self._poller = _QueuePoller()
         self._stopped = Event()
         self._registered_queues = {}
+        self._schedule = []
+        self._schedule_lock = Lock()
+        self._sequence = itertools.count()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._poller.register(self._wakeup_reader, selectors.EVENT_READ,
+                              'wakeup')
+
+    def _wakeup(self):
+        try:
+            self._wakeup_writer.send(b'x')
+        except OSError:
+            pass
+
+    def schedule(self, exchange, task, details):
+        """Flush a subscriber on every boundary of its buffer interval"""
+        fire_time = next_boundary(time.time(), details['buffer_interval'])
+        with self._schedule_lock:
+            heapq.heappush(self._schedule, (
+                fire_time, next(self._sequence), exchange, task, details))
+        # Poller may be waiting past the new flush time
+        self._wakeup()
+
+    def _next_timeout(self):
+        with self._schedule_lock:
+            if not self._schedule:
+                return .5
+            return min(.5, max(0, self._schedule[0][0] - time.time()))
+
+    def _flush_due(self):
+        now = time.time()
+        due = []
+        with self._schedule_lock:
+            while self._schedule and self._schedule[0][0] <= now:
+                entry = heapq.heappop(self._schedule)
+                fire_time, _, exchange, task, details = entry
+                if not exchange.is_attached(task, details):
+                    continue
+                due.append((exchange, task))
+                interval = details['buffer_interval']
+                fire_time += interval
+                if fire_time <= now:
+                    # Flushes missed while busy are not caught up
+                    fire_time = next_boundary(now, interval)
+                heapq.heappush(self._schedule, (
+                    fire_time, next(self._sequence), exchange, task,
+                    details))
+        for exchange, task in due:
+            exchange.flush(task)
 
     def _handle_read_queus(self, ready_queues):
         for selector_key, event in ready_queues:
-            selector_key.fileobj._recieve()
+            if selector_key.data == 'wakeup':
+                try:
+                    self._wakeup_reader.recv(4096)
+                except (BlockingIOError, InterruptedError):
+                    pass
+            else:
+                selector_key.fileobj._recieve()
 
     def run(self):
-        try:
-            while not self._stopped.is_set():
-                ready_queues = self._poller.select(.5)
+        while not self._stopped.is_set():
+            try:
+                ready_queues = self._poller.select(self._next_timeout())
                 if self._stopped.is_set():
                     break
                 if ready_queues:
                     self._handle_read_queus(ready_queues)
-        except Exception as ex:
-            print(ex)
+                for exchange in list(_exchanges.values()):
+                    exchange.poll()
+                self._flush_due()
+            except Exception:
+                log.exception("Exchange manager failed")
+
+    def stop(self, timeout=5):
+        """
+        Stop receiving, and deliver messages buffered in all exchanges
+        waiting up to timeout for subscribers
+        """
+        self._stopped.set()
+        self._wakeup()
+        if self.is_alive():
+            self.join(timeout)
+        for exchange in list(_exchanges.values()):
+            exchange.close(timeout)
 
-    def create_exchange(self, name):
+    def create_exchange(self, name, aggregator=None, shm_transport=False):
         if name not in _exchanges:
-            queue = Exchange(name)
+            ring = None
+            if shm_transport:
+                if SharedCounterRing.available():
+                    ring = SharedCounterRing()
+                else:
+                    log.warning("Shared memory is not supported, exchange "
+                                "%s uses a queue", name)
+            queue = Exchange(name, self, aggregator, ring)
             self._poller.register(queue, selectors.EVENT_READ)
             _exchanges[name] = queue
             return queue
@@ -135,17 +576,20 @@ class ExchangeManager(Thread):
             queue = _exchanges[name]
             self._poller.unregister(queue)
             del _exchanges[name]
+            queue.close(timeout=0)
         except KeyError:
             print("Queue not registered with poller")
 
 
 exchng_mngr = ExchangeManager()
 exchng_mngr.start()
+# Last interval of messages is delivered on exit
+atexit.register(exchng_mngr.stop)
 
 
-def get_exchange(name):
+def get_exchange(name, aggregator=None, shm_transport=False):
     if name not in _exchanges:
-        return exchng_mngr.create_exchange(name)
+        return exchng_mngr.create_exchange(name, aggregator, shm_transport)
     return _exchanges[name]
 
 
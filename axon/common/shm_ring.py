@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+import multiprocessing
+import os
+import struct
+import threading
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+from axon.common.config import EXCHANGE_SHM_KEY_SIZE, EXCHANGE_SHM_RECORDS
+
+
+class SharedCounterRing(object):
+    """
+    Ring buffer of counter records in shared memory. Processes forked
+    after the ring is created write counters to it, the creating process
+    reads them, without pickling or a syscall per message.
+
+    Every record has a fixed layout, a key of `key_size` utf-8 bytes and
+    a signed 64 bit value. The header holds total records written, total
+    records read and records dropped because the ring was full. Writers
+    serialize on a process shared lock, there must be a single reader.
+    """
+    HEADER = struct.Struct('<QQQ')
+    # Records start on their own cache line
+    HEADER_SIZE = 64
+
+    def __init__(self, capacity=EXCHANGE_SHM_RECORDS,
+                 key_size=EXCHANGE_SHM_KEY_SIZE):
+        if shared_memory is None:
+            raise RuntimeError("Shared memory is not supported")
+        self._capacity = capacity
+        self._key_size = key_size
+        self._record = struct.Struct('<%dsq' % key_size)
+        # Structs packing runs of consecutive records by run length
+        self._runs = {}
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self.HEADER_SIZE + capacity * self._record.size)
+        self._buf = self._shm.buf
+        self.HEADER.pack_into(self._buf, 0, 0, 0, 0)
+        self._write_lock = multiprocessing.Lock()
+        self._read_lock = threading.Lock()
+        self._owner = os.getpid()
+
+    @staticmethod
+    def available():
+        return shared_memory is not None
+
+    def _offset(self, index):
+        return self.HEADER_SIZE + (index % self._capacity) * self._record.size
+
+    def _run(self, count):
+        run = self._runs.get(count)
+        if run is None:
+            run = struct.Struct('<' + '%dsq' % self._key_size * count)
+            self._runs[count] = run
+        return run
+
+    def _segments(self, start, count):
+        """Split records start..start+count at the end of the ring"""
+        first = min(count, self._capacity - start % self._capacity)
+        segments = [(start, first)]
+        if first < count:
+            segments.append((start + first, count - first))
+        return segments
+
+    def write(self, counters):
+        """
+        Write counters as records, all or none of them. Counters which
+        do not fit the ring are counted as dropped.
+        :param counters: counter values by name
+        :type counters: dict
+        :return: False if counters can not be written as records, e.g.
+            not integer values or too long names
+        :rtype: bool
+        """
+        records = []
+        for key, value in counters.items():
+            if not isinstance(key, str) or type(value) is not int:
+                return False
+            key = key.encode()
+            if len(key) > self._key_size:
+                return False
+            records.append(key)
+            records.append(value)
+        count = len(counters)
+        if not count:
+            return True
+        with self._write_lock:
+            written, read, dropped = self.HEADER.unpack_from(self._buf, 0)
+            if self._capacity - (written - read) < count:
+                self.HEADER.pack_into(self._buf, 0, written, read,
+                                      dropped + count)
+                return True
+            packed = 0
+            for start, length in self._segments(written, count):
+                self._run(length).pack_into(
+                    self._buf, self._offset(start),
+                    *records[packed * 2:(packed + length) * 2])
+                packed += length
+            # Records become visible to the reader only now
+            self.HEADER.pack_into(self._buf, 0, written + count, read,
+                                  dropped)
+        return True
+
+    def read(self):
+        """
+        Take all records written so far
+        :return: counters summed by name
+        :rtype: dict
+        """
+        with self._read_lock:
+            with self._write_lock:
+                written, read, _ = self.HEADER.unpack_from(self._buf, 0)
+            counters = {}
+            # Writers never touch records between read and written
+            for start, length in self._segments(read, written - read):
+                offset = self._offset(start)
+                records = self._buf[
+                    offset:offset + length * self._record.size]
+                for key, value in self._record.iter_unpack(records):
+                    counters[key] = counters.get(key, 0) + value
+                records.release()
+            counters = {key.rstrip(b'\0').decode(): value
+                        for key, value in counters.items()}
+            with self._write_lock:
+                current, _, dropped = self.HEADER.unpack_from(self._buf, 0)
+                self.HEADER.pack_into(self._buf, 0, current, written,
+                                      dropped)
+            return counters
+
+    def stats(self):
+        with self._write_lock:
+            written, read, dropped = self.HEADER.unpack_from(self._buf, 0)
+        return {'written': written, 'read': read, 'dropped': dropped,
+                'capacity': self._capacity}
+
+    def close(self):
+        """Release shared memory, it is removed by the creating process"""
+        self._buf = None
+        self._shm.close()
+        if os.getpid() == self._owner:
+            self._shm.unlink()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+import logging
+import mmap
+import os
+import pickle
+import struct
+from threading import Lock
+import zlib
+
+from axon.common.config import EXCHANGE_SPOOL_MAX_BYTES, \
+    EXCHANGE_SPOOL_SEGMENT_SIZE
+
+SEGMENT_SUFFIX = '.seg'
+
+
+class DiskSpool(object):
+    """
+    Durable FIFO of message batches on disk, kept while a subscriber's
+    sink is unavailable.
+
+    Batches are appended to segment files, each record is a length and a
+    crc32 header followed by the pickled batch. A new segment is started
+    once the current one reaches `segment_size` and, if the spool grows
+    beyond `max_bytes`, oldest segments are dropped. Segments are read
+    through mmap, the position of the next unread batch is kept in a
+    cursor file, so a restarted process goes on where it stopped.
+    Consumed segments are deleted.
+    """
+    RECORD = struct.Struct('<II')
+    log = logging.getLogger(__name__)
+
+    def __init__(self, path, segment_size=EXCHANGE_SPOOL_SEGMENT_SIZE,
+                 max_bytes=EXCHANGE_SPOOL_MAX_BYTES):
+        self._path = path
+        self._segment_size = segment_size
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+        self._writer = None
+        self._map = None
+        self._map_segment = None
+        self._next_offset = None
+        self.dropped = 0
+        os.makedirs(path, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(path)
+            if name.endswith(SEGMENT_SUFFIX))
+        self._read_segment, self._read_offset = self._load_cursor()
+        for segment in [segment for segment in self._segments
+                        if segment < self._read_segment]:
+            self._remove_segment(segment)
+        if self._segments:
+            self._truncate_torn_tail(self._segments[-1])
+
+    def _segment_path(self, segment):
+        return os.path.join(self._path, '%010d%s' % (segment, SEGMENT_SUFFIX))
+
+    @property
+    def _cursor_path(self):
+        return os.path.join(self._path, 'cursor')
+
+    def _load_cursor(self):
+        try:
+            with open(self._cursor_path) as cursor:
+                segment, offset = cursor.read().split()
+                return int(segment), int(offset)
+        except (IOError, ValueError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self):
+        tmp_path = self._cursor_path + '.tmp'
+        with open(tmp_path, 'w') as cursor:
+            cursor.write('%d %d' % (self._read_segment, self._read_offset))
+        os.replace(tmp_path, self._cursor_path)
+
+    def _records(self, data, offset=0):
+        """Yield (offset, end) of valid records in data from offset"""
+        while offset + self.RECORD.size <= len(data):
+            length, crc = self.RECORD.unpack_from(data, offset)
+            end = offset + self.RECORD.size + length
+            if end > len(data) or \
+                    zlib.crc32(data[offset + self.RECORD.size:end]) != crc:
+                return
+            yield offset, end
+            offset = end
+
+    def _truncate_torn_tail(self, segment):
+        """Cut a record left incomplete by a crash, appends follow it"""
+        path = self._segment_path(segment)
+        with open(path, 'rb') as segment_file:
+            data = segment_file.read()
+        valid = 0
+        for _, valid in self._records(data):
+            pass
+        if valid < len(data):
+            self.log.warning("Truncating %d torn bytes of spool segment %s",
+                             len(data) - valid, path)
+            with open(path, 'r+b') as segment_file:
+                segment_file.truncate(valid)
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+        self._map = None
+        self._map_segment = None
+
+    def _remove_segment(self, segment):
+        if segment == self._map_segment:
+            self._close_map()
+        if self._writer is not None and segment == self._segments[-1]:
+            self._writer.close()
+            self._writer = None
+        try:
+            os.remove(self._segment_path(segment))
+        except OSError:
+            pass
+        self._segments.remove(segment)
+
+    def _size(self):
+        return sum(os.path.getsize(self._segment_path(segment))
+                   for segment in self._segments)
+
+    def _enforce_cap(self):
+        while len(self._segments) > 1 and self._size() > self._max_bytes:
+            segment = self._segments[0]
+            with open(self._segment_path(segment), 'rb') as segment_file:
+                data = segment_file.read()
+            start = self._read_offset if segment == self._read_segment \
+                else 0
+            dropped = sum(1 for _ in self._records(data, start))
+            self.dropped += dropped
+            self.log.warning("Spool %s is full, dropped %d batches",
+                             self._path, dropped)
+            self._remove_segment(segment)
+            if segment == self._read_segment:
+                self._read_segment = self._segments[0]
+                self._read_offset = 0
+                self._save_cursor()
+
+    def append(self, messages):
+        """Append a batch of messages"""
+        payload = pickle.dumps(messages, pickle.HIGHEST_PROTOCOL)
+        record = self.RECORD.pack(len(payload), zlib.crc32(payload)) + \
+            payload
+        with self._lock:
+            if self._segments:
+                active = self._segments[-1]
+                size = os.path.getsize(self._segment_path(active))
+                if size and size + len(record) > self._segment_size:
+                    if self._writer is not None:
+                        self._writer.close()
+                        self._writer = None
+                    self._segments.append(active + 1)
+            else:
+                self._segments.append(self._read_segment)
+                self._read_offset = 0
+            if self._writer is None:
+                self._writer = open(
+                    self._segment_path(self._segments[-1]), 'ab')
+            self._writer.write(record)
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._enforce_cap()
+
+    def peek(self):
+        """
+        Get the oldest unread batch, it stays unread until committed
+        :return: messages, None if spool is empty
+        :rtype: list
+        """
+        with self._lock:
+            while self._segments:
+                if self._read_segment not in self._segments:
+                    self._read_segment = self._segments[0]
+                    self._read_offset = 0
+                segment = self._read_segment
+                size = os.path.getsize(self._segment_path(segment))
+                if self._map_segment != segment or len(self._map) < size:
+                    self._close_map()
+                    if size:
+                        with open(self._segment_path(segment),
+                                  'rb') as segment_file:
+                            self._map = mmap.mmap(segment_file.fileno(), 0,
+                                                  access=mmap.ACCESS_READ)
+                        self._map_segment = segment
+                for start, end in self._records(
+                        self._map or b'', self._read_offset):
+                    self._next_offset = end
+                    return pickle.loads(
+                        self._map[start + self.RECORD.size:end])
+                if self._read_offset < size:
+                    self.log.warning("Skipping corrupt end of spool segment"
+                                     " %s", self._segment_path(segment))
+                last = segment == self._segments[-1]
+                self._remove_segment(segment)
+                if last:
+                    # Spool is empty
+                    if os.path.exists(self._cursor_path):
+                        os.remove(self._cursor_path)
+                    self._read_segment = segment + 1
+                    self._read_offset = 0
+                    return None
+            return None
+
+    def commit(self):
+        """Mark batch returned by last peek as delivered"""
+        with self._lock:
+            if self._next_offset is not None:
+                self._read_offset = self._next_offset
+                self._next_offset = None
+                self._save_cursor()
+
+    def pending(self):
+        """Whether there are unread batches"""
+        with self._lock:
+            if not self._segments:
+                return False
+            if self._read_segment != self._segments[-1]:
+                return True
+            return self._read_offset < os.path.getsize(
+                self._segment_path(self._segments[-1]))
+
+    def stats(self):
+        with self._lock:
+            return {'segments': len(self._segments), 'bytes': self._size(),
+                    'dropped': self.dropped}
+
+    def close(self):
+        with self._lock:
+            self._close_map()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -1,40 +1,97 @@
 import abc
 from collections import defaultdict
+import logging
 import time
 
 from wavefront_sdk import WavefrontDirectClient, WavefrontProxyClient
 from wavefront_sdk.common import metric_to_line_data
 
+from axon.common.monit_queues import merge_counters
 from axon.traffic.traffic_objects import TrafficRecord
 
+log = logging.getLogger(__name__)
+
 
 class ExchangeSubscriber(abc.ABC):
 
     @abc.abstractmethod
-    def handle(self, messages):
+    def handle(self, messages, timestamp=None):
+        """
+        Handle a batch of messages
+        :param timestamp: time the batch was flushed by the exchange, it is
+            older than now if the batch was replayed from a spool
+        :type timestamp: float
+        """
         pass
 
+    def coalesce(self, messages):
+        """
+        Merge waiting messages when the subscriber falls behind, the
+        result is handled instead of messages
+        :rtype: list
+        """
+        return messages
+
+
+def sum_counters(messages):
+    """Merge traffic count messages into one, summing counts"""
+    total = {}
+    for message in messages:
+        merge_counters(total, message)
+    return [total] if total else []
+
 
 class SQLRecorder(ExchangeSubscriber):
 
     def __init__(self, record_store):
         self._record_store = record_store
 
-    def handle(self, messages):
-        traffic_records_map = {}
+    def handle(self, messages, timestamp=None):
+        # (source, destination, port, protocol, connected) -> counts
+        counts = {}
         for message in messages:
             for metric, value in message.items():
-                success = TrafficRecord.is_success(metric)
-                record = TrafficRecord.from_metric(metric)
-                record = traffic_records_map.get(str(record), record)
-                if success:
-                    record.success_count = value
-                else:
-                    record.failure_count = value
-                traffic_records_map[str(record)] = record
-        records = list(traffic_records_map.values())
-        print(int(time.time()), " ", records)
-        self._record_store.add_records_batch(records)
+                key, _, result = metric.rpartition(':')
+                record = counts.get(key)
+                if record is None:
+                    record = counts[key] = [0, 0]
+                record[0 if result == 'success' else 1] = value
+        rows = []
+        for key, (success_count, failure_count) in counts.items():
+            source, destination, port, protocol, connected = key.split(':')
+            rows.append((source, destination, int(port), protocol,
+                         connected == 'True', success_count, failure_count))
+        log.debug("Recording %d traffic records", len(rows))
+        self._record_store.add_records_bulk(rows, created=timestamp)
+
+    def coalesce(self, messages):
+        return sum_counters(messages)
+
+
+class LoopLagRecorder(ExchangeSubscriber):
+    """
+    Keeps latest event loop lag report of every worker in memory
+    """
+
+    def __init__(self):
+        self._reports = {}
+
+    def handle(self, messages, timestamp=None):
+        for message in messages:
+            self._reports[message['worker']] = message
+
+    def coalesce(self, messages):
+        # Only the latest report of each worker is kept anyway
+        latest = {}
+        for message in messages:
+            latest[message['worker']] = message
+        return list(latest.values())
+
+    def get_reports(self):
+        return list(self._reports.values())
+
+    def remove(self, worker_uid):
+        self._reports.pop(worker_uid, None)
 
 
 class WavefrontRecorder(ExchangeSubscriber):
@@ -47,13 +104,16 @@ class WavefrontRecorder(ExchangeSubscriber):
     def reconnect(self):
         self._client = None
 
-    def handle(self, messages):
+    def coalesce(self, messages):
+        return sum_counters(messages)
+
+    def handle(self, messages, timestamp=None):
         metrics = []
         total_success = 0
         total_failure = 0
         protocol_success = defaultdict(int)
         protocol_failure = defaultdict(int)
-        create_time = time.time()
+        create_time = time.time() if timestamp is None else timestamp
         for message in messages:
             for metric, value in message.items():
                 success = TrafficRecord.is_success(metric)
@@ -119,7 +179,7 @@ class WavefrontRecorder(ExchangeSubscriber):
                                     timestamp=int(create_time),
                                     source=self.source, tags=self.tags,
                                     default_source=self.source))
-        print(int(time.time()), " ", metrics)
+        log.debug("Sending %d metrics to wavefront", len(metrics))
         self.client.send_metric_now(metrics)
 
 
@@ -137,8 +197,8 @@ class WavefrontProxyRecorder(WavefrontRecorder):
                 distribution_port=None, tracing_port=None)
         return self._client
 
-    def handle(self, messages):
-        super().handle(messages)
+    def handle(self, messages, timestamp=None):
+        super().handle(messages, timestamp)
 
 
 class WavefrontDirectRecorder(WavefrontRecorder):
@@ -155,6 +215,6 @@ class WavefrontDirectRecorder(WavefrontRecorder):
                 self.server, self.token, batch_size=10000)
         return self._client
 
-    def handle(self, messages):
-        super().handle(messages)
+    def handle(self, messages, timestamp=None):
+        super().handle(messages, timestamp)
         self._client.flush_now()
\ No newline at end of file
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import asyncio
+import time
+
+from axon.tests import base as test_base
+from axon.common.loop_monitor import LoopLagMonitor
+
+
+class TestLoopLagMonitor(test_base.BaseTestCase):
+    """
+    Test for event loop lag monitor
+    """
+
+    def setUp(self):
+        super(TestLoopLagMonitor, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def _run(self, seconds):
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def test_blocked_loop_is_detected(self):
+        monitor = LoopLagMonitor(self.loop, interval=0.01,
+                                 slow_callback_threshold=0.1)
+        monitor.start()
+        self._run(0.05)
+        self.loop.call_soon(time.sleep, 0.2)
+        self._run(0.3)
+        stats = monitor.snapshot()
+        self.assertGreaterEqual(stats['max'], 0.15)
+        self.assertEqual(1, stats['slow_callbacks'])
+        self.assertLessEqual(stats['p50'], stats['p99'])
+        self.assertFalse(self.loop.get_debug())
+
+    def test_snapshot_resets_samples(self):
+        monitor = LoopLagMonitor(self.loop, interval=0.01)
+        monitor.start()
+        self._run(0.05)
+        self.assertGreater(monitor.snapshot()['samples'], 0)
+        self.assertEqual(0, monitor.snapshot()['samples'])
+
+    def test_debug_only_when_requested(self):
+        monitor = LoopLagMonitor(self.loop, debug=True,
+                                 slow_callback_threshold=0.5)
+        monitor.start()
+        self._run(0)
+        self.assertTrue(self.loop.get_debug())
+        self.assertEqual(0.5, self.loop.slow_callback_duration)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from threading import Event, Thread
+import time
+
+from axon.tests import base as test_base
+from axon.common.monit_queues import Exchange, ExchangeManager, \
+    merge_counters, next_boundary, SubscriberDispatcher
+from axon.common.subscribers import ExchangeSubscriber, sum_counters
+
+
+class BlockedSubscriber(ExchangeSubscriber):
+    """Subscriber which handles messages only once released"""
+
+    def __init__(self):
+        self.release = Event()
+        self.started = Event()
+        self.handled = []
+
+    def handle(self, messages, timestamp=None):
+        self.started.set()
+        self.release.wait()
+        self.handled.append(messages)
+
+    def coalesce(self, messages):
+        return sum_counters(messages)
+
+
+class TestSubscriberDispatcher(test_base.BaseTestCase):
+    """
+    Test for bounded delivery of exchange messages to subscribers
+    """
+
+    def _start(self, policy, queue_size=2):
+        subscriber = BlockedSubscriber()
+        dispatcher = SubscriberDispatcher(subscriber, queue_size, policy)
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+        self.addCleanup(subscriber.release.set)
+        # First batch is taken by the blocked subscriber
+        dispatcher.put([{'a': 1}])
+        subscriber.started.wait(5)
+        return subscriber, dispatcher
+
+    def _finish(self, subscriber, dispatcher):
+        subscriber.release.set()
+        dispatcher.stop()
+        dispatcher.join(5)
+        self.assertFalse(dispatcher.is_alive())
+
+    def test_drop_oldest(self):
+        subscriber, dispatcher = self._start('drop_oldest')
+        for i in range(4):
+            dispatcher.put([{'b': i}])
+        self.assertEqual(2, dispatcher.stats()['dropped'])
+        self._finish(subscriber, dispatcher)
+        self.assertEqual([[{'a': 1}], [{'b': 2}], [{'b': 3}]],
+                         subscriber.handled)
+        self.assertEqual(3, dispatcher.stats()['delivered'])
+
+    def test_coalesce(self):
+        subscriber, dispatcher = self._start('coalesce')
+        for i in range(4):
+            dispatcher.put([{'b': 1}])
+        stats = dispatcher.stats()
+        self.assertEqual(0, stats['dropped'])
+        self.assertEqual(2, stats['queued'])
+        self._finish(subscriber, dispatcher)
+        self.assertEqual([[{'a': 1}], [{'b': 1}], [{'b': 3}]],
+                         subscriber.handled)
+
+    def test_block(self):
+        subscriber, dispatcher = self._start('block', queue_size=1)
+        dispatcher.put([{'b': 1}])
+        producer = Thread(target=dispatcher.put, args=([{'b': 2}],))
+        producer.start()
+        time.sleep(0.1)
+        self.assertTrue(producer.is_alive())
+        subscriber.release.set()
+        producer.join(5)
+        self._finish(subscriber, dispatcher)
+        self.assertEqual(3, len(subscriber.handled))
+        self.assertEqual(0, dispatcher.stats()['dropped'])
+
+    def test_failing_subscriber_is_counted(self):
+        subscriber = BlockedSubscriber()
+        subscriber.handle = None
+        dispatcher = SubscriberDispatcher(subscriber, 2, 'drop_oldest')
+        dispatcher.start()
+        dispatcher.put([{'a': 1}, {'a': 2}])
+        dispatcher.stop()
+        dispatcher.join(5)
+        self.assertEqual(2, dispatcher.stats()['failed'])
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, SubscriberDispatcher,
+                          BlockedSubscriber(), 2, 'spill')
+
+
+class TestExchange(test_base.BaseTestCase):
+
+    def test_messages_are_dispatched(self):
+        exchange = Exchange('test')
+        subscriber = BlockedSubscriber()
+        subscriber.release.set()
+        exchange.attach(subscriber, 0)
+        exchange.send({'a': 1})
+        exchange._recieve()
+        dispatcher = exchange._subscribers[subscriber]['dispatcher']
+        exchange.detach(subscriber)
+        dispatcher.join(5)
+        self.assertEqual([[{'a': 1}]], subscriber.handled)
+        self.assertEqual({}, exchange.get_stats())
+
+    def test_detach_flushes_buffered_messages(self):
+        exchange = Exchange('test')
+        subscriber = BlockedSubscriber()
+        subscriber.release.set()
+        exchange.attach(subscriber, 30)
+        exchange.send({'a': 1})
+        exchange._recieve()
+        self.assertEqual([], subscriber.handled)
+        exchange.detach(subscriber).join(5)
+        self.assertEqual([[{'a': 1}]], subscriber.handled)
+
+    def test_close_delivers_pending_messages(self):
+        exchange = Exchange('test')
+        subscriber = BlockedSubscriber()
+        subscriber.release.set()
+        exchange.attach(subscriber, 30)
+        exchange.send({'a': 1})
+        exchange.send({'a': 2})
+        exchange.close(timeout=5)
+        self.assertEqual([[{'a': 1}, {'a': 2}]], subscriber.handled)
+        self.assertEqual({}, exchange.get_stats())
+
+    def _attach(self, exchange, interval=30):
+        subscriber = BlockedSubscriber()
+        subscriber.release.set()
+        exchange.attach(subscriber, interval)
+        return subscriber
+
+    def _receive(self, exchange, *messages):
+        for message in messages:
+            exchange.send(message)
+            exchange._recieve()
+
+    def test_subscribers_share_buffer_per_interval(self):
+        exchange = Exchange('test')
+        first = self._attach(exchange)
+        second = self._attach(exchange)
+        other = self._attach(exchange, 60)
+        self.assertEqual(2, len(exchange._groups))
+        self._receive(exchange, {'a': 1}, {'a': 2})
+        exchange.flush(first)
+        exchange.detach(first).join(5)
+        exchange.detach(second).join(5)
+        self.assertEqual([[{'a': 1}, {'a': 2}]], first.handled)
+        self.assertEqual(first.handled, second.handled)
+        self.assertEqual([], other.handled)
+        self.assertEqual([60], list(exchange._groups))
+
+    def test_aggregated_snapshot(self):
+        exchange = Exchange('test', aggregator=merge_counters)
+        first = self._attach(exchange)
+        second = self._attach(exchange)
+        self._receive(exchange, {'a': 1, 'b': 1}, {'a': 2},
+                      {'hist': {'10': 1}}, {'hist': {'10': 2, '20': 1}})
+        exchange.close(timeout=5)
+        snapshot = {'a': 3, 'b': 1, 'hist': {'10': 3, '20': 1}}
+        self.assertEqual([[snapshot]], first.handled)
+        self.assertEqual([[snapshot]], second.handled)
+
+    def test_merge_counters(self):
+        total = {}
+        message = {'a': 1, 'hist': {'1': 1}, 'name': 'x', 'ok': True}
+        merge_counters(total, message)
+        merge_counters(total, {'a': 2.5, 'hist': {'1': 1, '2': 1},
+                               'name': 'y', 'ok': False})
+        self.assertEqual({'a': 3.5, 'hist': {'1': 2, '2': 1}, 'name': 'y',
+                          'ok': False}, total)
+        self.assertEqual({'1': 1}, message['hist'])
+
+
+class TestExchangeManager(test_base.BaseTestCase):
+    """
+    Test for timer driven flushes of exchange subscribers
+    """
+
+    def setUp(self):
+        super(TestExchangeManager, self).setUp()
+        self.manager = ExchangeManager()
+        self.manager.start()
+        self.exchange = self.manager.create_exchange('test_timer')
+        self.addCleanup(self.manager.delete_exchange, 'test_timer')
+        self.addCleanup(self.manager._stopped.set)
+
+    def test_next_boundary(self):
+        self.assertEqual(15, next_boundary(10.2, 5))
+        self.assertEqual(15, next_boundary(10, 5))
+
+    def test_flush_without_new_messages(self):
+        subscriber = BlockedSubscriber()
+        subscriber.release.set()
+        self.exchange.attach(subscriber, 0.2)
+        self.exchange.send({'a': 1})
+        deadline = time.time() + 5
+        while not subscriber.handled and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual([[{'a': 1}]], subscriber.handled)
+        self.exchange.detach(subscriber)
+
+    def test_detached_subscriber_is_unscheduled(self):
+        subscriber = BlockedSubscriber()
+        self.exchange.attach(subscriber, 0.1)
+        self.exchange.detach(subscriber)
+        time.sleep(0.3)
+        self.assertEqual([], self.manager._schedule)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import multiprocessing
+import unittest
+
+from axon.tests import base as test_base
+from axon.common.monit_queues import Exchange, merge_counters
+from axon.common.shm_ring import SharedCounterRing
+
+
+@unittest.skipUnless(SharedCounterRing.available(),
+                     "shared memory is not supported")
+class TestSharedCounterRing(test_base.BaseTestCase):
+    """
+    Test for shared memory transport of counters
+    """
+
+    def setUp(self):
+        super(TestSharedCounterRing, self).setUp()
+        self.ring = SharedCounterRing(capacity=4, key_size=16)
+        self.addCleanup(self.ring.close)
+
+    def test_write_read(self):
+        self.assertTrue(self.ring.write({'a': 1, 'b': -2}))
+        self.assertTrue(self.ring.write({'a': 3}))
+        self.assertEqual({'a': 4, 'b': -2}, self.ring.read())
+        self.assertEqual({}, self.ring.read())
+
+    def test_wrap_around(self):
+        for i in range(10):
+            self.ring.write({'a': i, 'b': 1, 'c': 1})
+            self.assertEqual({'a': i, 'b': 1, 'c': 1}, self.ring.read())
+        self.assertEqual(30, self.ring.stats()['read'])
+
+    def test_full_ring_drops(self):
+        self.ring.write({'a': 1, 'b': 1, 'c': 1})
+        self.assertTrue(self.ring.write({'d': 1, 'e': 1}))
+        self.assertEqual(2, self.ring.stats()['dropped'])
+        self.assertEqual({'a': 1, 'b': 1, 'c': 1}, self.ring.read())
+
+    def test_unsupported_counters(self):
+        self.assertFalse(self.ring.write({'a': 1.5}))
+        self.assertFalse(self.ring.write({'a' * 17: 1}))
+        self.assertFalse(self.ring.write({'a': True}))
+        self.assertEqual(0, self.ring.stats()['written'])
+
+    def test_write_from_forked_process(self):
+        ring = SharedCounterRing(capacity=64, key_size=16)
+        self.addCleanup(ring.close)
+
+        def write():
+            for _ in range(3):
+                ring.write({'a': 1, 'b': 2})
+
+        writer = multiprocessing.get_context('fork').Process(target=write)
+        writer.start()
+        writer.join(5)
+        self.assertEqual({'a': 3, 'b': 6}, ring.read())
+
+    def test_exchange_transport(self):
+        ring = SharedCounterRing(capacity=16, key_size=16)
+        exchange = Exchange('test', aggregator=merge_counters, ring=ring)
+        handled = []
+        subscriber = type('Subscriber', (object,), {
+            'handle': lambda _, messages, timestamp=None: handled.append(
+                messages)})()
+        exchange.attach(subscriber, 30)
+        exchange.send({'a': 1})
+        exchange.send({'a': 2, 'b': 1})
+        # Not a counter message, goes through the queue
+        exchange.send({'name': 'x'})
+        exchange.close(timeout=5)
+        self.assertEqual([[{'a': 3, 'b': 1, 'name': 'x'}]], handled)
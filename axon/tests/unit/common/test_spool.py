@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import os
+import shutil
+import tempfile
+
+from axon.tests import base as test_base
+from axon.common.monit_queues import Exchange, SubscriberDispatcher
+from axon.common.spool import DiskSpool
+from axon.common.subscribers import ExchangeSubscriber
+
+
+class TestDiskSpool(test_base.BaseTestCase):
+    """
+    Test for durable spooling of message batches
+    """
+
+    def setUp(self):
+        super(TestDiskSpool, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def _spool(self, **kwargs):
+        spool = DiskSpool(self.path, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def _drain(self, spool):
+        batches = []
+        while True:
+            messages = spool.peek()
+            if messages is None:
+                return batches
+            spool.commit()
+            batches.append(messages)
+
+    def test_append_peek_commit(self):
+        spool = self._spool()
+        self.assertFalse(spool.pending())
+        spool.append([{'a': 1}])
+        spool.append([{'a': 2}])
+        self.assertTrue(spool.pending())
+        self.assertEqual([{'a': 1}], spool.peek())
+        # Not committed, returned again
+        self.assertEqual([{'a': 1}], spool.peek())
+        spool.commit()
+        self.assertEqual([[{'a': 2}]], self._drain(spool))
+        self.assertFalse(spool.pending())
+        self.assertEqual([], os.listdir(self.path))
+
+    def test_segments_rotate(self):
+        spool = self._spool(segment_size=100)
+        for i in range(10):
+            spool.append([{'a': i}])
+        self.assertGreater(spool.stats()['segments'], 1)
+        self.assertEqual([[{'a': i}] for i in range(10)], self._drain(spool))
+        self.assertEqual(0, spool.stats()['segments'])
+
+    def test_oldest_segments_dropped_when_full(self):
+        spool = self._spool(segment_size=100, max_bytes=200)
+        for i in range(20):
+            spool.append([{'a': i}])
+        batches = self._drain(spool)
+        self.assertGreater(spool.stats()['dropped'], 0)
+        self.assertEqual(20, len(batches) + spool.stats()['dropped'])
+        self.assertEqual([{'a': 19}], batches[-1])
+
+    def test_reopen_resumes_from_cursor(self):
+        spool = self._spool(segment_size=100)
+        for i in range(5):
+            spool.append([{'a': i}])
+        spool.peek()
+        spool.commit()
+        spool.peek()
+        spool.close()
+        spool = self._spool(segment_size=100)
+        self.assertEqual([[{'a': i}] for i in range(1, 5)],
+                         self._drain(spool))
+
+    def test_torn_tail_is_truncated(self):
+        spool = self._spool()
+        spool.append([{'a': 1}])
+        spool.close()
+        segment = os.path.join(self.path, os.listdir(self.path)[0])
+        with open(segment, 'ab') as segment_file:
+            segment_file.write(b'\x10\x00\x00\x00torn')
+        spool = self._spool()
+        spool.append([{'a': 2}])
+        self.assertEqual([[{'a': 1}], [{'a': 2}]], self._drain(spool))
+
+
+class FlakySubscriber(ExchangeSubscriber):
+    """Subscriber whose sink is down until `up` is set"""
+
+    def __init__(self):
+        self.up = False
+        self.handled = []
+        self.timestamps = []
+
+    def handle(self, messages, timestamp=None):
+        if not self.up:
+            raise IOError("sink is down")
+        self.handled.append(messages)
+        self.timestamps.append(timestamp)
+
+
+class TestSpooledDispatcher(test_base.BaseTestCase):
+    """
+    Test for spooling of batches a subscriber fails to handle
+    """
+
+    def setUp(self):
+        super(TestSpooledDispatcher, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_failed_batches_are_replayed_in_order(self):
+        subscriber = FlakySubscriber()
+        dispatcher = SubscriberDispatcher(
+            subscriber, spool=DiskSpool(self.path), retry_min=0.01,
+            retry_max=0.05)
+        # Deliver in the calling thread to keep the test deterministic
+        dispatcher._deliver(10, [{'a': 1}])
+        dispatcher._deliver(20, [{'a': 2}])
+        self.assertEqual(2, dispatcher.stats()['spooled'])
+        self.assertEqual(0, dispatcher.stats()['failed'])
+        dispatcher._retry_at = 0
+        dispatcher._replay()
+        self.assertEqual([], subscriber.handled)
+        subscriber.up = True
+        dispatcher._retry_at = 0
+        dispatcher._replay()
+        dispatcher._deliver(30, [{'a': 3}])
+        self.assertEqual([[{'a': 1}], [{'a': 2}], [{'a': 3}]],
+                         subscriber.handled)
+        # Replayed batches keep the time they were flushed
+        self.assertEqual([10, 20, 30], subscriber.timestamps)
+        stats = dispatcher.stats()
+        self.assertEqual(2, stats['replayed'])
+        self.assertEqual(1, stats['delivered'])
+        self.assertEqual(0, stats['spool']['segments'])
+        self.assertEqual(0.01, dispatcher._backoff)
+
+    def test_dispatcher_thread_replays_after_recovery(self):
+        subscriber = FlakySubscriber()
+        dispatcher = SubscriberDispatcher(
+            subscriber, spool=DiskSpool(self.path), retry_min=0.01,
+            retry_max=0.05)
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+        dispatcher.put([{'a': 1}])
+        for _ in range(500):
+            if dispatcher.stats()['spooled']:
+                break
+            dispatcher.join(0.01)
+        subscriber.up = True
+        for _ in range(500):
+            if subscriber.handled:
+                break
+            dispatcher.join(0.01)
+        dispatcher.stop()
+        dispatcher.join(5)
+        self.assertFalse(dispatcher.is_alive())
+        self.assertEqual([[{'a': 1}]], subscriber.handled)
+
+
+class TestExchangeSpools(test_base.BaseTestCase):
+    """
+    Test for spool directories of subscribers attached to an exchange
+    """
+
+    def setUp(self):
+        super(TestExchangeSpools, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.exchange = Exchange('traffic')
+        self.addCleanup(self.exchange.close, 5)
+
+    def test_subscribers_of_same_class_get_own_spool(self):
+        first, second = FlakySubscriber(), FlakySubscriber()
+        self.exchange.attach(first, 30, spool_dir=self.path)
+        self.exchange.attach(second, 30, spool_dir=self.path)
+        self.assertEqual(
+            ['FlakySubscriber', 'FlakySubscriber-1'],
+            sorted(os.listdir(os.path.join(self.path, 'traffic'))))
+        # Attached again, a subscriber keeps its spool
+        self.exchange.attach(first, 30, spool_dir=self.path)
+        self.assertEqual('FlakySubscriber',
+                         self.exchange._subscribers[first]['spool_id'])
+        self.assertRaises(ValueError, self.exchange.attach,
+                          FlakySubscriber(), 30, spool_dir=self.path,
+                          spool_id='FlakySubscriber-1')
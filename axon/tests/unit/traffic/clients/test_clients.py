@@ -6,9 +6,11 @@
 
 import mock
 import multiprocessing as mp
+import socket
 
+from axon.common.metric_cache import MetricsCache
 from axon.tests import base as test_base
-from axon.traffic.clients.clients import TrafficClient
+from axon.traffic.clients.clients import TCPClient, TrafficClient
 
 
 class TestTCPClient(test_base.BaseTestCase):
@@ -33,3 +35,25 @@ class TestTCPClient(test_base.BaseTestCase):
         _traffic_client = TrafficClient(
             source, destinations, record_queue)
         _traffic_client._send_traffic()
+
+
+class TestNamespaceClient(test_base.BaseTestCase):
+    """
+    Test for clients creating sockets inside a namespace
+    """
+
+    @mock.patch('socket.socket')
+    def test_socket_created_in_namespace(self, mock_socket):
+        executor = mock.Mock()
+        client = TCPClient('1.2.3.4', '1.2.3.5', 12345, MetricsCache(),
+                           namespace='ns1', ns_executor=executor)
+        client.ping()
+        executor.run.assert_called_with(
+            'ns1', mock_socket, socket.AF_INET, socket.SOCK_STREAM)
+        mock_socket.assert_not_called()
+
+    @mock.patch('socket.socket')
+    def test_socket_created_in_current_namespace(self, mock_socket):
+        client = TCPClient('1.2.3.4', '1.2.3.5', 12345, MetricsCache())
+        client.ping()
+        mock_socket.assert_called_with(socket.AF_INET, socket.SOCK_STREAM)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import asyncio
+import mock
+
+from axon.tests import base as test_base
+from axon.traffic.servers.servers import ConnectionLimiter, \
+    create_listening_socket, HTTPProtocol, HTTPResponses, ServerFactory
+from axon.traffic.servers.profiles import RandomSizeProfile
+from axon.traffic.traffic_objects import TrafficServer
+from axon.utils.nsenter import NamespaceExecutor
+
+
+class TestHTTPProtocol(test_base.BaseTestCase):
+    """
+    Test for the incremental HTTP server protocol
+    """
+
+    def setUp(self):
+        super(TestHTTPProtocol, self).setUp()
+        self.responses = HTTPResponses()
+        self.transport = mock.Mock()
+        self.protocol = HTTPProtocol(self.responses)
+        self.protocol.connection_made(self.transport)
+
+    def test_keep_alive_for_http11(self):
+        self.protocol.data_received(b"GET / HTTP/1.1\r\nHost: a\r\n\r\n")
+        self.transport.write.assert_called_once_with(self.responses.ok)
+        self.transport.close.assert_not_called()
+
+    def test_close_for_http10(self):
+        self.protocol.data_received(b"GET / HTTP/1.0\r\n\r\n")
+        self.transport.write.assert_called_once_with(self.responses.ok_close)
+        self.transport.close.assert_called_once_with()
+
+    def test_connection_close_header(self):
+        self.protocol.data_received(
+            b"GET / HTTP/1.1\r\nConnection: close\r\n\r\n")
+        self.transport.write.assert_called_once_with(self.responses.ok_close)
+        self.transport.close.assert_called_once_with()
+
+    def test_pipelined_requests_single_write(self):
+        self.protocol.data_received(
+            b"GET / HTTP/1.1\r\n\r\nGET / HTTP/1.1\r\n\r\nGET /")
+        self.transport.write.assert_called_once_with(
+            self.responses.ok + self.responses.ok)
+        self.protocol.data_received(b" HTTP/1.1\r\n\r\n")
+        self.transport.write.assert_called_with(self.responses.ok)
+
+    def test_request_split_across_reads(self):
+        self.protocol.data_received(b"POST / HTTP/1.1\r\nContent-Le")
+        self.protocol.data_received(b"ngth: 4\r\n\r\nab")
+        self.transport.write.assert_not_called()
+        self.protocol.data_received(b"cd")
+        self.transport.write.assert_called_once_with(
+            self.responses.not_allowed)
+
+    def test_malformed_request(self):
+        self.protocol.data_received(b"garbage\r\n\r\n")
+        self.transport.write.assert_called_once_with(
+            self.responses.bad_request)
+        self.transport.close.assert_called_once_with()
+
+    def test_invalid_content_length(self):
+        for value in (b"-40", b"abc", b"+4", b""):
+            transport = mock.Mock()
+            protocol = HTTPProtocol(self.responses)
+            protocol.connection_made(transport)
+            protocol.data_received(b"".join(
+                [b"POST / HTTP/1.1\r\nContent-Length: ", value,
+                 b"\r\n\r\n", b"x" * 40]))
+            transport.write.assert_called_once_with(
+                self.responses.bad_request)
+            transport.close.assert_called_once_with()
+
+    def test_leading_empty_lines_ignored(self):
+        self.protocol.data_received(b"\r\n\r\nGET / HTTP/1.1\r\n\r\n\r\n")
+        self.transport.write.assert_called_once_with(self.responses.ok)
+        self.protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        self.transport.write.assert_called_with(self.responses.ok)
+        self.transport.close.assert_not_called()
+
+    def test_response_size(self):
+        responses = HTTPResponses.of_size(2048)
+        self.assertEqual(2048, len(responses.body))
+        self.assertTrue(responses.ok.endswith(responses.body))
+        self.assertIn(b"Content-Length: 2048\r\n", responses.ok)
+
+    def test_random_size_response_not_copied(self):
+        profile = RandomSizeProfile(10, 20)
+        responses = HTTPResponses(profile=profile)
+        protocol = HTTPProtocol(responses)
+        protocol.connection_made(self.transport)
+        for _ in range(10):
+            protocol.data_received(b"GET / HTTP/1.1\r\n\r\n")
+        self.transport.write.assert_not_called()
+        for call in self.transport.writelines.call_args_list:
+            header, payload = call[0][0]
+            self.assertIs(profile._buffer.obj, payload.obj)
+            self.assertIn(b"Content-Length: %d\r\n" % len(payload), header)
+            # Header of each length is built once
+            self.assertIs(responses._ok_headers[(len(payload), True)],
+                          header)
+
+
+class TestConnectionLimiter(test_base.BaseTestCase):
+    """
+    Test for listener connection limits and flow control
+    """
+
+    def _connect(self, limiter):
+        transport = mock.Mock()
+        transport.is_closing.return_value = False
+        protocol = HTTPProtocol(limiter=limiter)
+        protocol.connection_made(transport)
+        return protocol, transport
+
+    def test_reject_over_limit(self):
+        limiter = ConnectionLimiter(1, ConnectionLimiter.REJECT)
+        self._connect(limiter)
+        _, transport = self._connect(limiter)
+        transport.abort.assert_called_once_with()
+        self.assertEqual(1, limiter.stats()['shed'])
+        self.assertEqual(1, limiter.stats()['active'])
+
+    def test_no_limit(self):
+        limiter = ConnectionLimiter(0)
+        for _ in range(3):
+            _, transport = self._connect(limiter)
+            transport.abort.assert_not_called()
+            transport.pause_reading.assert_not_called()
+        self.assertEqual(3, limiter.stats()['active'])
+        self.assertEqual(0, limiter.stats()['shed'])
+
+    def test_queue_over_limit(self):
+        limiter = ConnectionLimiter(1, ConnectionLimiter.QUEUE, 1)
+        first, _ = self._connect(limiter)
+        _, queued = self._connect(limiter)
+        _, shed = self._connect(limiter)
+        queued.pause_reading.assert_called_once_with()
+        shed.abort.assert_called_once_with()
+        first.connection_lost(None)
+        queued.resume_reading.assert_called_once_with()
+        self.assertEqual({'active': 1, 'queued': 0, 'shed': 1,
+                          'max_connections': 1, 'policy': 'queue'},
+                         limiter.stats())
+
+    def test_pause_reading_on_write_backpressure(self):
+        protocol, transport = self._connect(None)
+        protocol.pause_writing()
+        transport.pause_reading.assert_called_once_with()
+        protocol.resume_writing()
+        transport.resume_reading.assert_called_once_with()
+
+
+class TestNamespaceListeners(test_base.BaseTestCase):
+    """
+    Test for listeners created up front and served through `sock`
+    """
+
+    def test_serve_prebound_sockets(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        executor = NamespaceExecutor()
+        self.addCleanup(executor.shutdown)
+        for protocol in ('TCP', 'UDP', 'HTTP'):
+            server = TrafficServer('id', '127.0.0.1', 0, protocol)
+            sock = executor.run(None, create_listening_socket,
+                                server.endpoint, server.port, protocol)
+            result = loop.run_until_complete(
+                ServerFactory.create_server(server, loop, sock=sock))
+            if protocol == 'UDP':
+                result[0].close()
+            else:
+                result.close()
+                loop.run_until_complete(result.wait_closed())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import os
+import tempfile
+
+from axon.tests import base as test_base
+from axon.traffic.servers.profiles import create_response_profile, \
+    FileProfile, FixedSizeProfile, RandomSizeProfile
+from axon.traffic.servers.servers import HTTPResponses
+
+
+class TestResponseProfiles(test_base.BaseTestCase):
+    """
+    Test for server response profiles
+    """
+
+    def test_fixed_profile_shares_buffer(self):
+        profile = FixedSizeProfile(1400)
+        self.assertEqual(1400, len(profile.payload()))
+        self.assertIs(profile.payload(), profile.payload())
+
+    def test_random_profile_bounds(self):
+        for distribution in RandomSizeProfile.DISTRIBUTIONS:
+            profile = RandomSizeProfile(10, 100, distribution)
+            for _ in range(100):
+                self.assertTrue(10 <= len(profile.payload()) <= 100)
+
+    def test_random_profile_invalid_distribution(self):
+        self.assertRaises(ValueError, RandomSizeProfile, 1, 10, 'fake')
+
+    def test_file_profile(self):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, b"a" * 100)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        profile = create_response_profile({'type': 'file', 'path': path})
+        self.assertIsInstance(profile, FileProfile)
+        self.assertEqual(100, profile.size)
+        responses = HTTPResponses(profile=profile)
+        self.assertIn(b"Content-Length: 100\r\n",
+                      responses.ok_response(True))
+
+    def test_profiles_are_cached(self):
+        config = {'type': 'fixed', 'size': 512}
+        self.assertIs(create_response_profile(config),
+                      create_response_profile(dict(config)))
+
+    def test_no_profile(self):
+        self.assertIsNone(create_response_profile(None))
+
+    def test_invalid_profile_type(self):
+        self.assertRaises(ValueError, create_response_profile,
+                          {'type': 'fake'})
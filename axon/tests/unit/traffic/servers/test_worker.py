@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from concurrent.futures import Future
+from queue import Empty, Queue
+import socket
+from threading import Event, Thread
+import time
+
+import mock
+
+from axon.tests import base as test_base
+from axon.traffic.controller import TrafficController
+from axon.traffic.servers.worker import TrafficServerWorker
+from axon.traffic.traffic_objects import TrafficServer
+
+
+def start_worker(test, uid, hb_queue=None):
+    """Run a server worker's event loop in a thread of the test"""
+    worker = TrafficServerWorker(uid, hb_queue=hb_queue)
+    loop_running = Event()
+    thread = Thread(target=worker._run_servers, args=(loop_running,))
+    thread.daemon = True
+    thread.start()
+    loop_running.wait(5)
+    test.addCleanup(worker._loop.call_soon_threadsafe, worker._loop.stop)
+    test.addCleanup(worker.delete_all_servers)
+    return worker
+
+
+def free_port(sock_type):
+    sock = socket.socket(socket.AF_INET, sock_type)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class InProcessWorkerClient(object):
+    """RPC client calling a worker of the test process directly"""
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def call_async(self, method, args=()):
+        future = Future()
+        try:
+            future.set_result(getattr(self.worker, method)(*args))
+        except Exception as ex:
+            future.set_exception(ex)
+        return future
+
+    def close(self):
+        pass
+
+
+class TestTrafficServerWorker(test_base.BaseTestCase):
+    """
+    Test for servers started and stopped by a server worker
+    """
+
+    def setUp(self):
+        super(TestTrafficServerWorker, self).setUp()
+        self.worker = start_worker(self, 'w1')
+        # Port in use, binding another listener to it fails
+        self.busy = socket.socket()
+        self.busy.bind(('127.0.0.1', 0))
+        self.busy.listen(1)
+        self.addCleanup(self.busy.close)
+
+    def test_failed_server_is_not_kept(self):
+        good = TrafficServer('1', '127.0.0.1', 0, 'TCP')
+        bad = TrafficServer('2', '127.0.0.1', self.busy.getsockname()[1],
+                            'TCP')
+        self.assertEqual([bad], self.worker.add_servers([good, bad]))
+        self.assertTrue(self.worker.has_server(good))
+        self.assertFalse(self.worker.has_server(bad))
+        self.assertEqual(1, len(self.worker.get_connection_stats()))
+        # Deleting the failed server is a no op
+        self.worker.delete_servers([bad, good])
+        self.assertEqual(0, self.worker.get_server_count())
+
+    def test_udp_server_is_stopped(self):
+        server = TrafficServer('1', '127.0.0.1', free_port(socket.SOCK_DGRAM),
+                               'UDP')
+        self.assertEqual([], self.worker.add_servers([server]))
+        self.worker.delete_servers([server])
+        self.assertFalse(self.worker.has_server(server))
+        # Port is free again
+        self.assertEqual([], self.worker.add_servers([server]))
+
+
+class TestServerWorkerHeartbeat(test_base.BaseTestCase):
+    """
+    Test for heartbeats sent from the event loop of a server worker
+    """
+
+    @mock.patch('axon.traffic.servers.worker.WORKER_HEARTBEAT_INTERVAL',
+                0.05)
+    def test_heartbeats_stop_while_loop_hangs(self):
+        hb_queue = Queue()
+        worker = start_worker(self, 'w1', hb_queue)
+        worker._loop.call_soon_threadsafe(worker._send_heartbeat)
+        self.assertEqual(('w1', 'OK', 0), hb_queue.get(timeout=5)[:3])
+        hanging = Event()
+
+        def hang():
+            hanging.set()
+            time.sleep(0.5)
+        worker._loop.call_soon_threadsafe(hang)
+        hanging.wait(5)
+        while not hb_queue.empty():
+            hb_queue.get()
+        self.assertRaises(Empty, hb_queue.get, timeout=0.3)
+        # Heartbeats resume with the loop
+        hb_queue.get(timeout=5)
+
+
+class TestRebalanceWorkers(test_base.BaseTestCase):
+    """
+    Test for rules moved between running server workers
+    """
+
+    def setUp(self):
+        super(TestRebalanceWorkers, self).setUp()
+        self.controller = TrafficController(mock.Mock())
+        self.controller._worker_counts['server'] = 2
+        self.workers = {}
+        for uid in ('w1', 'w2'):
+            self._add_worker(uid)
+
+    def _add_worker(self, uid):
+        worker = start_worker(self, uid)
+        self.workers[uid] = worker
+        context = self.controller._get_worker_context()
+        context.update({'uid': uid, 'client': InProcessWorkerClient(worker)})
+        self.controller._register_worker(context, 'server')
+
+    def test_rebalance_moves_udp_rules(self):
+        rules = [TrafficServer(str(i), '127.0.0.1',
+                               free_port(socket.SOCK_DGRAM), 'UDP')
+                 for i in range(6)]
+        rules.append(TrafficServer('tcp', '127.0.0.1',
+                                   free_port(socket.SOCK_STREAM), 'TCP'))
+        self.controller.start_servers(rules)
+        self._add_worker('w3')
+        self.assertGreater(self.controller.rebalance('server'), 0)
+        ring = self.controller._rings['server']
+        for rule in rules:
+            for uid, worker in self.workers.items():
+                self.assertEqual(ring.get_node(rule.id) == uid,
+                                 worker.has_server(rule))
+        # Every worker applied its deltas
+        self.assertEqual([], self.controller.sync_workers('server'))
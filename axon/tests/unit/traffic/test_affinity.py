@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from axon.tests import base as test_base
+from axon.traffic.affinity import CpuAllocator, parse_cpu_list
+
+
+class TestCpuAllocator(test_base.BaseTestCase):
+
+    def test_parse_cpu_list(self):
+        self.assertEqual([0, 1, 2, 3, 8, 10, 11],
+                         parse_cpu_list('0-3,8,10-11\n'))
+
+    def test_no_pinning(self):
+        allocator = CpuAllocator('none', cpus=range(4), nodes={})
+        self.assertIsNone(allocator.allocate('w1'))
+        self.assertEqual({}, allocator.placement())
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, CpuAllocator, 'socket')
+
+    def test_core_policy_dedicated_cores(self):
+        allocator = CpuAllocator('core', cpus=range(3),
+                                 nodes={0: [0, 1, 2]})
+        cpus = [allocator.allocate('s1', 'server'),
+                allocator.allocate('c1', 'client'),
+                allocator.allocate('s2', 'server')]
+        self.assertEqual([{0}, {1}, {2}], cpus)
+        # All cores used, cores are shared
+        self.assertEqual({0}, allocator.allocate('c2', 'client'))
+        # Allocation is stable, e.g. for a restarted worker
+        self.assertEqual({1}, allocator.allocate('c1', 'client'))
+        allocator.release('s2')
+        self.assertEqual({2}, allocator.allocate('s3', 'server'))
+
+    def test_numa_policy_separates_nodes(self):
+        allocator = CpuAllocator('numa', cpus=range(8),
+                                 nodes={0: [0, 1, 2, 3], 1: [4, 5, 6, 7]})
+        self.assertEqual({0}, allocator.allocate('s1', 'server'))
+        self.assertEqual({4}, allocator.allocate('c1', 'client'))
+        self.assertEqual({5}, allocator.allocate('c2', 'client'))
+        placement = allocator.placement()
+        self.assertEqual({'type': 'client', 'cpus': [5], 'nodes': [1]},
+                         placement['c2'])
+
+    def test_numa_policy_single_node_splits_cores(self):
+        allocator = CpuAllocator('numa', cpus=[2, 3, 4, 5],
+                                 nodes={0: list(range(8))})
+        self.assertEqual({2}, allocator.allocate('s1', 'server'))
+        self.assertEqual({3}, allocator.allocate('s2', 'server'))
+        self.assertEqual({2}, allocator.allocate('s3', 'server'))
+        self.assertEqual({4}, allocator.allocate('c1', 'client'))
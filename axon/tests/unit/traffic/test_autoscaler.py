@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from axon.tests import base as test_base
+from axon.traffic.autoscaler import WorkerAutoscaler
+
+
+class TestWorkerAutoscaler(test_base.BaseTestCase):
+
+    def setUp(self):
+        super(TestWorkerAutoscaler, self).setUp()
+        self.autoscaler = WorkerAutoscaler(
+            100, min_workers=1, max_workers=8, cpu_high=80, cpu_low=20,
+            lag_high=0.05)
+
+    def test_count_for_rules(self):
+        self.assertEqual(0, self.autoscaler.count_for_rules(0))
+        self.assertEqual(1, self.autoscaler.count_for_rules(1))
+        self.assertEqual(3, self.autoscaler.count_for_rules(201))
+        self.assertEqual(8, self.autoscaler.count_for_rules(100000))
+
+    def test_scale_out_on_rules(self):
+        self.assertEqual(5, self.autoscaler.desired_count(
+            2, 450, [{'cpu': 50, 'lag': 0.01}] * 2))
+
+    def test_scale_out_on_load(self):
+        self.assertEqual(3, self.autoscaler.desired_count(
+            2, 10, [{'cpu': 90, 'lag': None}, {'cpu': 10, 'lag': None}]))
+        self.assertEqual(3, self.autoscaler.desired_count(
+            2, 10, [{'cpu': 10, 'lag': 0.2}, {'cpu': 10, 'lag': 0}]))
+        self.assertEqual(8, self.autoscaler.desired_count(
+            8, 10, [{'cpu': 90, 'lag': None}] * 8))
+
+    def test_scale_in_one_at_a_time(self):
+        self.assertEqual(3, self.autoscaler.desired_count(
+            4, 10, [{'cpu': 5, 'lag': 0.001}] * 4))
+        self.assertEqual(2, self.autoscaler.desired_count(
+            2, 150, [{'cpu': 5, 'lag': 0.001}] * 2))
+
+    def test_unknown_cpu_is_not_idle(self):
+        # First psutil sample or failed stats call after a restart
+        self.assertEqual(4, self.autoscaler.desired_count(
+            4, 10, [{'cpu': None, 'lag': 0}] * 4))
+        self.assertEqual(4, self.autoscaler.desired_count(
+            4, 10, [{'cpu': None, 'lag': None}] + [{'cpu': 5, 'lag': 0}] * 3))
+
+    def test_moderate_load_keeps_count(self):
+        self.assertEqual(4, self.autoscaler.desired_count(
+            4, 10, [{'cpu': 50, 'lag': 0.001}] * 4))
+        self.assertEqual(4, self.autoscaler.desired_count(
+            4, 10, [{'cpu': None, 'lag': None}, {'cpu': 50, 'lag': 0}]))
+
+    def test_no_rules_keeps_workers(self):
+        self.assertEqual(2, self.autoscaler.desired_count(2, 0, []))
+        self.assertEqual(0, self.autoscaler.desired_count(0, 0, []))
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from concurrent.futures import Future
+from threading import Thread
+import time
+
+import mock
+
+from axon.tests import base as test_base
+from axon.traffic.controller import TrafficController
+from axon.traffic.supervisor import WorkerSupervisor
+from axon.traffic.traffic_objects import TrafficServer
+
+
+class FakeWorkerClient(object):
+    """RPC client of an in process worker which applies rule deltas"""
+
+    def __init__(self):
+        self.rules = {}
+        self.version = 0
+        self.deltas = []
+        self.fail = False
+
+    def apply_delta(self, delta):
+        self.deltas.append(delta)
+        if delta.reset:
+            self.rules.clear()
+        elif delta.base_version != self.version:
+            return self.version
+        for rule in delta.removed:
+            self.rules.pop(rule.id, None)
+        for rule in delta.added:
+            self.rules[rule.id] = rule
+        self.version = delta.version
+        return self.version
+
+    def get_rules_version(self):
+        return self.version
+
+    def close(self):
+        pass
+
+    def call_async(self, method, args=()):
+        future = Future()
+        if self.fail:
+            future.set_exception(ValueError("worker failed"))
+        else:
+            future.set_result(getattr(self, method)(*args))
+        return future
+
+
+class TestTrafficController(test_base.BaseTestCase):
+    """
+    Test for distribution of rules among traffic workers
+    """
+
+    def setUp(self):
+        super(TestTrafficController, self).setUp()
+        self.controller = TrafficController(mock.Mock())
+        self.controller._worker_counts['server'] = 2
+        self.clients = {}
+        for uid in ('w1', 'w2'):
+            self._add_worker(uid)
+        self.rules = [TrafficServer(str(i), '1.1.1.%d' % i, 80, 'TCP')
+                      for i in range(20)]
+
+    def _add_worker(self, uid):
+        context = self.controller._get_worker_context()
+        context.update({'uid': uid, 'client': FakeWorkerClient()})
+        self.clients[uid] = context['client']
+        self.controller._register_worker(context, 'server')
+
+    def _owner(self, rule):
+        return self.controller._rings['server'].get_node(rule.id)
+
+    def _expected_rules(self, rules):
+        expected = {uid: set() for uid in self.clients}
+        for rule in rules:
+            expected[self._owner(rule)].add(rule.id)
+        return expected
+
+    def _worker_rules(self):
+        return {uid: set(client.rules) for uid, client in self.clients.items()}
+
+    def test_start_servers(self):
+        self.controller.start_servers(self.rules)
+        self.assertEqual(self._expected_rules(self.rules),
+                         self._worker_rules())
+        self.assertTrue(all(self._worker_rules().values()))
+        for rule in self.rules:
+            self.assertIsNotNone(
+                self.controller._rules_registry.get('server_%s' % rule.id))
+
+    def test_stop_servers(self):
+        self.controller.start_servers(self.rules)
+        self.controller.stop_servers(self.rules[:1])
+        self.assertEqual(self._expected_rules(self.rules[1:]),
+                         self._worker_rules())
+        owner = self.clients[self._owner(self.rules[0])]
+        self.assertEqual(1, len(owner.deltas[-1].removed))
+        self.assertIsNone(self.controller._rules_registry.get(
+            'server_%s' % self.rules[0].id))
+
+    def test_changed_rule_is_updated(self):
+        self.controller.start_servers(self.rules)
+        changed = TrafficServer('1', '1.1.1.1', 80, 'TCP',
+                                response_profile={'size': 10})
+        self.controller.start_servers([changed] + self.rules[2:])
+        owner = self.clients[self._owner(changed)]
+        self.assertEqual({'1'}, owner.deltas[-1].changed)
+        self.assertEqual(2, len(owner.deltas))
+        self.assertEqual({'size': 10}, owner.rules['1'].response_profile)
+        self.assertEqual(3, sum(len(client.deltas) for client in
+                                self.clients.values()))
+
+    def test_lost_update_is_repaired(self):
+        self.controller.start_servers(self.rules)
+        first, second = [rule for rule in self.rules
+                         if self._owner(rule) == 'w1'][:2]
+        self.clients['w1'].fail = True
+        self.controller.stop_servers([first])
+        self.clients['w1'].fail = False
+        self.assertIn(first.id, self.clients['w1'].rules)
+        self.controller.stop_servers([second])
+        delta = self.clients['w1'].deltas[-1]
+        self.assertEqual((1, 3), (delta.base_version, delta.version))
+        self.assertEqual(self._expected_rules(
+            set(self.rules) - {first, second}), self._worker_rules())
+
+    def test_sync_workers(self):
+        self.controller.start_servers(self.rules)
+        # Worker restarted and lost its rules
+        self.clients['w2'].rules.clear()
+        self.clients['w2'].version = 0
+        self.assertEqual(['w2'], self.controller.sync_workers('server'))
+        self.assertEqual(self._expected_rules(self.rules),
+                         self._worker_rules())
+        self.assertEqual([], self.controller.sync_workers('server'))
+
+    def test_rebalance_moves_only_rules_of_new_worker(self):
+        self.controller.start_servers(self.rules)
+        before = self._worker_rules()
+        self._add_worker('w3')
+        moved = self.controller.rebalance('server')
+        after = self._worker_rules()
+        self.assertEqual(self._expected_rules(self.rules), after)
+        self.assertEqual(len(after['w3']), moved)
+        for uid in ('w1', 'w2'):
+            self.assertTrue(after[uid] <= before[uid])
+        self.assertEqual(0, self.controller.rebalance('server'))
+
+    def test_rebalance_and_sync_wait_for_workers_lock(self):
+        self.controller.start_servers(self.rules)
+        self._add_worker('w3')
+        with self.controller._workers_lock:
+            threads = [Thread(target=self.controller.rebalance),
+                       Thread(target=self.controller.sync_workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(0.2)
+                self.assertTrue(thread.is_alive())
+            self.assertEqual([], self.clients['w3'].deltas)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self._expected_rules(self.rules),
+                         self._worker_rules())
+
+    def _fake_create_workers(self, count, worker_type):
+        for i in range(count):
+            self._add_worker('w%d' % (len(self.clients) + 1))
+
+    def test_start_scales_out_for_rules(self):
+        self.controller._autoscalers['server'].rules_per_worker = 5
+        self.controller._autoscalers['server'].max_workers = 8
+        self.controller._create_workers = mock.Mock(
+            side_effect=self._fake_create_workers)
+        self.controller.start_servers(self.rules)
+        self.assertEqual(4, len(self.clients))
+        self.assertEqual(self._expected_rules(self.rules),
+                         self._worker_rules())
+
+    def test_autoscale_in_moves_rules(self):
+        self.controller.start_servers(self.rules)
+        self.controller._get_worker_loads = mock.Mock(
+            return_value=[{'cpu': 1, 'lag': 0}] * 2)
+        stopped = []
+        self.controller._stop_worker = mock.Mock(
+            side_effect=lambda context, worker_type: stopped.append(
+                context['uid']))
+        self.assertEqual({'before': 2, 'after': 1},
+                         self.controller.autoscale('server'))
+        self.assertEqual(1, len(stopped))
+        remaining = ({'w1', 'w2'} - set(stopped)).pop()
+        self.assertEqual(set(rule.id for rule in self.rules),
+                         self._worker_rules()[remaining])
+        self.assertEqual(set(), self._worker_rules()[stopped[0]])
+
+    def test_autoscale_out_on_load(self):
+        self.controller.start_servers(self.rules)
+        self.controller._get_worker_loads = mock.Mock(
+            return_value=[{'cpu': 95, 'lag': 0}, {'cpu': 10, 'lag': 0}])
+        self.controller._create_workers = mock.Mock(
+            side_effect=self._fake_create_workers)
+        self.controller._autoscalers['server'].max_workers = 8
+        self.assertEqual({'before': 2, 'after': 3},
+                         self.controller.autoscale('server'))
+        self.assertEqual(self._expected_rules(self.rules),
+                         self._worker_rules())
+
+    def test_placement(self):
+        self.controller.start_servers(self.rules)
+        placement = self.controller.get_placement('server')
+        self.assertEqual(20, placement['rules'])
+        self.assertEqual(20, sum(placement['workers'].values()))
+        self.assertGreaterEqual(placement['skew'], 1.0)
+
+
+class FakeProcess(object):
+
+    def __init__(self, running=True):
+        self.running = running
+        self.stopped = False
+
+    def is_running(self):
+        return self.running
+
+    def stop(self):
+        self.stopped = True
+        self.running = False
+
+
+class TestWorkerSupervision(test_base.BaseTestCase):
+    """
+    Test for restart of dead or silent workers
+    """
+
+    def setUp(self):
+        super(TestWorkerSupervision, self).setUp()
+        self.controller = TrafficController(mock.Mock())
+        self.controller._worker_counts['server'] = 1
+        self.context = self.controller._get_worker_context()
+        self.context.update({'uid': 'w1', 'client': FakeWorkerClient(),
+                             'process': FakeProcess(), 'started': 100})
+        self.controller._register_worker(self.context, 'server')
+        self.controller._start_supervisor = mock.Mock()
+        self.supervisor = WorkerSupervisor(
+            self.controller, self.controller._heartbeat_queue, timeout=10,
+            startup_grace=30)
+        self.controller._supervisor = self.supervisor
+        self.rules = [TrafficServer(str(i), '1.1.1.%d' % i, 80, 'TCP')
+                      for i in range(5)]
+        self.controller.start_servers(self.rules)
+        self.new_client = FakeWorkerClient()
+
+        def start_worker_process(context, worker_type):
+            context.update({'process': FakeProcess(),
+                            'client': self.new_client,
+                            'started': time.time()})
+        self.controller._start_worker_process = mock.Mock(
+            side_effect=start_worker_process)
+
+    def test_healthy_worker_is_not_restarted(self):
+        with mock.patch('axon.traffic.supervisor.time.time',
+                        return_value=110):
+            self.supervisor.check()
+        self.controller._start_worker_process.assert_not_called()
+        self.assertEqual(0, self.controller.get_worker_health()[0][
+            'restarts'])
+
+    def test_dead_worker_is_restarted_with_its_rules(self):
+        old_process = self.context['process']
+        old_process.running = False
+        self.supervisor.check()
+        self.assertTrue(old_process.stopped)
+        self.assertEqual({rule.id for rule in self.rules},
+                         set(self.new_client.rules))
+        self.assertTrue(self.new_client.deltas[0].reset)
+        health = self.controller.get_worker_health()
+        self.assertEqual(1, len(health))
+        self.assertEqual(1, health[0]['restarts'])
+        self.assertTrue(health[0]['healthy'])
+        self.assertEqual(5, health[0]['rules'])
+
+    def test_silent_worker_is_restarted(self):
+        with mock.patch('axon.traffic.supervisor.time.time',
+                        return_value=100):
+            self.controller._heartbeat_queue.put(('w1', 'OK', 5, 100))
+            self.supervisor.drain(timeout=1)
+        self.assertEqual((100, 5), self.supervisor.get_heartbeat('w1'))
+        with mock.patch('axon.traffic.supervisor.time.time',
+                        return_value=105):
+            self.supervisor.check()
+        self.controller._start_worker_process.assert_not_called()
+        with mock.patch('axon.traffic.supervisor.time.time',
+                        return_value=111):
+            self.supervisor.check()
+        self.assertEqual(1, self.controller._start_worker_process.call_count)
+        self.assertIsNone(self.supervisor.get_heartbeat('w1'))
+
+    def test_worker_without_heartbeat_is_restarted(self):
+        with mock.patch('axon.traffic.supervisor.time.time',
+                        return_value=129):
+            self.supervisor.check()
+        self.controller._start_worker_process.assert_not_called()
+        with mock.patch('axon.traffic.supervisor.time.time',
+                        return_value=131):
+            self.supervisor.check()
+        self.assertEqual(1, self.controller._start_worker_process.call_count)
+        self.assertEqual(1, self.controller.get_worker_health()[0][
+            'restarts'])
+
+    def test_stopped_worker_is_not_restarted(self):
+        self.context['process'].running = False
+        self.controller._workers_registry.delete('server_w1')
+        self.controller._restart_worker(self.context, 'server')
+        self.controller._start_worker_process.assert_not_called()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from collections import Counter
+import uuid
+
+from axon.tests import base as test_base
+from axon.traffic.placement import ConsistentHashRing, placement_skew
+
+
+class TestConsistentHashRing(test_base.BaseTestCase):
+    """
+    Test for consistent hash placement of rules on workers
+    """
+
+    def setUp(self):
+        super(TestConsistentHashRing, self).setUp()
+        self.ring = ConsistentHashRing()
+        for node in ('w1', 'w2', 'w3', 'w4'):
+            self.ring.add_node(node)
+        self.keys = [uuid.uuid4().hex for _ in range(20000)]
+
+    def test_even_spread(self):
+        counts = Counter(self.ring.get_node(key) for key in self.keys)
+        self.assertEqual({'w1', 'w2', 'w3', 'w4'}, set(counts))
+        self.assertLess(placement_skew(list(counts.values())), 1.25)
+
+    def test_minimal_moves(self):
+        before = {key: self.ring.get_node(key) for key in self.keys}
+        self.ring.add_node('w5')
+        after = {key: self.ring.get_node(key) for key in self.keys}
+        moved = [key for key in self.keys if before[key] != after[key]]
+        self.assertTrue(all(after[key] == 'w5' for key in moved))
+        self.assertLess(len(moved), len(self.keys) * 0.3)
+        self.ring.remove_node('w5')
+        self.assertEqual(before,
+                         {key: self.ring.get_node(key) for key in self.keys})
+
+    def test_empty_ring(self):
+        self.assertIsNone(ConsistentHashRing().get_node('key'))
+        self.assertEqual(0.0, placement_skew([0, 0]))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from axon.tests import base as test_base
+from axon.common.subscribers import SQLRecorder
+from axon.traffic.record_store import next_record_id, TrafficRecordStore
+from axon.traffic.traffic_objects import TrafficRecord
+
+
+class TestTrafficRecordStore(test_base.BaseTestCase):
+    """
+    Test for bulk insert of traffic records
+    """
+
+    def setUp(self):
+        super(TestTrafficRecordStore, self).setUp()
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.store = TrafficRecordStore(
+            'sqlite:///%s' % os.path.join(path, 'records.db'))
+        self.addCleanup(self.store.engine.dispose)
+
+    def test_sqlite_pragmas(self):
+        self.assertEqual('wal', self.store.engine.execute(
+            'PRAGMA journal_mode').scalar())
+        # NORMAL
+        self.assertEqual(1, self.store.engine.execute(
+            'PRAGMA synchronous').scalar())
+        self.assertLess(self.store.engine.execute(
+            'PRAGMA cache_size').scalar(), -2000)
+
+    def test_record_ids_sort_by_creation(self):
+        ids = [next_record_id() for _ in range(100)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(100, len(set(ids)))
+
+    def test_add_records_bulk(self):
+        rows = [('1.1.1.1', '2.2.2.%d' % i, 80, 'TCP', True, i, 1)
+                for i in range(10)]
+        self.assertEqual(10, self.store.add_records_bulk(rows, created=5))
+        self.assertEqual(0, self.store.add_records_bulk([]))
+        records = self.store.get_records(source='1.1.1.1')
+        self.assertEqual(10, len(records))
+        self.assertEqual(
+            sorted(rows), sorted(tuple(record)[1:8] for record in records))
+        self.assertEqual({5}, set(record.created for record in records))
+        stats = self.store.get_traffic_stats(start_time=0, end_time=10)
+        self.assertEqual((45, 10), tuple(stats[0]))
+
+    def test_sql_recorder(self):
+        recorder = SQLRecorder(self.store)
+        success = TrafficRecord.to_metric(
+            '1.1.1.1', '2.2.2.2', 80, 'TCP', True, True)
+        failure = TrafficRecord.to_metric(
+            '1.1.1.1', '2.2.2.2', 80, 'TCP', True, False)
+        other = TrafficRecord.to_metric(
+            '1.1.1.1', '3.3.3.3', 443, 'UDP', False, True)
+        with mock.patch.object(self.store, 'add_records_bulk') as bulk:
+            recorder.handle([{success: 4, failure: 2, other: 7}], 42)
+        self.assertEqual(
+            sorted([('1.1.1.1', '2.2.2.2', 80, 'TCP', True, 4, 2),
+                    ('1.1.1.1', '3.3.3.3', 443, 'UDP', False, 7, 0)]),
+            sorted(bulk.call_args[0][0]))
+        self.assertEqual({'created': 42}, bulk.call_args[1])
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import mock
+import os
+import pickle
+from threading import Thread
+import time
+
+from axon.common.exception import RPCTimeoutException
+from axon.tests import base as test_base
+from axon.traffic import rpc_server
+from axon.traffic.rpc_server import lock_free, RPCClient, RPCServer
+from axon.traffic.traffic_objects import RuleColumns, TrafficRule, \
+    TrafficServer
+
+
+class FakeHandler(object):
+
+    def __init__(self):
+        self.recorded = []
+
+    def echo(self, *args, **kwargs):
+        return args, kwargs
+
+    def fail(self):
+        raise ValueError("failed")
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return seconds
+
+    @lock_free
+    def count(self):
+        return 1
+
+    def record(self, value):
+        # Keep the handler lock long enough for other calls to queue up
+        time.sleep(0.005)
+        self.recorded.append(value)
+
+    @lock_free
+    def history(self):
+        return self.recorded
+
+    def get_affinity(self):
+        return os.sched_getaffinity(0)
+
+
+class TestRPCClient(test_base.BaseTestCase):
+    """
+    Test for worker RPC server and client
+    """
+
+    def setUp(self):
+        super(TestRPCClient, self).setUp()
+        self.server = RPCServer('test_rpc_server', FakeHandler())
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.client = RPCClient(self.server.address)
+        self.addCleanup(self.client.close)
+
+    def test_call(self):
+        self.assertEqual(((1, 2), {'a': 3}), self.client.echo(1, 2, a=3))
+
+    def test_wait_ready(self):
+        self.assertTrue(self.server.wait_ready(5))
+
+    def test_cpu_affinity(self):
+        cpu = min(os.sched_getaffinity(0))
+        server = RPCServer('test_pinned_server', FakeHandler(), cpus={cpu})
+        server.start()
+        self.addCleanup(server.stop)
+        client = RPCClient(server.address)
+        self.addCleanup(client.close)
+        self.assertEqual({cpu}, client.get_affinity())
+
+    def test_exception_is_raised(self):
+        self.assertRaises(ValueError, self.client.fail)
+
+    def test_connection_is_reused(self):
+        with mock.patch.object(rpc_server, 'Client',
+                               wraps=rpc_server.Client) as mock_client:
+            for i in range(5):
+                self.assertEqual(((i,), {}), self.client.echo(i))
+        self.assertEqual(1, mock_client.call_count)
+
+    def test_timeout(self):
+        self.assertRaises(RPCTimeoutException, self.client.call,
+                          'sleep', (0.5,), timeout=0.1)
+        self.assertEqual(((1,), {}), self.client.echo(1))
+
+    def test_lock_free_call_not_blocked_by_slow_call(self):
+        client = RPCClient(self.server.address, pool_size=2)
+        self.addCleanup(client.close)
+        slow = Thread(target=client.sleep, args=(1,))
+        slow.start()
+        self.addCleanup(slow.join)
+        time.sleep(0.1)
+        start = time.time()
+        self.assertEqual(1, client.count())
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_locked_calls_are_serialized(self):
+        client = RPCClient(self.server.address, pool_size=2)
+        self.addCleanup(client.close)
+        slow = Thread(target=client.sleep, args=(0.5,))
+        slow.start()
+        self.addCleanup(slow.join)
+        time.sleep(0.1)
+        start = time.time()
+        self.assertEqual(((1,), {}), client.echo(1))
+        self.assertGreater(time.time() - start, 0.2)
+
+    def test_pipelined_calls_run_in_order(self):
+        connection = rpc_server.Client(self.server.address)
+        self.addCleanup(connection.close)
+        for i in range(20):
+            connection.send_bytes(pickle.dumps((i, 'record', (i,), {})))
+        self.assertEqual(list(range(20)), sorted(
+            pickle.loads(connection.recv_bytes())[0] for _ in range(20)))
+        self.assertEqual(list(range(20)), self.client.history())
+
+    def test_multi_call(self):
+        results = self.client.multi_call(
+            [('echo', (1,)), ('fail', ()), ('count',), ('echo', (), {'a': 2})])
+        self.assertEqual(((1,), {}), results[0])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual([1, ((), {'a': 2})], results[2:])
+        self.assertEqual(((3,), {}), self.client.echo(3))
+
+    def test_multi_call_runs_in_order(self):
+        self.client.multi_call([('record', (i,)) for i in range(20)])
+        self.assertEqual(list(range(20)), self.client.history())
+
+    def test_multi_call_timeout(self):
+        self.assertRaises(RPCTimeoutException, self.client.multi_call,
+                          [('sleep', (0.5,)), ('count',)], timeout=0.1)
+
+    def test_call_async(self):
+        futures = [self.client.call_async('echo', (i,)) for i in range(3)]
+        self.assertEqual([((i,), {}) for i in range(3)],
+                         [future.result() for future in futures])
+        self.assertRaises(ValueError,
+                          self.client.call_async('fail').result)
+
+    def test_rule_lists_sent_in_columns(self):
+        rules = [TrafficRule(str(i), '1.1.1.1', '2.2.2.%d' % i, 80, 'TCP')
+                 for i in range(3)]
+        self.assertEqual(((rules, 'x'), {}), self.client.echo(rules, 'x'))
+        with RPCClient(self.server.address, compact_rules=False) as client:
+            self.assertEqual(((rules,), {}), client.echo(rules))
+
+
+class TestRuleColumns(test_base.BaseTestCase):
+    """
+    Test for columnar encoding of rule lists
+    """
+
+    def test_round_trip(self):
+        servers = [TrafficServer(str(i), '1.1.1.%d' % i, 80, 'HTTP',
+                                 response_profile={'size': i})
+                   for i in range(3)]
+        columns = pickle.loads(pickle.dumps(RuleColumns.from_rules(servers)))
+        self.assertEqual(3, len(columns))
+        decoded = columns.to_rules()
+        self.assertEqual(servers, decoded)
+        self.assertEqual([server.as_dict() for server in servers],
+                         [server.as_dict() for server in decoded])
+
+    def test_not_encodable(self):
+        server = TrafficServer('1', '1.1.1.1', 80, 'TCP')
+        rule = TrafficRule('2', '1.1.1.1', '2.2.2.2', 80, 'TCP')
+        self.assertIsNone(RuleColumns.from_rules([]))
+        self.assertIsNone(RuleColumns.from_rules([server, rule]))
+        self.assertIsNone(RuleColumns.from_rules(['a']))
+        self.assertIsNone(RuleColumns.from_rules((server,)))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import pickle
+
+import mock
+
+from axon.tests import base as test_base
+from axon.traffic.rule_set import RuleDelta, VersionedRuleSet
+from axon.traffic.traffic_objects import RuleColumns, TrafficRule, \
+    TrafficServer
+
+
+def rule(rule_id, request_count=1):
+    return TrafficRule(rule_id, '1.1.1.1', '2.2.2.%s' % rule_id, 80, 'TCP',
+                       request_count=request_count)
+
+
+def ids(rules):
+    return sorted(rule.id for rule in rules)
+
+
+class TestVersionedRuleSet(test_base.BaseTestCase):
+    """
+    Test for versioned rule sets and their deltas
+    """
+
+    def setUp(self):
+        super(TestVersionedRuleSet, self).setUp()
+        self.rule_set = VersionedRuleSet(max_history=3)
+
+    def test_update(self):
+        delta = self.rule_set.update([rule('1'), rule('2')])
+        self.assertEqual((0, 1), (delta.base_version, delta.version))
+        self.assertEqual(['1', '2'], ids(delta.added))
+        self.assertIsNone(self.rule_set.update([rule('1')]))
+        delta = self.rule_set.update([rule('1', 5)], [rule('2')])
+        self.assertEqual({'1'}, delta.changed)
+        self.assertEqual(['1', '2'], ids(delta.removed))
+        self.assertEqual(2, self.rule_set.version)
+        self.assertEqual(5, self.rule_set.get('1').request_count)
+
+    def test_delta_since(self):
+        self.rule_set.update([rule('1'), rule('2')])
+        self.rule_set.update([rule('3')], [rule('1')])
+        self.rule_set.update([rule('3', 2), rule('1')], [rule('2')])
+        delta = self.rule_set.delta_since(1)
+        self.assertEqual((1, 3, False),
+                         (delta.base_version, delta.version, delta.reset))
+        self.assertEqual(['3'], ids(delta.added))
+        self.assertEqual(['2'], ids(delta.removed))
+        delta = self.rule_set.delta_since(0)
+        self.assertEqual(['1', '3'], ids(delta.added))
+        self.assertEqual([], delta.removed)
+        self.assertEqual(0, len(self.rule_set.delta_since(3)))
+
+    def test_reset_when_history_truncated(self):
+        for i in range(5):
+            self.rule_set.update([rule(str(i))])
+        self.assertFalse(self.rule_set.delta_since(2).reset)
+        delta = self.rule_set.delta_since(1)
+        self.assertTrue(delta.reset)
+        self.assertEqual(['0', '1', '2', '3', '4'], ids(delta.added))
+        self.assertTrue(self.rule_set.delta_since(None).reset)
+
+
+class TestRuleDelta(test_base.BaseTestCase):
+    """
+    Test for pickling of rule deltas
+    """
+
+    def test_pickle_round_trip(self):
+        added = [rule(str(i), i) for i in range(5)]
+        removed = [rule('9')]
+        delta = RuleDelta(3, 4, added, removed)
+        with mock.patch.object(RuleColumns, 'from_rules',
+                               wraps=RuleColumns.from_rules) as encode:
+            payload = pickle.dumps(delta, pickle.HIGHEST_PROTOCOL)
+        self.assertEqual(2, encode.call_count)
+        copy = pickle.loads(payload)
+        self.assertEqual((3, 4, False), (copy.base_version, copy.version,
+                                         copy.reset))
+        self.assertEqual([r.as_dict() for r in added],
+                         [r.as_dict() for r in copy.added])
+        self.assertEqual([r.as_dict() for r in removed],
+                         [r.as_dict() for r in copy.removed])
+
+    def test_pickle_empty_and_mixed_rules(self):
+        mixed = [rule('1'), TrafficServer('2', '1.1.1.1', 80, 'TCP')]
+        copy = pickle.loads(pickle.dumps(RuleDelta(None, 1, mixed,
+                                                   reset=True)))
+        self.assertEqual([TrafficRule, TrafficServer],
+                         [type(r) for r in copy.added])
+        self.assertEqual([], copy.removed)
+        self.assertTrue(copy.reset)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+from axon.tests import base as test_base
+from axon.traffic.rules_cache import CachedTrafficRulesStore
+from axon.traffic.rules_store import TrafficRulesStore
+from axon.traffic.traffic_objects import TrafficRule, TrafficServer
+
+
+class TestCachedTrafficRulesStore(test_base.BaseTestCase):
+    """
+    Test that cached rules stay coherent with the database
+    """
+
+    def setUp(self):
+        super(TestCachedTrafficRulesStore, self).setUp()
+        self.store = TrafficRulesStore('sqlite://')
+        self.store.add_server_batch(
+            [TrafficServer('s1', '1.1.1.1', 80, 'TCP')])
+        self.cache = CachedTrafficRulesStore(self.store)
+        self.cache.upsert_server_batch(
+            [TrafficServer('s1', '1.1.1.1', 80, 'TCP'),
+             TrafficServer('s2', '1.1.1.1', 81, 'UDP'),
+             TrafficServer('s3', '2.2.2.2', 80, 'TCP')])
+        clients = [TrafficRule('c%d' % i, '1.1.1.1', '2.2.2.%d' % i, 80, 'TCP')
+                   for i in range(5)]
+        clients.append(
+            TrafficRule('c5', '2.2.2.2', '1.1.1.1', 81, 'UDP', False))
+        self.cache.upsert_client_batch(clients)
+
+    def assertCoherent(self):
+        def key(rule):
+            return sorted(rule.as_dict().items(), key=str)
+        self.assertEqual(sorted(map(key, self.store.get_servers())),
+                         sorted(map(key, self.cache.get_servers())))
+        self.assertEqual(sorted(map(key, self.store.get_clients())),
+                         sorted(map(key, self.cache.get_clients())))
+        reloaded = CachedTrafficRulesStore(self.store)
+        self.assertEqual(sorted(map(key, reloaded.get_clients())),
+                         sorted(map(key, self.cache.get_clients())))
+
+    def test_loaded_and_upserted(self):
+        self.assertEqual(3, len(self.cache.get_servers()))
+        servers = self.cache.get_servers(port='80', endpoint='1.1.1.1')
+        self.assertEqual('s1', servers[0].id)
+        self.assertCoherent()
+
+    def test_filters(self):
+        self.assertEqual(2, len(self.cache.get_servers(protocol='TCP')))
+        self.assertEqual(5, len(self.cache.get_clients(source='1.1.1.1')))
+        self.assertEqual(['c5'], [rule.id for rule in
+                                  self.cache.get_clients(allowed=False)])
+        self.assertEqual([], self.cache.get_clients(source='1.1.1.1',
+                                                    protocol='UDP'))
+
+    def test_enable_disable(self):
+        self.cache.disable_clients(source='1.1.1.1', destination='2.2.2.1')
+        self.assertEqual(['c1'], [rule.id for rule in
+                                  self.cache.get_clients(enabled=False)])
+        self.cache.disable_servers(port=80)
+        self.assertEqual(1, len(self.cache.get_servers(enabled=True)))
+        self.cache.enable_servers(endpoint='2.2.2.2')
+        self.cache.deny_clients(source='1.1.1.1', enabled=True)
+        self.cache.update_request_count(10, port=81)
+        self.cache.update_response_profile({'size': 1}, protocol='UDP')
+        self.assertEqual({'size': 1},
+                         self.cache.get_servers(port=81)[0].response_profile)
+        self.assertCoherent()
+
+    def test_delete(self):
+        self.cache.delete_servers('1.1.1.1', protocol='TCP')
+        self.cache.delete_clients('1.1.1.1', destination='2.2.2.0')
+        self.assertCoherent()
+        self.assertRaises(Exception, self.cache.delete_clients, '9.9.9.9')
+        self.cache.delete_all_clients()
+        self.cache.delete_all_servers()
+        self.assertEqual([], self.cache.get_clients())
+        self.assertCoherent()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import json
+import mock
+import os
+import tempfile
+
+from axon.tests import base as test_base
+from axon.traffic.rules_loader import TrafficRulesLoader
+from axon.traffic.rules_store import TrafficRulesStore
+
+
+def mesh_configs(sources, destinations):
+    for source in sources:
+        yield {'endpoint': source,
+               'servers': iter([(8080, 'HTTP'), ('9000', 'UDP')]),
+               'clients': ((destination, 8080, 'HTTP', True, True, 1)
+                           for destination in destinations)}
+
+
+class TestTrafficRulesLoader(test_base.BaseTestCase):
+    """
+    Test for chunked registration of traffic configs
+    """
+
+    def setUp(self):
+        super(TestTrafficRulesLoader, self).setUp()
+        self.store = TrafficRulesStore('sqlite://')
+        self.ips = ['10.0.0.%d' % i for i in range(1, 11)]
+
+    def test_load_in_chunks(self):
+        progress = mock.Mock()
+        loader = TrafficRulesLoader(self.store, chunk_size=7)
+        stats = loader.load(mesh_configs(self.ips, self.ips), progress)
+        self.assertEqual({'servers': 20, 'servers_added': 20,
+                          'clients': 100, 'clients_added': 100,
+                          'chunks': 18}, stats)
+        self.assertEqual(18, progress.call_count)
+        self.assertEqual(20, len(self.store.get_servers()))
+        self.assertEqual(100, len(self.store.get_clients()))
+        self.assertEqual(
+            [('10.0.0.1', 9000, 'UDP')],
+            [(server.endpoint, server.port, server.protocol) for server in
+             self.store.get_servers(endpoint='10.0.0.1', protocol='UDP')])
+
+    def test_duplicates_ignored(self):
+        loader = TrafficRulesLoader(self.store, chunk_size=3)
+        loader.load(mesh_configs(self.ips[:2], self.ips))
+        stats = loader.load(mesh_configs(self.ips + self.ips[:1], self.ips))
+        self.assertEqual(16, stats['servers_added'])
+        self.assertEqual(80, stats['clients_added'])
+        self.assertEqual(20, len(self.store.get_servers()))
+        self.assertEqual(100, len(self.store.get_clients()))
+
+    def test_read_configs_from_file(self):
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as config_file:
+            for config in mesh_configs(self.ips[:3], self.ips[:3]):
+                config = {key: list(value) if key != 'endpoint' else value
+                          for key, value in config.items()}
+                config_file.write(json.dumps(config) + '\n\n')
+        stats = TrafficRulesLoader(self.store).load(
+            TrafficRulesLoader.read_configs(path))
+        self.assertEqual(6, stats['servers_added'])
+        self.assertEqual(9, stats['clients_added'])
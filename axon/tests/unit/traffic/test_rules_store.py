@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import os
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+
+from axon.tests import base as test_base
+from axon.traffic.rules_store import TrafficRulesStore
+from axon.traffic.traffic_objects import TrafficRule, TrafficServer
+
+
+class TestTrafficRulesStore(test_base.BaseTestCase):
+    """
+    Test for unique rules and index backed queries of rules store
+    """
+
+    def setUp(self):
+        super(TestTrafficRulesStore, self).setUp()
+        self.store = TrafficRulesStore('sqlite://')
+
+    def _query_plan(self, query):
+        return ' '.join(row[-1] for row in self.store.engine.execute(
+            'EXPLAIN QUERY PLAN ' + query))
+
+    def test_upsert_skips_existing(self):
+        servers = [TrafficServer('1', '1.1.1.1', 80, 'TCP'),
+                   TrafficServer('2', '1.1.1.1', 80, 'TCP'),
+                   TrafficServer('3', '1.1.1.1', 80, 'UDP')]
+        self.assertEqual(2, self.store.upsert_server_batch(servers))
+        self.assertEqual(0, self.store.upsert_server_batch(servers[:1]))
+        clients = [TrafficRule('1', '1.1.1.1', '2.2.2.2', 80, 'TCP'),
+                   TrafficRule('2', '1.1.1.1', '2.2.2.2', 80, 'TCP', False)]
+        self.assertEqual(1, self.store.upsert_client_batch(clients))
+        self.assertEqual(1, len(self.store.get_clients()))
+
+    def test_add_duplicate_server(self):
+        self.store.add_server(TrafficServer('1', '1.1.1.1', 80, 'TCP'))
+        self.assertRaises(IntegrityError, self.store.add_server,
+                          TrafficServer('2', '1.1.1.1', 80, 'TCP'))
+
+    def test_filters_use_index(self):
+        for column in ('endpoint', 'port', 'protocol', 'enabled'):
+            self.assertIn('USING INDEX', self._query_plan(
+                'SELECT * FROM servers WHERE %s = 1' % column))
+        for column in ('source', 'destination', 'port', 'protocol',
+                       'enabled', 'allowed'):
+            self.assertIn('USING INDEX', self._query_plan(
+                'SELECT * FROM clients WHERE %s = 1' % column))
+
+    def test_columns_added_to_existing_tables(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        url = 'sqlite:///%s' % path
+        # Servers table as created before response profiles
+        create_engine(url).execute(
+            'CREATE TABLE servers (id VARCHAR NOT NULL, endpoint VARCHAR '
+            'NOT NULL, port INTEGER NOT NULL, protocol VARCHAR NOT NULL, '
+            'enabled BOOLEAN NOT NULL, PRIMARY KEY (id))')
+        create_engine(url).execute(
+            "INSERT INTO servers VALUES ('1', '1.1.1.1', 80, 'TCP', 1)")
+        store = TrafficRulesStore(url)
+        servers = store.get_servers()
+        self.assertEqual(['1'], [server.id for server in servers])
+        self.assertIsNone(servers[0].response_profile)
+        store.add_server(TrafficServer('2', '1.1.1.2', 80, 'HTTP',
+                                       response_profile={'size': 10}))
+        self.assertEqual({'size': 10}, store.get_servers(
+            endpoint='1.1.1.2')[0].response_profile)
+
+    def test_indexes_added_to_existing_tables(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        url = 'sqlite:///%s' % path
+        create_engine(url).execute(
+            'CREATE TABLE servers (id VARCHAR PRIMARY KEY, endpoint VARCHAR, '
+            'port INTEGER, protocol VARCHAR, enabled BOOLEAN, '
+            'response_profile BLOB)')
+        store = TrafficRulesStore(url)
+        self.assertEqual(1, store.upsert_server_batch(
+            [TrafficServer('1', '1.1.1.1', 80, 'TCP'),
+             TrafficServer('2', '1.1.1.1', 80, 'TCP')]))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+
+import mock
+
+from axon.tests import base as test_base
+from axon.traffic.worker_pool import WarmWorkerPool
+
+
+class TestWarmWorkerPool(test_base.BaseTestCase):
+
+    def setUp(self):
+        super(TestWarmWorkerPool, self).setUp()
+        self.started = []
+        self.pool = WarmWorkerPool(self._start_worker, size=2)
+
+    def _start_worker(self):
+        process = mock.Mock()
+        process.is_running.return_value = True
+        context = {'uid': 'w%d' % len(self.started), 'process': process}
+        self.started.append(context)
+        return context
+
+    def test_fill(self):
+        self.pool.fill(wait=True)
+        self.assertEqual(2, len(self.pool))
+        self.pool.fill(wait=True)
+        self.assertEqual(2, len(self.started))
+
+    def test_acquire_refills(self):
+        self.pool.fill(wait=True)
+        context = self.pool.acquire()
+        self.assertEqual('w0', context['uid'])
+        self.pool.fill(wait=True)
+        self.assertEqual(2, len(self.pool))
+        self.assertEqual(3, len(self.started))
+
+    def test_acquire_skips_dead_workers(self):
+        self.pool.fill(wait=True)
+        self.started[0]['process'].is_running.return_value = False
+        self.assertEqual('w1', self.pool.acquire()['uid'])
+
+    def test_acquire_empty_pool(self):
+        self.pool._size = 0
+        self.assertIsNone(self.pool.acquire())
+
+    def test_close(self):
+        self.pool.fill(wait=True)
+        self.pool.close()
+        self.assertEqual(0, len(self.pool))
+        for context in self.started:
+            context['process'].stop.assert_called_once_with()
+        self.pool.fill(wait=True)
+        self.assertEqual(2, len(self.started))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+from collections import Counter
+import glob
+import logging
+import os
+from threading import Lock
+
+from axon.common.config import WORKER_CPU_AFFINITY, WORKER_CPUS
+
+log = logging.getLogger(__name__)
+
+NODE_CPULIST = '/sys/devices/system/node/node*/cpulist'
+
+
+def parse_cpu_list(cpu_list):
+    """
+    Parse a cpu list like '0-3,8,10-11'
+    :rtype: list
+    """
+    cpus = []
+    for part in cpu_list.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """
+    Get CPUs of every NUMA node, a single node with all CPUs if the
+    topology is unknown
+    :rtype: dict
+    """
+    nodes = {}
+    for path in glob.glob(NODE_CPULIST):
+        node = int(os.path.basename(os.path.dirname(path))[len('node'):])
+        with open(path) as cpulist:
+            nodes[node] = parse_cpu_list(cpulist.read())
+    return nodes or {0: available_cpus()}
+
+
+def set_cpu_affinity(cpus):
+    """Pin calling process, and threads it starts later, to cpus"""
+    try:
+        os.sched_setaffinity(0, cpus)
+    except (AttributeError, OSError) as ex:
+        log.warning("Failed to pin process to cpus %s: %s", cpus, ex)
+
+
+class CpuAllocator(object):
+    """
+    Assigns CPUs to worker processes.
+
+    Policies:
+      none - workers are not pinned
+      core - every worker gets a dedicated core, cores are shared only
+             once every core has a worker
+      numa - as core, but servers and clients use different NUMA nodes,
+             or different halves of the cores on a single node host
+    """
+
+    POLICIES = ('none', 'core', 'numa')
+
+    def __init__(self, policy=WORKER_CPU_AFFINITY, cpus=None, nodes=None):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown cpu affinity policy %s" % policy)
+        if policy != 'none' and not hasattr(os, 'sched_setaffinity'):
+            log.warning("CPU affinity is not supported on this platform")
+            policy = 'none'
+        self.policy = policy
+        if cpus is None:
+            cpus = parse_cpu_list(WORKER_CPUS) if WORKER_CPUS else \
+                available_cpus()
+        cpus = sorted(cpus)
+        nodes = numa_nodes() if nodes is None else nodes
+        nodes = {node: [cpu for cpu in node_cpus if cpu in cpus]
+                 for node, node_cpus in nodes.items()}
+        self._nodes = {node: node_cpus for node, node_cpus in nodes.items()
+                       if node_cpus}
+        self._pools = self._split(cpus)
+        self._assigned = {}
+        self._lock = Lock()
+
+    def _split(self, cpus):
+        if self.policy != 'numa':
+            return {'server': cpus, 'client': cpus}
+        if len(self._nodes) > 1:
+            ordered = sorted(self._nodes)
+            half = len(ordered) // 2
+            return {
+                'server': [cpu for node in ordered[:half]
+                           for cpu in self._nodes[node]],
+                'client': [cpu for node in ordered[half:]
+                           for cpu in self._nodes[node]]}
+        half = len(cpus) // 2
+        if not half:
+            return {'server': cpus, 'client': cpus}
+        return {'server': cpus[:half], 'client': cpus[half:]}
+
+    def allocate(self, uid, worker_type="server"):
+        """
+        Get CPUs of a worker, a worker keeps its CPUs until released
+        :return: cpus, None if workers are not pinned
+        :rtype: set
+        """
+        if self.policy == 'none':
+            return None
+        with self._lock:
+            if uid in self._assigned:
+                return self._assigned[uid][1]
+            usage = Counter(cpu for _, cpus in self._assigned.values()
+                            for cpu in cpus)
+            cpu = min(self._pools[worker_type],
+                      key=lambda cpu: (usage[cpu], cpu))
+            self._assigned[uid] = (worker_type, {cpu})
+            return {cpu}
+
+    def release(self, uid):
+        with self._lock:
+            self._assigned.pop(uid, None)
+
+    def get_node(self, cpu):
+        for node, node_cpus in self._nodes.items():
+            if cpu in node_cpus:
+                return node
+        return None
+
+    def placement(self):
+        """
+        Get CPUs and NUMA nodes of every pinned worker
+        :rtype: dict
+        """
+        with self._lock:
+            return {uid: {'type': worker_type, 'cpus': sorted(cpus),
+                          'nodes': sorted({self.get_node(cpu)
+                                           for cpu in cpus})}
+                    for uid, (worker_type, cpus) in self._assigned.items()}
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+import math
+
+from axon.common.config import WORKER_MIN_COUNT, WORKER_MAX_COUNT, \
+    WORKER_CPU_HIGH, WORKER_CPU_LOW, WORKER_LOOP_LAG_HIGH
+
+
+class WorkerAutoscaler(object):
+    """
+    Decides how many workers of one type should run. The rule count sets
+    a floor of one worker per `rules_per_worker` rules. Above that, a
+    worker over `cpu_high` percent CPU or `lag_high` seconds of p99 loop
+    lag adds one worker, and when every worker is below `cpu_low` one
+    worker is removed. Scaling out on rule count is immediate, scaling in
+    goes one worker at a time.
+    """
+
+    def __init__(self, rules_per_worker, min_workers=WORKER_MIN_COUNT,
+                 max_workers=WORKER_MAX_COUNT, cpu_high=WORKER_CPU_HIGH,
+                 cpu_low=WORKER_CPU_LOW, lag_high=WORKER_LOOP_LAG_HIGH):
+        self.rules_per_worker = rules_per_worker
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.lag_high = lag_high
+
+    def _bound(self, count):
+        return min(self.max_workers, max(self.min_workers, count))
+
+    def count_for_rules(self, rules):
+        """
+        Get number of workers needed for a number of rules
+        :param rules: number of rules
+        :type rules: int
+        :rtype: int
+        """
+        if not rules:
+            return 0
+        return self._bound(int(math.ceil(
+            float(rules) / self.rules_per_worker)))
+
+    def _is_busy(self, load):
+        return (load.get('cpu') or 0) > self.cpu_high or \
+            (load.get('lag') or 0) > self.lag_high
+
+    def _is_idle(self, load):
+        # No CPU sample yet, e.g. right after a restart, is not idle
+        cpu = load.get('cpu')
+        return cpu is not None and cpu < self.cpu_low and \
+            (load.get('lag') or 0) <= self.lag_high / 2
+
+    def desired_count(self, current, rules, loads=()):
+        """
+        Get number of workers which should run
+        :param current: number of running workers
+        :type current: int
+        :param rules: number of rules placed on the workers
+        :type rules: int
+        :param loads: load of each running worker, a dict with 'cpu'
+            percent and p99 event loop 'lag' in seconds, None if unknown
+        :type loads: list
+        :rtype: int
+        """
+        if not rules:
+            # Idle workers are kept, stopping traffic removes them
+            return min(current, self.max_workers)
+        by_rules = self.count_for_rules(rules)
+        if any(self._is_busy(load) for load in loads):
+            target = current + 1
+        elif loads and all(self._is_idle(load) for load in loads):
+            target = current - 1
+        else:
+            target = current
+        return self._bound(max(target, by_rules))
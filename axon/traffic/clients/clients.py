@@ -40,7 +40,8 @@ class TCPClient(Client):
     PROTOCOL = "TCP"
 
     def __init__(self, source, destination, port, metric_cache,
-                 connected=True, action=1, request_count=1):
+                 connected=True, action=1, request_count=1,
+                 namespace=None, ns_executor=None):
         """
         Client to send TCP requests
         :param source: source ip
@@ -56,6 +57,11 @@ class TCPClient(Client):
         :type action: int
         :param record_queue: traffic record queue
         :type record_queue: queue.Queue
+        :param namespace: namespace owning the source ip, sockets are
+                          created inside it when given
+        :type namespace: str
+        :param ns_executor: helper which creates sockets in namespace
+        :type ns_executor: NamespaceExecutor
         """
         self._source = source
         self._port = port
@@ -65,6 +71,8 @@ class TCPClient(Client):
         self._request_count = request_count
         self._connected = connected
         self._action = action
+        self._namespace = namespace
+        self._ns_executor = ns_executor
         self.log = logging.getLogger(__name__)
 
     def _create_socket(self, address_family=socket.AF_INET,
@@ -78,7 +86,13 @@ class TCPClient(Client):
         :return: created socket
         :rtype: socket object
         """
-        sock = socket.socket(address_family, socket_type)
+        if self._namespace:
+            # Socket keeps the namespace it was created in, so only
+            # creation has to happen inside the namespace.
+            sock = self._ns_executor.run(
+                self._namespace, socket.socket, address_family, socket_type)
+        else:
+            sock = socket.socket(address_family, socket_type)
         sock.settimeout(10)
         return sock
 
@@ -234,11 +248,30 @@ class HTTPClient(TCPClient):
         response = session.get(url)
         return response.status_code
 
+    def _use_namespace_socket(self):
+        """
+        Send GET request over a socket created in the source namespace,
+        urllib and requests always create sockets in the current one.
+        """
+        sock = self._create_socket()
+        try:
+            sock.connect((self._destination, self._port))
+            sock.sendall(("GET / HTTP/1.1\r\nHost: %s:%s\r\n"
+                          "Connection: close\r\n\r\n" %
+                          (self._destination, self._port)).encode())
+            with sock.makefile('rb') as response:
+                status_line = response.readline()
+            return int(status_line.split()[1])
+        finally:
+            sock.close()
+
     def _send_receive(self, session=None):
         url = 'http://%s:%s' % (self._destination, self._port)
         status = None
 
         def get_response():
+            if self._namespace:
+                return self._use_namespace_socket()
             if session:
                 return self._use_session(session, url)
             else:
@@ -257,7 +290,7 @@ class HTTPClient(TCPClient):
                                self._destination, self._port)
                 time.sleep(1)
                 status = get_response()
-                if status.code != 200:
+                if status != 200:
                     raise Exception(
                         "HTTP Request failed with status %s" % status)
             except Exception:
@@ -268,7 +301,8 @@ class HTTPClient(TCPClient):
                 raise
 
     def ping(self):
-        session = requests.Session() if self._request_count > 1 else None
+        session = requests.Session() if self._request_count > 1 and \
+            not self._namespace else None
         for _ in range(self._request_count):
             try:
                 self._start_time = datetime.datetime.now()
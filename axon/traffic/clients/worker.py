@@ -1,11 +1,17 @@
+import platform
 from threading import Event, Lock, Thread
 import time
 
 
+from axon.common.config import NAMESPACE_MODE, NAMESPACE_SHARED_CLIENTS
 from axon.common.executor import BoundedThreadPoolExecutor
 from axon.common.metric_cache import ExchangeReporter, MetricsCache
 from axon.traffic.clients.clients import HTTPClient, TCPClient, UDPClient
+from axon.traffic.rpc_server import lock_free
 from axon.traffic.traffic_objects import TrafficRuleCollection
+from axon.utils.network_utils import NamespaceManager
+if "Linux" in platform.uname():  # noqa
+    from axon.utils.nsenter import NamespaceExecutor
 
 
 class HeartBeatSender(Thread):
@@ -39,6 +45,10 @@ class TrafficGenWorker(object):
     Handler which handles all traffic client related operations. Exposes
     its APIs via RPCServer. APIs can be accessed by using RPCClient by
     providing RPCServers address.
+
+    In namespace mode a single worker drives rules of every namespace,
+    client sockets are created inside the namespace owning the rule
+    source through a namespace helper thread.
     """
 
     def __init__(self, uid, hb_queue, exchange):
@@ -53,6 +63,9 @@ class TrafficGenWorker(object):
         self._uid = uid
         self._hb_interval = 5
         self._metric_cache = MetricsCache()
+        self._ns_executor = None
+        self._endpoint_ns_map = None
+        self._rules_version = 0
 
     def initialize(self):
         """
@@ -74,6 +87,16 @@ class TrafficGenWorker(object):
         with self._stop_lock:
             return self._run_event.is_set()
 
+    def _get_namespace(self, source):
+        """Get namespace owning source IP, None if not in a namespace"""
+        if not (NAMESPACE_MODE and NAMESPACE_SHARED_CLIENTS):
+            return None
+        if self._endpoint_ns_map is None:
+            self._endpoint_ns_map = \
+                NamespaceManager().get_endpoint_namespace_map()
+            self._ns_executor = NamespaceExecutor()
+        return self._endpoint_ns_map.get(source)
+
     def _generate_traffic(self, stop_event, callback):
         """
         Generate traffic in infinite loop
@@ -98,7 +121,9 @@ class TrafficGenWorker(object):
                     continue
                 sender = client(rule.source, rule.destination,
                                 rule.port, self._metric_cache, True,
-                                rule.allowed, rule.request_count)
+                                rule.allowed, rule.request_count,
+                                self._get_namespace(rule.source),
+                                self._ns_executor)
                 self._pool.submit(sender.ping)
             except Exception as ex:
                 print(ex)
@@ -144,10 +169,37 @@ class TrafficGenWorker(object):
                 self._stop_event.set()
         self._rule_collections.clear_rules()
 
+    def apply_delta(self, delta):
+        """
+        Apply a rule set delta sent by controller
+        :param delta: rules removed and added since delta.base_version
+        :type delta: axon.traffic.rule_set.RuleDelta
+        :return: rules version of this worker, it differs from
+                 delta.version if delta was not made for current version
+        :rtype: int
+        """
+        if delta.reset:
+            self._rule_collections.clear_rules()
+        elif delta.base_version != self._rules_version:
+            return self._rules_version
+        self.delete_clients(
+            [rule for rule in delta.removed if rule in self._rule_collections])
+        if delta.added:
+            self.add_clients(delta.added)
+        self._rules_version = delta.version
+        return self._rules_version
+
+    @lock_free
+    def get_rules_version(self):
+        """Get version of rule set last applied by this worker"""
+        return self._rules_version
+
+    @lock_free
     def get_rule_count(self):
         """Get the number of rules managed by this worker"""
         return self._rule_collections.get_rule_count()
 
+    @lock_free
     def has_rule(self, rule):
         """Check if this worker is owner of a rule"""
         return rule in self._rule_collections
@@ -1,179 +1,523 @@
-from collections import defaultdict
+import functools
 import logging
-import math
-from multiprocessing import cpu_count, Queue
+from multiprocessing import Queue
+from threading import RLock
+import time
 import uuid
 
+import psutil
+
+from axon.common.config import RPC_CALL_TIMEOUT, SERVER_RULES_PER_WORKER, \
+    CLIENT_RULES_PER_WORKER, WORKER_MIN_COUNT, WORKER_READY_TIMEOUT
 from axon.common.local_cache import MemCache
+from axon.traffic.affinity import CpuAllocator
+from axon.traffic.autoscaler import WorkerAutoscaler
+from axon.traffic.placement import ConsistentHashRing, placement_skew
 from axon.traffic.rpc_server import RPCClient, RPCServer
+from axon.traffic.rule_set import VersionedRuleSet
+from axon.traffic.supervisor import WorkerSupervisor
+from axon.traffic.worker_pool import WarmWorkerPool
 from axon.traffic.clients.worker import TrafficGenWorker
 from axon.traffic.servers.worker import TrafficServerWorker
 
-CLIENT_WORKER_COUNT = min(2, cpu_count() or 1)
-SERVER_WORKER_COUNT = min(2, cpu_count() or 1)
+# Rounds of missed updates sent to a lagging worker in one push
+DELTA_PUSH_ATTEMPTS = 3
 
 
 class TrafficController(object):
     log = logging.getLogger(__name__)
 
-    def __init__(self, exchange, rules_registry=None, workers_registry=None):
+    def __init__(self, exchange, rules_registry=None, workers_registry=None,
+                 lag_exchange=None):
         self._rules_registry = rules_registry if rules_registry else MemCache()
         self._workers_registry = workers_registry if workers_registry else MemCache()
         self._heartbeat_queue = Queue()
         self._exchange = exchange
+        self._lag_exchange = lag_exchange
+        self._rings = {'server': ConsistentHashRing(),
+                       'client': ConsistentHashRing()}
+        # Number of workers to run, changed by autoscaling
+        self._worker_counts = {'server': WORKER_MIN_COUNT,
+                               'client': WORKER_MIN_COUNT}
+        self._autoscalers = {
+            'server': WorkerAutoscaler(SERVER_RULES_PER_WORKER),
+            'client': WorkerAutoscaler(CLIENT_RULES_PER_WORKER)}
+        self._warm_pools = {
+            worker_type: WarmWorkerPool(
+                functools.partial(self._start_idle_worker, worker_type))
+            for worker_type in ('server', 'client')}
+        self._cpu_allocator = CpuAllocator()
+        self._supervisor = None
+        # Serializes changes of workers and their rules
+        self._workers_lock = RLock()
 
     @staticmethod
     def _get_worker_context():
-        return {'uid': str(uuid.uuid4().hex)}
+        return {'uid': str(uuid.uuid4().hex), 'rules': VersionedRuleSet()}
 
     @staticmethod
-    def _create_worker(name, handler):
+    def _create_worker(name, handler, cpus=None):
         """Create worker process"""
-        worker = RPCServer(name, handler)
+        worker = RPCServer(name, handler, cpus=cpus)
         worker.start()
         return worker
 
+    @staticmethod
+    def _get_client(context):
+        """Get RPC client of a worker, one client is cached per worker"""
+        client = context.get('client')
+        if client is None:
+            client = RPCClient(context.get('address'),
+                               timeout=RPC_CALL_TIMEOUT)
+            context['client'] = client
+        return client
+
     def _get_all_workers(self, worker_type='server'):
         """get all workers from registry by a given type"""
         return [
             worker for worker in self._workers_registry.get_all_keys() if
             worker.startswith(worker_type)]
 
-    def _get_all_rules(self, rule_type="server"):
-        return [
-            rule for rule in self._rules_registry.get_all_keys() if
-            rule.startswith(rule_type)]
+    def _get_worker_contexts(self, worker_type='server'):
+        """get contexts of all workers of a given type"""
+        return [self._workers_registry.get(worker) for worker in
+                self._get_all_workers(worker_type)]
 
-    def _add_rules_to_existing_workers(
-            self, new_rules, rules_per_worker, worker_type="server"):
-        """Add Rules to existing workers"""
-        for worker, index in enumerate(self._get_all_workers(worker_type)):
-            context = self._workers_registry.get(worker)
-            start = rules_per_worker * index
-            end = start + rules_per_worker
-            rules = new_rules[start:end]
-            if rules:
-                client = RPCClient(context.get('address'))
-                if worker_type == 'server':
-                    client.add_servers(rules)
-                else:
-                    client.add_clients(rules)
-                # add rule --> worker relationship in registry, so that
-                # rules can be controlled later
-                for rule in rules:
-                    if worker_type == "server":
-                        key = "server_%s" % rule.id
-                    else:
-                        key = "client_%s" % rule.id
-                    self._rules_registry.add(key, context)
-
-    def _create_workers_and_add_rules(
-            self, new_rules, workers_to_be_created,
-            rules_per_worker, worker_type="server"):
-        """Create new workers and add servers"""
-        for i in range(workers_to_be_created):
+    def _call_workers(self, calls):
+        """
+        Call workers in parallel and wait until all of them answer, so
+        the time taken is bounded by the slowest worker
+        :param calls: calls as (worker context, method, args)
+        :type calls: list
+        :return: results, or exceptions raised by the call, in order of calls
+        :rtype: list
+        """
+        futures = [self._get_client(context).call_async(method, args)
+                   for context, method, args in calls]
+        results = []
+        for future in futures:
             try:
-                context = self._get_worker_context()
-                start = rules_per_worker * i
-                end = start + rules_per_worker
-                rules = new_rules[start:end]
-                # If no rules, exit from here
-                if not rules:
-                    break
-                if worker_type == "server":
-                    handler = TrafficServerWorker(context['uid'])
-                else:
-                    handler = TrafficGenWorker(
-                        context['uid'], self._heartbeat_queue, self._exchange)
-                # Start the Worker
-                name = "axon_%s_worker_%s" % (worker_type, context['uid'])
-                worker = self._create_worker(name, handler)
-                context.update({'address': worker.address, 'process': worker})
-
-                # Add the workers info in registry
-                key = 'server_%s' % context['uid']
-                if worker_type == "server":
-                    key = 'server_%s' % context['uid']
-                else:
-                    key = 'client_%s' % context['uid']
-                self._workers_registry.add(key, context)
-
-                # add rule to worker and start the traffic
-                client = RPCClient(context.get('address'))
-                if worker_type == 'server':
-                    client.add_servers(rules)
-                else:
-                    client.add_clients(rules)
-
-                # add rule --> worker relationship in registry, so that
-                # rules can be controlled later
-                for rule in rules:
-                    if worker_type == "server":
-                        key = "server_%s" % rule.id
-                    else:
-                        key = "client_%s" % rule.id
-                    self._rules_registry.add(key, context)
+                results.append(future.result())
             except Exception as ex:
-                print(ex)
+                results.append(ex)
+        return results
 
-    def _delete_rule_from_worker(self, rules, worker_type="server"):
-        """Delete and stop rules if its running"""
-        # Prepare workers to rule mapping
-        workers_rule_map = defaultdict(list)
-        for rule in rules:
-            rule_key = "%s_%s" % (worker_type, rule.id)
-            rule_owner_context = self._rules_registry.get(rule_key)
-            if rule_owner_context:
-                workers_rule_map[rule_owner_context['uid']].append(rule)
+    def _push_deltas(self, deltas):
+        """
+        Send rule set deltas to workers in parallel. A worker which is
+        behind the base version of its delta, e.g. because it missed an
+        update or was restarted, gets the delta since its own version.
+        :param deltas: (worker context, delta) pairs, None deltas are
+                       skipped
+        :type deltas: list
+        """
+        deltas = [(context, delta) for context, delta in deltas if delta]
+        for _ in range(DELTA_PUSH_ATTEMPTS):
+            if not deltas:
+                return
+            results = self._call_workers(
+                [(context, 'apply_delta', (delta,))
+                 for context, delta in deltas])
+            retry = []
+            for (context, delta), result in zip(deltas, results):
+                if isinstance(result, Exception):
+                    self.log.error("Failed to update rules of worker %s: %s",
+                                   context['uid'], result)
+                elif result < delta.version and not delta.reset:
+                    self.log.warning(
+                        "Worker %s is at rules version %s instead of %s, "
+                        "sending missed updates", context['uid'], result,
+                        delta.base_version)
+                    retry.append(
+                        (context, context['rules'].delta_since(result)))
+            deltas = retry
+        for context, _ in deltas:
+            self.log.error("Rules of worker %s are still out of date",
+                           context['uid'])
 
-        # delete rules on worker side
-        for worker, rules in workers_rule_map.items():
-            context = self._workers_registry.get(worker)
-            client = RPCClient(context.get('address'))
-            if worker_type == "server":
-                client.delete_servers(rules)
-            else:
-                client.delete_clients(rules)
-            # delete from registry
-            rule_keys = ["%s_%s" % (worker_type, rule.id) for rule in rules]
-            self._rules_registry.delete_many(rule_keys)
+    def _update_worker_rules(self, updates, worker_type="server"):
+        """
+        Update rule sets of workers and push resulting deltas to them
+        :param updates: (worker context, added rules, removed rules)
+        :type updates: list
+        """
+        deltas = []
+        for context, added, removed in updates:
+            deltas.append((context, context['rules'].update(added, removed)))
+            self._rules_registry.delete_many(
+                ["%s_%s" % (worker_type, rule.id) for rule in removed])
+        # keep rule --> worker relationship in registry, so that rules
+        # can be controlled later. Done after removals, as a moved rule
+        # is removed from one worker and added to another.
+        for context, added, _ in updates:
+            for rule in added:
+                self._rules_registry.add(
+                    "%s_%s" % (worker_type, rule.id), context)
+        self._push_deltas(deltas)
 
-    def _delete_all_rules_from_workers(self, worker_type="server"):
-        for worker in self._get_all_workers(worker_type):
-            # Stop traffic
-            context = self._workers_registry.get(worker)
-            client = RPCClient(context.get('address'))
-            if worker_type == "server":
-                client.delete_all_servers()
+    def _split_rules(self, rules, worker_type="server"):
+        """
+        Split rules into new ones and rules already owned by a worker,
+        which are grouped by owner
+        :return: new rules and (worker context, owned rules) pairs
+        :rtype: tuple
+        """
+        new_rules = []
+        owned = {}
+        for rule in rules:
+            context = self._rules_registry.get(
+                "%s_%s" % (worker_type, rule.id))
+            if context is None:
+                new_rules.append(rule)
             else:
-                client.delete_all_clients()
-            # Stop Server
+                owned.setdefault(context['uid'], (context, []))[1].append(rule)
+        return new_rules, list(owned.values())
+
+    def _create_handler(self, uid, worker_type="server"):
+        if worker_type == "server":
+            return TrafficServerWorker(uid, self._lag_exchange,
+                                       self._heartbeat_queue)
+        return TrafficGenWorker(uid, self._heartbeat_queue, self._exchange)
+
+    def _start_worker_process(self, context, worker_type="server"):
+        """Start worker process serving the worker of a context"""
+        handler = self._create_handler(context['uid'], worker_type)
+        name = "axon_%s_worker_%s" % (worker_type, context['uid'])
+        cpus = self._cpu_allocator.allocate(context['uid'], worker_type)
+        worker = self._create_worker(name, handler, cpus)
+        if not worker.wait_ready(WORKER_READY_TIMEOUT):
+            self.log.warning("%s worker %s not ready after %s seconds",
+                             worker_type, context['uid'],
+                             WORKER_READY_TIMEOUT)
+        context.update({'address': worker.address, 'process': worker,
+                        'started': time.time()})
+
+    def _start_idle_worker(self, worker_type="server"):
+        """Start a worker without rules, it is ready when returned"""
+        context = self._get_worker_context()
+        self._start_worker_process(context, worker_type)
+        return context
+
+    def _create_workers(self, count, worker_type="server"):
+        """
+        Create workers and add them to placement ring, idle workers of
+        the warm pool are used first
+        """
+        self._start_supervisor()
+        for _ in range(count):
+            try:
+                context = self._warm_pools[worker_type].acquire() or \
+                    self._start_idle_worker(worker_type)
+                self._register_worker(context, worker_type)
+            except Exception:
+                self.log.exception("Failed to create %s worker", worker_type)
+
+    def warm_up(self, wait=False):
+        """
+        Start idle workers of warm pools, so first rules do not wait for
+        worker processes to start
+        :param wait: whether to wait until idle workers are ready
+        :type wait: bool
+        """
+        self._start_supervisor()
+        for pool in self._warm_pools.values():
+            pool.fill(wait)
+
+    def stop_warm_pools(self):
+        """Stop idle workers of warm pools"""
+        for pool in self._warm_pools.values():
+            for context in pool.close():
+                self._cpu_allocator.release(context['uid'])
+
+    def _start_supervisor(self):
+        if self._supervisor is None:
+            self._supervisor = WorkerSupervisor(self, self._heartbeat_queue)
+            self._supervisor.start()
+
+    def _restart_worker(self, context, worker_type="server"):
+        """
+        Replace worker process of a context by a new one and push all
+        rules of the worker to it. The worker keeps its uid, so its place
+        on the placement ring and its rules do not change.
+        """
+        with self._workers_lock:
+            worker = '%s_%s' % (worker_type, context['uid'])
+            if self._workers_registry.get(worker) is not context:
+                # Worker was stopped meanwhile
+                return
+            self.log.warning("Restarting %s worker %s with %d rules",
+                             worker_type, context['uid'],
+                             len(context['rules']))
+            client = context.pop('client', None)
+            if client:
+                client.close()
+            process = context.get('process')
+            if process is not None:
+                process.stop()
+            self._start_worker_process(context, worker_type)
+            context['restarts'] = context.get('restarts', 0) + 1
+        self._push_deltas([(context, context['rules'].delta_since(None))])
+
+    def get_worker_health(self):
+        """
+        Get health of all workers, including restarts and last heartbeat
+        :rtype: list
+        """
+        health = []
+        for worker_type in ('server', 'client'):
+            for context in self._get_worker_contexts(worker_type):
+                process = context.get('process')
+                heartbeat = self._supervisor.get_heartbeat(context['uid']) \
+                    if self._supervisor else None
+                healthy = self._supervisor.is_healthy(context) \
+                    if self._supervisor else False
+                health.append({
+                    'uid': context['uid'], 'type': worker_type,
+                    'alive': bool(process and process.is_running()),
+                    'healthy': healthy,
+                    'heartbeat_age': (time.time() - heartbeat[0]
+                                      if heartbeat else None),
+                    'reported_rules': heartbeat[1] if heartbeat else None,
+                    'rules': len(context['rules']),
+                    'restarts': context.get('restarts', 0)})
+        return health
+
+    def _register_worker(self, context, worker_type="server"):
+        """Add the workers info in registry and placement ring"""
+        self._workers_registry.add(
+            '%s_%s' % (worker_type, context['uid']), context)
+        self._rings[worker_type].add_node(context['uid'])
+
+    def _place_rules(self, rules, worker_type="server"):
+        """
+        Assign rules to workers by consistent hashing of rule id
+        :return: (worker context, rules) pairs
+        :rtype: list
+        """
+        contexts = {context['uid']: context for context in
+                    self._get_worker_contexts(worker_type)}
+        ring = self._rings[worker_type]
+        placement = {}
+        for rule in rules:
+            uid = ring.get_node(rule.id)
+            if uid in contexts:
+                placement.setdefault(uid, []).append(rule)
+        return [(contexts[uid], worker_rules)
+                for uid, worker_rules in placement.items()]
+
+    def _start_rules(self, rules, worker_type="server"):
+        """Start rules which are not running and update changed ones"""
+        with self._workers_lock:
+            new_rules, owned = self._split_rules(rules, worker_type)
+            updates = [(context, worker_rules, ())
+                       for context, worker_rules in owned]
+            if new_rules:
+                # Size the pool for all rules before placing new ones
+                count = self._autoscalers[worker_type].count_for_rules(
+                    self._count_rules(worker_type) + len(new_rules))
+                self._worker_counts[worker_type] = max(
+                    count, self._worker_counts[worker_type])
+                self._scale_out(worker_type)
+                updates.extend(
+                    (context, worker_rules, ()) for context, worker_rules in
+                    self._place_rules(new_rules, worker_type))
+            self._update_worker_rules(updates, worker_type)
+
+    def _count_rules(self, worker_type="server"):
+        return sum(len(context['rules']) for context in
+                   self._get_worker_contexts(worker_type))
+
+    def _scale_out(self, worker_type="server"):
+        """Create workers missing from worker count"""
+        current = len(self._get_all_workers(worker_type))
+        missing = self._worker_counts[worker_type] - current
+        if missing > 0:
+            self._create_workers(missing, worker_type)
+            if current:
+                # New workers take over their share of running rules
+                self.rebalance(worker_type)
+
+    def _scale_in(self, worker_type="server"):
+        """Stop workers above worker count, least loaded ones first"""
+        contexts = sorted(self._get_worker_contexts(worker_type),
+                          key=lambda context: len(context['rules']))
+        extra = contexts[:len(contexts) - self._worker_counts[worker_type]]
+        if not extra:
+            return
+        ring = self._rings[worker_type]
+        for context in extra:
+            ring.remove_node(context['uid'])
+        # Rules of leaving workers move to remaining ones
+        self.rebalance(worker_type)
+        for context in extra:
+            self._stop_worker(context, worker_type)
+
+    def _stop_worker(self, context, worker_type="server"):
+        with self._workers_lock:
+            self._workers_registry.delete(
+                '%s_%s' % (worker_type, context['uid']))
+            self._rings[worker_type].remove_node(context['uid'])
+            self._get_client(context).close()
             process = context.get('process')
             if process:
                 process.stop()
-        # TODO dont delete client rules
-        rules = self._get_all_rules(worker_type)
-        self._rules_registry.delete_many(rules)
+            self._cpu_allocator.release(context['uid'])
+
+    def _get_worker_loads(self, contexts, worker_type="server"):
+        """Get CPU percent and p99 loop lag of each worker"""
+        lags = [None] * len(contexts)
+        if worker_type == 'server':
+            lags = self._call_workers(
+                [(context, 'get_loop_lag', ()) for context in contexts])
+        loads = []
+        for context, lag in zip(contexts, lags):
+            if isinstance(lag, Exception):
+                lag = None
+            loads.append({'cpu': self._get_worker_cpu(context),
+                          'lag': lag['p99'] if lag else None})
+        return loads
+
+    @staticmethod
+    def _get_worker_cpu(context):
+        """CPU percent of worker process since the previous call"""
+        process = context.get('process')
+        pid = getattr(process, 'pid', None)
+        if pid is None:
+            return None
+        try:
+            ps_process = context.get('ps_process')
+            if ps_process is None or ps_process.pid != pid:
+                # First measurement only starts the interval
+                ps_process = psutil.Process(pid)
+                context['ps_process'] = ps_process
+                ps_process.cpu_percent()
+                return None
+            return ps_process.cpu_percent()
+        except psutil.Error:
+            return None
+
+    def autoscale(self, worker_type="server"):
+        """
+        Resize the worker pool for the rules and load of the workers,
+        moving rules of added or removed workers
+        :return: number of workers before and after scaling
+        :rtype: dict
+        """
+        with self._workers_lock:
+            contexts = self._get_worker_contexts(worker_type)
+            current = len(contexts)
+            desired = self._autoscalers[worker_type].desired_count(
+                current, self._count_rules(worker_type),
+                self._get_worker_loads(contexts, worker_type))
+            if desired != current:
+                self.log.info("Scaling %s workers from %d to %d",
+                              worker_type, current, desired)
+            self._worker_counts[worker_type] = desired
+            if desired > current:
+                self._scale_out(worker_type)
+            elif desired < current:
+                self._scale_in(worker_type)
+            return {'before': current, 'after': desired}
+
+    def rebalance(self, worker_type="server"):
+        """
+        Move rules whose position on the placement ring is now owned by
+        another worker, e.g. after workers were added or removed. Only
+        those rules move. They are removed from their old worker before
+        being added to the new one, so listeners can be bound again.
+        :return: number of rules moved
+        :rtype: int
+        """
+        with self._workers_lock:
+            contexts = {context['uid']: context for context in
+                        self._get_worker_contexts(worker_type)}
+            ring = self._rings[worker_type]
+            removals = {}
+            additions = {}
+            for uid, context in contexts.items():
+                for rule in context['rules'].rules():
+                    target = ring.get_node(rule.id)
+                    if target != uid and target in contexts:
+                        removals.setdefault(uid, []).append(rule)
+                        additions.setdefault(target, []).append(rule)
+            self._update_worker_rules(
+                [(contexts[uid], (), rules)
+                 for uid, rules in removals.items()], worker_type)
+            self._update_worker_rules(
+                [(contexts[uid], rules, ())
+                 for uid, rules in additions.items()], worker_type)
+            moved = sum(len(rules) for rules in removals.values())
+            if moved:
+                self.log.info("Moved %d %s rules, placement skew is %.2f",
+                              moved, worker_type,
+                              self.get_placement(worker_type)['skew'])
+            return moved
+
+    def get_placement(self, worker_type="server"):
+        """
+        Get number of rules on each worker, placement skew, the ratio
+        of the most loaded worker's rules to the mean, and CPUs workers
+        are pinned to
+        :rtype: dict
+        """
+        counts = {context['uid']: len(context['rules']) for context in
+                  self._get_worker_contexts(worker_type)}
+        cpus = self._cpu_allocator.placement()
+        return {'workers': counts, 'rules': sum(counts.values()),
+                'skew': placement_skew(list(counts.values())),
+                'cpu_affinity': self._cpu_allocator.policy,
+                'cpus': {uid: cpus[uid] for uid in counts if uid in cpus}}
+
+    def _delete_rule_from_worker(self, rules, worker_type="server"):
+        """Delete and stop rules if its running"""
+        with self._workers_lock:
+            _, owned = self._split_rules(rules, worker_type)
+            self._update_worker_rules(
+                [(context, (), worker_rules) for context, worker_rules in
+                 owned], worker_type)
+
+    def _delete_all_rules_from_workers(self, worker_type="server"):
+        with self._workers_lock:
+            contexts = self._get_worker_contexts(worker_type)
+            method = 'delete_all_servers' if worker_type == 'server' else \
+                'delete_all_clients'
+            # Stop traffic
+            self._call_workers(
+                [(context, method, ()) for context in contexts])
+            for context in contexts:
+                self._stop_worker(context, worker_type)
+                # TODO dont delete client rules
+                self._rules_registry.delete_many(
+                    ["%s_%s" % (worker_type, rule.id) for rule in
+                     context['rules'].rules()])
+            self._worker_counts[worker_type] = WORKER_MIN_COUNT
+
+    def sync_workers(self, worker_type="server"):
+        """
+        Compare rules version of every worker with its rule set and send
+        missed updates to workers which are behind
+        :return: uids of workers which were brought up to date
+        :rtype: list
+        """
+        with self._workers_lock:
+            contexts = self._get_worker_contexts(worker_type)
+            versions = self._call_workers(
+                [(context, 'get_rules_version', ()) for context in contexts])
+            deltas = []
+            for context, version in zip(contexts, versions):
+                if isinstance(version, Exception):
+                    self.log.error(
+                        "Failed to get rules version of worker %s: %s",
+                        context['uid'], version)
+                elif version < context['rules'].version:
+                    deltas.append(
+                        (context, context['rules'].delta_since(version)))
+            self._push_deltas(deltas)
+            return [context['uid'] for context, _ in deltas]
 
     def start_servers(self, server_rules):
         """Start server for given set of server rules if its not running"""
-
-        existing_server_rules = self._get_all_rules("server")
-        # Check if server is already running for given rule
-        new_rules = [rule for rule in server_rules if
-                     "%s_%s" % ("server", rule.id) not in existing_server_rules]
-        current_workers = len(self._get_all_workers("server"))
-        workers = SERVER_WORKER_COUNT
-        servers_per_worker = int(math.ceil(float(len(new_rules)) / workers))
-
-        # divide new rules with existing workers
-        if current_workers and current_workers == workers:
-            self._add_rules_to_existing_workers(new_rules, servers_per_worker)
-        # If less workers, the create new workers and divide rules among them
-        else:
-            workers_to_be_created = workers - current_workers
-            self._create_workers_and_add_rules(
-                new_rules, workers_to_be_created, servers_per_worker)
+        self._start_rules(server_rules, "server")
 
     def get_servers(self):
         """
@@ -182,9 +526,20 @@ class TrafficController(object):
         """
         for worker in self._get_all_workers(worker_type="server"):
             context = self._workers_registry.get(worker)
-            client = RPCClient(context.get('address'))
+            client = self._get_client(context)
             print(worker, client.get_server_count())
 
+    def get_server_connection_stats(self):
+        """Get connection counters of all listeners across server workers"""
+        contexts = self._get_worker_contexts("server")
+        calls = [(context, 'get_connection_stats', ()) for context in contexts]
+        stats = []
+        for result in self._call_workers(calls):
+            if isinstance(result, Exception):
+                raise result
+            stats.extend(result)
+        return stats
+
     def stop_servers(self, rules):
         """Stop Server for given set of rules if its running"""
         self._delete_rule_from_worker(rules, "server")
@@ -197,29 +552,13 @@ class TrafficController(object):
         """
         Start traffic clients for given set of client rules if its not running
         """
-        existing_rules = self._get_all_rules("client")
-        new_rules = [rule for rule in rules if
-                     "%s_%s" % ("client", rule.id) not in existing_rules]
-        current_workers = len(self._get_all_workers(worker_type="client"))
-        workers = CLIENT_WORKER_COUNT
-        rules_per_worker = int(math.ceil(float(len(new_rules)) / workers))
-
-        # divide new rules with existing workers
-        if current_workers and current_workers == workers:
-            self._add_rules_to_existing_workers(
-                new_rules, rules_per_worker, worker_type="client")
-        # If less workers, the create new workers and divide rules among them
-        else:
-            workers_to_be_created = workers - current_workers
-            self._create_workers_and_add_rules(
-                new_rules, workers_to_be_created,
-                rules_per_worker, worker_type="client")
+        self._start_rules(rules, "client")
 
     def get_client_rules(self):
         """Get rules from workers, which they are managing"""
         for worker in self._get_all_workers(worker_type="client"):
             context = self._workers_registry.get(worker)
-            client = RPCClient(context.get('address'))
+            client = self._get_client(context)
             print(worker, client.get_rule_count())
 
     def stop_clients(self, rules):
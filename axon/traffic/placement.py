@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+import bisect
+import hashlib
+
+from axon.common.config import CONSISTENT_HASH_REPLICAS
+
+
+class ConsistentHashRing(object):
+    """
+    Maps keys to nodes with consistent hashing. Each node is placed on the
+    ring `replicas` times, so keys spread evenly and adding or removing a
+    node only moves the keys of the ring arcs it gains or loses.
+    """
+
+    def __init__(self, replicas=CONSISTENT_HASH_REPLICAS):
+        self._replicas = replicas
+        self._hashes = []
+        self._nodes = {}
+
+    @staticmethod
+    def _hash(key):
+        # Stable across processes, unlike hash()
+        return int(hashlib.md5(str(key).encode()).hexdigest()[:16], 16)
+
+    @property
+    def nodes(self):
+        return set(self._nodes.values())
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes.values()
+
+    def add_node(self, node):
+        for replica in range(self._replicas):
+            point = self._hash("%s-%d" % (node, replica))
+            if point not in self._nodes:
+                bisect.insort(self._hashes, point)
+                self._nodes[point] = node
+
+    def remove_node(self, node):
+        for replica in range(self._replicas):
+            point = self._hash("%s-%d" % (node, replica))
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                del self._hashes[bisect.bisect_left(self._hashes, point)]
+
+    def get_node(self, key):
+        """
+        Get node owning a key
+        :return: node or None if ring is empty
+        """
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, self._hash(key))
+        return self._nodes[self._hashes[index % len(self._hashes)]]
+
+
+def placement_skew(counts):
+    """
+    Ratio of the most loaded worker's rule count to the mean, 1.0 is an
+    even placement
+    :param counts: rule count of each worker
+    :type counts: list
+    :rtype: float
+    """
+    total = sum(counts)
+    if not total:
+        return 0.0
+    return max(counts) / (float(total) / len(counts))
@@ -1,11 +1,41 @@
+import itertools
+import os
 import time
 
 from sqlalchemy import (
-    Boolean, create_engine, Column, Float, Integer,
+    Boolean, create_engine, Column, event, Float, Integer,
     MetaData, select, Table, Unicode)
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
 
+from axon.common.config import RECORD_STORE_SQLITE_CACHE_KB, \
+    RECORD_STORE_SQLITE_SYNCHRONOUS
+
+RECORD_COLUMNS = ('id', 'source', 'destination', 'port', 'protocol',
+                  'connected', 'success_count', 'failure_count', 'created')
+
+_record_sequence = itertools.count()
+
+
+def next_record_id():
+    """
+    Get a record id which sorts by creation time, so inserts append to
+    the primary key index instead of landing at random pages as uuid4
+    ids do
+    :rtype: str
+    """
+    return '%014x%06x%06x' % (int(time.time() * 1000000),
+                              os.getpid() & 0xffffff,
+                              next(_record_sequence) & 0xffffff)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=%s' % RECORD_STORE_SQLITE_SYNCHRONOUS)
+    cursor.execute('PRAGMA cache_size=-%d' % RECORD_STORE_SQLITE_CACHE_KB)
+    cursor.close()
+
 
 class TrafficRecordStore(object):
     """
@@ -15,6 +45,8 @@ class TrafficRecordStore(object):
     def __init__(self, url, engine_options=None):
         metadata = MetaData()
         self.engine = create_engine(url, **(engine_options or {}))
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine, 'connect', _set_sqlite_pragmas)
         self._records_table = self._init_records_table(metadata)
         self._failures_table = self._init_failures_table(metadata)
         self._records_table.create(self.engine, True)
@@ -73,6 +105,39 @@ class TrafficRecordStore(object):
             self._records_table.insert(),
             [record.as_dict() for record in records])
 
+    def add_records_bulk(self, rows, created=None):
+        """
+        Add traffic counts in one transaction
+        :param rows: tuples of (source, destination, port, protocol,
+            connected, success_count, failure_count)
+        :type rows: list
+        :param created: time of the records, now by default
+        :type created: float
+        :return: number of records added
+        :rtype: int
+        """
+        if not rows:
+            return 0
+        created = time.time() if created is None else created
+        values = [(next_record_id(),) + tuple(row) + (created,)
+                  for row in rows]
+        insert = self._records_table.insert().compile(
+            dialect=self.engine.dialect, column_keys=RECORD_COLUMNS)
+        with self.engine.begin() as connection:
+            if insert.positional and \
+                    tuple(insert.positiontup) == RECORD_COLUMNS:
+                # Plain DBAPI executemany skips per row parameter handling
+                cursor = connection.connection.cursor()
+                try:
+                    cursor.executemany(str(insert), values)
+                finally:
+                    cursor.close()
+            else:
+                connection.execute(
+                    self._records_table.insert(),
+                    [dict(zip(RECORD_COLUMNS, value)) for value in values])
+        return len(values)
+
     def __where_record_query(self, query, source=None, destination=None,
                              port=None, protocol=None,
                              start_time=None, end_time=None):
@@ -1,40 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 from multiprocessing.connection import Client, Listener
-from multiprocessing import Process
+from multiprocessing import Event, Process
 import os
 import pickle
+from threading import BoundedSemaphore, Lock, Thread
 import time
 
+from axon.common.config import RPC_CLIENT_POOL_SIZE, RPC_COMPACT_RULES, \
+    RPC_SERVER_THREADS
+from axon.common.exception import RPCTimeoutException
+from axon.traffic.affinity import set_cpu_affinity
+from axon.traffic.traffic_objects import RuleColumns
+
 family = 'AF_UNIX' if os.name == 'posix' else 'AF_PIPE'
 
 
+# Messages are pickled once and sent as raw bytes, Connection.send would
+# pickle the payload a second time.
+def _dumps(message):
+    return pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_args(args):
+    """Turn rule lists sent in columnar form back into rule objects"""
+    return tuple(arg.to_rules() if isinstance(arg, RuleColumns) else arg
+                 for arg in args)
+
+
+def lock_free(func):
+    """
+    Mark a handler method as safe to run concurrently with any other
+    method, e.g. a read-only query. Such calls are answered straight from
+    the connection thread and never wait behind a running rule update.
+    """
+    func.rpc_lock_free = True
+    return func
+
+
 class RPCServer(Process):
-    def __init__(self, name, handler):
+    """
+    Serves handler methods to RPCClients. Every connection is read by its
+    own thread and requests carry an id, so responses may go back out of
+    order. Calls to methods marked lock_free run on a small shared thread
+    pool. All other calls of a connection run one after the other in the
+    order they arrived, on a thread of the connection, and hold the
+    handler lock, as handlers are not thread safe.
+
+    The server is ready once the handler is initialized, see wait_ready.
+    If cpus are given the process pins itself to them before starting
+    any thread, so all its threads stay on these cpus.
+    """
+
+    def __init__(self, name, handler, max_workers=RPC_SERVER_THREADS,
+                 cpus=None):
         super().__init__(name=name)
         self._socket = Listener(family=family)
         self._handler = handler
+        self._max_workers = max_workers
+        self._cpus = cpus
+        self._executor = None
+        self._handler_lock = None
+        self._ready = Event()
 
-    def _handle_request_no_blocking(self, request):
-        pass
+    def _invoke(self, method, args, kwargs):
+        try:
+            func = getattr(self._handler, method)
+            args = _decode_args(args)
+            if getattr(func, 'rpc_lock_free', False):
+                return func(*args, **kwargs)
+            with self._handler_lock:
+                return func(*args, **kwargs)
+        except Exception as ex:
+            return ex
+
+    @staticmethod
+    def _respond(connection, send_lock, request_id, response):
+        try:
+            payload = _dumps((request_id, response))
+        except Exception as ex:
+            payload = _dumps(
+                (request_id, RuntimeError("Unpicklable response: %r" % ex)))
+        try:
+            with send_lock:
+                connection.send_bytes(payload)
+        except (EOFError, OSError):
+            # Client went away, e.g. it gave up waiting for a response
+            pass
+
+    def _dispatch(self, connection, send_lock, request_id, method, args,
+                  kwargs):
+        self._respond(connection, send_lock, request_id,
+                      self._invoke(method, args, kwargs))
 
     def _handle_request(self, request):
+        send_lock = Lock()
+        # The handler lock is not fair, calls pipelined on the connection
+        # only keep their order if a single thread runs them
+        ordered = ThreadPoolExecutor(max_workers=1)
         try:
             while True:
-                method, args, kwargs = pickle.loads(request.recv())
-                method = getattr(self._handler, method)
-                try:
-                    response = method(*args, **kwargs)
-                    request.send(pickle.dumps(response))
-                except Exception as ex:
-                    request.send(pickle.dumps(ex))
-        except EOFError:
-            pass
+                request_id, method, args, kwargs = pickle.loads(
+                    request.recv_bytes())
+                func = getattr(self._handler, method, None)
+                executor = self._executor if \
+                    getattr(func, 'rpc_lock_free', False) else ordered
+                executor.submit(self._dispatch, request, send_lock,
+                                request_id, method, args, kwargs)
+        except (EOFError, OSError):
+            ordered.shutdown()
+            request.close()
 
     def run(self):
+        if self._cpus:
+            set_cpu_affinity(self._cpus)
         if getattr(self._handler, 'initialize', None):
             self._handler.initialize()
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        self._handler_lock = Lock()
+        self._ready.set()
         while True:
             request = self._socket.accept()
-            self._handle_request(request)
+            thread = Thread(target=self._handle_request, args=(request,))
+            thread.daemon = True
+            thread.start()
 
     @property
     def address(self):
@@ -48,22 +137,203 @@ class RPCServer(Process):
     def is_running(self):
         return self.is_alive()
 
+    def wait_ready(self, timeout=None):
+        """
+        Wait until the server process initialized its handler
+        :return: whether server is ready
+        :rtype: bool
+        """
+        return self._ready.wait(timeout)
+
 
 class RPCClient(object):
-    def __init__(self, address):
+    """
+    Client for a RPCServer. Connections are persistent and pooled, a call
+    borrows an idle connection or opens a new one while fewer than
+    `pool_size` are in use. Stale connections, e.g. closed by the server,
+    are replaced transparently. Call close() to release the connections.
+    """
+
+    def __init__(self, address, pool_size=RPC_CLIENT_POOL_SIZE, timeout=None,
+                 compact_rules=RPC_COMPACT_RULES):
         self._address = address
+        self._compact_rules = compact_rules
+        self._request_ids = itertools.count()
+        self._timeout = timeout
+        self._idle = []
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(pool_size)
+        self._pool_size = pool_size
+        self._executor = None
+        self._closed = False
 
     def __connect(self):
         return Client(address=self._address)
 
+    def _acquire(self):
+        """Borrow a connection from pool, connecting if none is idle"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self.__connect()
+                # An idle connection must have nothing to read, otherwise
+                # the server has closed it.
+                if not connection.poll(0):
+                    return connection
+                connection.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, connection, reuse=True):
+        """Return connection to pool, closing it if it can't be reused"""
+        try:
+            with self._lock:
+                if reuse and not self._closed:
+                    self._idle.append(connection)
+                    return
+            connection.close()
+        finally:
+            self._slots.release()
+
+    def _request(self, request_id, method, args, kwargs):
+        """Serialize a request, encoding rule lists in columnar form"""
+        if self._compact_rules:
+            args = tuple(RuleColumns.from_rules(arg) or arg for arg in args)
+        return _dumps((request_id, method, args, kwargs or {}))
+
+    def call(self, method, args=(), kwargs=None, timeout=None):
+        """
+        Call a method of the server handler
+        :param method: name of handler method
+        :type method: str
+        :param timeout: seconds to wait for the result, defaults to client
+                        timeout, None waits forever
+        :type timeout: float
+        :return: result of the method
+        """
+        timeout = timeout if timeout is not None else self._timeout
+        connection = self._acquire()
+        reuse = False
+        request_id = next(self._request_ids)
+        try:
+            connection.send_bytes(
+                self._request(request_id, method, args, kwargs))
+            if timeout is not None and not connection.poll(timeout):
+                raise RPCTimeoutException(method=method, timeout=timeout)
+            response_id, result = pickle.loads(connection.recv_bytes())
+            if response_id != request_id:
+                raise RuntimeError("Response %s received for request %s" %
+                                   (response_id, request_id))
+            reuse = True
+        finally:
+            # A connection with an unanswered request is never reused, its
+            # late response would be taken as the result of the next call.
+            self._release(connection, reuse)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    @staticmethod
+    def _send_all(connection, payloads):
+        try:
+            for payload in payloads:
+                connection.send_bytes(payload)
+        except (EOFError, OSError):
+            # Receiving side sees the broken connection as well
+            pass
+
+    def multi_call(self, calls, timeout=None):
+        """
+        Send a batch of calls over one connection without waiting for each
+        response, then collect all of them, one round trip for the whole
+        batch. The server runs the calls in order of the batch, only
+        lock_free calls may run concurrently with others.
+        :param calls: calls as (method, args) or (method, args, kwargs)
+        :type calls: list
+        :param timeout: seconds to wait for the whole batch, defaults to
+                        client timeout, None waits forever
+        :type timeout: float
+        :return: results in order of calls, a call which raised has the
+                 exception in place of its result
+        :rtype: list
+        """
+        if not calls:
+            return []
+        timeout = timeout if timeout is not None else self._timeout
+        request_ids = []
+        payloads = []
+        for call in calls:
+            method, args, kwargs = (tuple(call) + ((), None))[:3]
+            request_id = next(self._request_ids)
+            request_ids.append(request_id)
+            payloads.append(
+                self._request(request_id, method, args, kwargs))
+        connection = self._acquire()
+        reuse = False
+        results = {}
+        try:
+            # Requests are sent from another thread, as the server may
+            # block sending responses while nobody is reading them.
+            sender = Thread(target=self._send_all,
+                            args=(connection, payloads))
+            sender.daemon = True
+            sender.start()
+            deadline = time.time() + timeout if timeout is not None else None
+            while len(results) < len(request_ids):
+                if deadline is not None and not connection.poll(
+                        max(0, deadline - time.time())):
+                    raise RPCTimeoutException(method='multi_call',
+                                              timeout=timeout)
+                response_id, result = pickle.loads(connection.recv_bytes())
+                results[response_id] = result
+            sender.join()
+            reuse = set(results) == set(request_ids)
+        finally:
+            self._release(connection, reuse)
+        if not reuse:
+            raise RuntimeError("Unexpected responses received for batch")
+        return [results[request_id] for request_id in request_ids]
+
+    def call_async(self, method, args=(), kwargs=None, timeout=None):
+        """
+        Call a method of the server handler without waiting for the result
+        :return: future which resolves to result of the method
+        :rtype: concurrent.futures.Future
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._pool_size)
+            executor = self._executor
+        return executor.submit(self.call, method, args, kwargs, timeout)
+
+    def close(self):
+        """Close all idle connections, busy ones are closed on release"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False)
+        for connection in idle:
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
         def do_rpc(*args, **kwargs):
-            connection = self.__connect()
-            connection.send(pickle.dumps((name, args, kwargs)))
-            result = pickle.loads(connection.recv())
-            if isinstance(result, Exception):
-                raise result
-            return result
+            return self.call(name, args, kwargs)
         return do_rpc
 
 
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+from collections import deque
+from threading import Lock
+
+from axon.common.config import RULE_SET_HISTORY
+from axon.traffic.traffic_objects import RuleColumns
+
+
+class RuleDelta(object):
+    """
+    Change of a rule set from base_version to version. A changed rule is
+    both in removed, as it was, and in added, as it is. A reset delta
+    replaces all rules of the receiver with added.
+    """
+    __slots__ = ('base_version', 'version', 'added', 'removed', 'reset')
+
+    def __init__(self, base_version, version, added=None, removed=None,
+                 reset=False):
+        self.base_version = base_version
+        self.version = version
+        self.added = added or []
+        self.removed = removed or []
+        self.reset = reset
+
+    def __getstate__(self):
+        return (self.base_version, self.version,
+                RuleColumns.from_rules(self.added) or self.added,
+                RuleColumns.from_rules(self.removed) or self.removed,
+                self.reset)
+
+    def __setstate__(self, state):
+        (self.base_version, self.version, added, removed,
+         self.reset) = state
+        self.added = added.to_rules() if isinstance(
+            added, RuleColumns) else added
+        self.removed = removed.to_rules() if isinstance(
+            removed, RuleColumns) else removed
+
+    @property
+    def changed(self):
+        """Ids of rules which are modified rather than added or removed"""
+        return {rule.id for rule in self.added} & \
+            {rule.id for rule in self.removed}
+
+    def __len__(self):
+        return len(self.added) + len(self.removed)
+
+    def __repr__(self):
+        return "RuleDelta(%s->%s, added=%d, removed=%d, reset=%s)" % (
+            self.base_version, self.version, len(self.added),
+            len(self.removed), self.reset)
+
+
+def _same(rule, other):
+    return rule.as_dict() == other.as_dict()
+
+
+class VersionedRuleSet(object):
+    """
+    Rules assigned to a worker. Every mutation bumps the version and is
+    kept in a bounded history, so a worker which missed updates can be
+    brought up to date with the delta since its version instead of all
+    rules.
+    """
+
+    def __init__(self, max_history=RULE_SET_HISTORY):
+        self._rules = {}
+        self._version = 0
+        self._history = deque(maxlen=max_history)
+        self._lock = Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, rule_id):
+        return rule_id in self._rules
+
+    def get(self, rule_id):
+        return self._rules.get(rule_id)
+
+    def rules(self):
+        with self._lock:
+            return list(self._rules.values())
+
+    def update(self, added=(), removed=()):
+        """
+        Add, replace or remove rules, rules are identified by their id
+        :param added: new rules or new state of existing rules
+        :type added: list
+        :param removed: rules to be removed, unknown rules are ignored
+        :type removed: list
+        :return: delta of this update, None if nothing changed
+        :rtype: RuleDelta
+        """
+        with self._lock:
+            delta_added = []
+            delta_removed = []
+            for rule in removed:
+                old = self._rules.pop(rule.id, None)
+                if old is not None:
+                    delta_removed.append(old)
+            for rule in added:
+                old = self._rules.get(rule.id)
+                if old is not None:
+                    if _same(old, rule):
+                        continue
+                    delta_removed.append(old)
+                self._rules[rule.id] = rule
+                delta_added.append(rule)
+            if not (delta_added or delta_removed):
+                return None
+            base_version = self._version
+            self._version += 1
+            self._history.append((self._version, delta_added, delta_removed))
+            return RuleDelta(base_version, self._version, delta_added,
+                             delta_removed)
+
+    def delta_since(self, version):
+        """
+        Get net change since a version, or a reset delta with all rules if
+        the version is unknown or no longer in history
+        :param version: version the receiver has
+        :type version: int
+        :rtype: RuleDelta
+        """
+        with self._lock:
+            if version == self._version:
+                return RuleDelta(version, version)
+            oldest_base = self._history[0][0] - 1 if self._history else \
+                self._version
+            if version is None or not oldest_base <= version < self._version:
+                return RuleDelta(None, self._version,
+                                 list(self._rules.values()), reset=True)
+            # State of each touched rule at `version`, rules first seen
+            # as added did not exist then
+            base_rules = {}
+            touched = set()
+            for entry_version, added, removed in self._history:
+                if entry_version <= version:
+                    continue
+                for rule in removed:
+                    if rule.id not in touched:
+                        base_rules[rule.id] = rule
+                        touched.add(rule.id)
+                for rule in added:
+                    touched.add(rule.id)
+            delta = RuleDelta(version, self._version)
+            for rule_id in touched:
+                old = base_rules.get(rule_id)
+                new = self._rules.get(rule_id)
+                if old is not None and new is not None and _same(old, new):
+                    continue
+                if old is not None:
+                    delta.removed.append(old)
+                if new is not None:
+                    delta.added.append(new)
+            return delta
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+from collections import defaultdict
+from threading import RLock
+
+from axon.traffic.traffic_objects import TrafficRule, TrafficServer
+
+
+class RuleIndex(object):
+    """
+    In memory rules of one type, indexed by every attribute rules are
+    filtered on. Rules are never modified in place, an update replaces
+    the rule object, so rules handed out stay valid.
+    """
+
+    def __init__(self, rule_cls, indexed, unique):
+        self._rule_cls = rule_cls
+        self._indexed = indexed
+        self._unique = unique
+        self._rules = {}
+        self._keys = {}
+        self._indexes = {attr: defaultdict(set) for attr in indexed}
+
+    def _key(self, rule):
+        return tuple(getattr(rule, attr) for attr in self._unique)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def add(self, rule):
+        """
+        Add rule unless a rule with same unique key exists
+        :return: whether rule was added
+        :rtype: bool
+        """
+        key = self._key(rule)
+        if key in self._keys:
+            return False
+        self._keys[key] = rule.id
+        self._rules[rule.id] = rule
+        for attr, index in self._indexes.items():
+            index[getattr(rule, attr)].add(rule.id)
+        return True
+
+    def remove(self, rule):
+        del self._rules[rule.id]
+        del self._keys[self._key(rule)]
+        for attr, index in self._indexes.items():
+            value = getattr(rule, attr)
+            ids = index[value]
+            ids.discard(rule.id)
+            if not ids:
+                del index[value]
+
+    def clear(self):
+        self._rules.clear()
+        self._keys.clear()
+        for index in self._indexes.values():
+            index.clear()
+
+    def find(self, **criteria):
+        """
+        Get rules matching all given criteria, None means any value
+        :return: matching rules
+        :rtype: list
+        """
+        criteria = {attr: value for attr, value in criteria.items()
+                    if value is not None}
+        if 'port' in criteria:
+            criteria['port'] = int(criteria['port'])
+        if not criteria:
+            return list(self._rules.values())
+        # Start from smallest candidate set and check remaining criteria
+        # on the rules themselves
+        candidates = min(
+            (self._indexes[attr].get(value, ()) for attr, value in
+             criteria.items()), key=len)
+        rules = []
+        for rule_id in candidates:
+            rule = self._rules[rule_id]
+            if all(getattr(rule, attr) == value for attr, value in
+                   criteria.items()):
+                rules.append(rule)
+        return rules
+
+    def update(self, changes, **criteria):
+        """Replace rules matching criteria by copies with changes applied"""
+        for rule in self.find(**criteria):
+            self.remove(rule)
+            self.add(self._rule_cls(**dict(rule.as_dict(), **changes)))
+
+
+class CachedTrafficRulesStore(object):
+    """
+    Write through cache in front of a TrafficRulesStore. All rules are
+    loaded once, every write goes to the database first and is then
+    applied to the cache, and reads are served from memory.
+
+    The cache assumes it is the only writer of the database.
+    """
+
+    SERVER_ATTRS = ('endpoint', 'port', 'protocol', 'enabled')
+    CLIENT_ATTRS = ('source', 'destination', 'port', 'protocol',
+                    'enabled', 'allowed')
+
+    def __init__(self, rules_store):
+        self._store = rules_store
+        self._lock = RLock()
+        self._servers = RuleIndex(TrafficServer, self.SERVER_ATTRS,
+                                  ('endpoint', 'port', 'protocol'))
+        self._clients = RuleIndex(TrafficRule, self.CLIENT_ATTRS,
+                                  ('source', 'destination', 'port',
+                                   'protocol'))
+        self.reload()
+
+    def reload(self):
+        """Reload all rules from database"""
+        with self._lock:
+            self._servers.clear()
+            self._clients.clear()
+            for server in self._store.get_servers():
+                self._servers.add(server)
+            for client in self._store.get_clients():
+                self._clients.add(client)
+
+    def add_client(self, client):
+        with self._lock:
+            self._store.add_client(client)
+            self._clients.add(client)
+
+    def add_client_batch(self, clients):
+        with self._lock:
+            self._store.add_client_batch(clients)
+            for client in clients:
+                self._clients.add(client)
+
+    def upsert_client_batch(self, clients):
+        with self._lock:
+            added = self._store.upsert_client_batch(clients)
+            for client in clients:
+                self._clients.add(client)
+            return added
+
+    def add_server(self, server):
+        with self._lock:
+            self._store.add_server(server)
+            self._servers.add(server)
+
+    def add_server_batch(self, servers):
+        with self._lock:
+            self._store.add_server_batch(servers)
+            for server in servers:
+                self._servers.add(server)
+
+    def upsert_server_batch(self, servers):
+        with self._lock:
+            added = self._store.upsert_server_batch(servers)
+            for server in servers:
+                self._servers.add(server)
+            return added
+
+    def delete_servers(self, endpoint, port=None, protocol=None, enabled=None):
+        with self._lock:
+            self._store.delete_servers(endpoint, port, protocol, enabled)
+            for server in self._servers.find(
+                    endpoint=endpoint, port=port, protocol=protocol,
+                    enabled=enabled):
+                self._servers.remove(server)
+
+    def delete_all_servers(self):
+        with self._lock:
+            self._store.delete_all_servers()
+            self._servers.clear()
+
+    def delete_clients(self, source, port=None, protocol=None,
+                       destination=None, enabled=None, allowed=None):
+        with self._lock:
+            self._store.delete_clients(source, port, protocol, destination,
+                                       enabled, allowed)
+            for client in self._clients.find(
+                    source=source, port=port, protocol=protocol,
+                    destination=destination, enabled=enabled,
+                    allowed=allowed):
+                self._clients.remove(client)
+
+    def delete_all_clients(self):
+        with self._lock:
+            self._store.delete_all_clients()
+            self._clients.clear()
+
+    def get_servers(self, endpoint=None, port=None,
+                    protocol=None, enabled=None):
+        with self._lock:
+            return self._servers.find(endpoint=endpoint, port=port,
+                                      protocol=protocol, enabled=enabled)
+
+    def get_clients(self, source=None, port=None, protocol=None,
+                    destination=None, enabled=None, allowed=None):
+        with self._lock:
+            return self._clients.find(
+                source=source, port=port, protocol=protocol,
+                destination=destination, enabled=enabled, allowed=allowed)
+
+    def disable_servers(self, endpoint=None, port=None, protocol=None):
+        with self._lock:
+            self._store.disable_servers(endpoint, port, protocol)
+            self._servers.update({'enabled': False}, endpoint=endpoint,
+                                 port=port, protocol=protocol, enabled=True)
+
+    def enable_servers(self, endpoint=None, port=None, protocol=None):
+        with self._lock:
+            self._store.enable_servers(endpoint, port, protocol)
+            self._servers.update({'enabled': True}, endpoint=endpoint,
+                                 port=port, protocol=protocol, enabled=False)
+
+    def update_response_profile(self, response_profile, endpoint=None,
+                                port=None, protocol=None):
+        with self._lock:
+            self._store.update_response_profile(
+                response_profile, endpoint, port, protocol)
+            self._servers.update({'response_profile': response_profile},
+                                 endpoint=endpoint, port=port,
+                                 protocol=protocol)
+
+    def _update_clients(self, store_update, changes, source, port, protocol,
+                        destination, enabled, allowed):
+        with self._lock:
+            store_update()
+            self._clients.update(
+                changes, source=source, port=port, protocol=protocol,
+                destination=destination, enabled=enabled, allowed=allowed)
+
+    def disable_clients(self, source=None, port=None,
+                        protocol=None, destination=None, allowed=None):
+        self._update_clients(
+            lambda: self._store.disable_clients(
+                source, port, protocol, destination, allowed),
+            {'enabled': False}, source, port, protocol, destination,
+            True, allowed)
+
+    def enable_clients(self, source=None, port=None,
+                       protocol=None, destination=None, allowed=None):
+        self._update_clients(
+            lambda: self._store.enable_clients(
+                source, port, protocol, destination, allowed),
+            {'enabled': True}, source, port, protocol, destination,
+            False, allowed)
+
+    def deny_clients(self, source=None, port=None,
+                     protocol=None, destination=None, enabled=None):
+        self._update_clients(
+            lambda: self._store.deny_clients(
+                source, port, protocol, destination, enabled),
+            {'allowed': False}, source, port, protocol, destination,
+            enabled, True)
+
+    def allowed_clients(self, source=None, port=None,
+                        protocol=None, destination=None, enabled=None):
+        self._update_clients(
+            lambda: self._store.allowed_clients(
+                source, port, protocol, destination, enabled),
+            {'allowed': True}, source, port, protocol, destination,
+            enabled, False)
+
+    def update_request_count(self, request_count, source=None,
+                             port=None, protocol=None, destination=None,
+                             enabled=None, allowed=None):
+        self._update_clients(
+            lambda: self._store.update_request_count(
+                request_count, source, port, protocol, destination,
+                enabled, allowed),
+            {'request_count': request_count}, source, port, protocol,
+            destination, enabled, allowed)
+
+    def __repr__(self):
+        return '<%s (store=%r)>' % (self.__class__.__name__, self._store)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+import json
+import logging
+from uuid import uuid4
+
+from axon.common.config import RULES_LOAD_CHUNK_SIZE
+from axon.traffic.traffic_objects import TrafficRule, TrafficServer
+
+
+class TrafficRulesLoader(object):
+    """
+    Registers traffic configs in a TrafficRulesStore chunk by chunk.
+    Configs are consumed lazily, so they can come from a generator, a
+    remote iterator or a file, and only one chunk of rules is held in
+    memory. Duplicates within a chunk are dropped before rule objects are
+    built, rules which are already stored are skipped by the database.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, rules_store, chunk_size=RULES_LOAD_CHUNK_SIZE):
+        self._rules_store = rules_store
+        self._chunk_size = max(1, chunk_size)
+        self._stats = None
+        self._progress_callback = None
+
+    @staticmethod
+    def read_configs(path):
+        """
+        Read traffic configs from a file with one JSON config per line
+        :param path: path of the file
+        :type path: str
+        """
+        with open(path) as config_file:
+            for line in config_file:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def _flush_servers(self, servers):
+        new_servers = [
+            TrafficServer(uuid4().hex, endpoint, port, protocol,
+                          response_profile=profile)
+            for (endpoint, port, protocol), profile in servers.items()]
+        self._stats['servers_added'] += \
+            self._rules_store.upsert_server_batch(new_servers)
+        self._chunk_done()
+
+    def _flush_clients(self, clients):
+        new_clients = [TrafficRule(uuid4().hex, *(key + extra))
+                       for key, extra in clients.items()]
+        self._stats['clients_added'] += \
+            self._rules_store.upsert_client_batch(new_clients)
+        self._chunk_done()
+
+    def _chunk_done(self):
+        self._stats['chunks'] += 1
+        self.log.info(
+            "Registered chunk %(chunks)d, servers %(servers_added)d/"
+            "%(servers)d, clients %(clients_added)d/%(clients)d added",
+            self._stats)
+        if self._progress_callback:
+            self._progress_callback(dict(self._stats))
+
+    def load(self, traffic_configs, progress_callback=None):
+        """
+        Register traffic configs, rules which are already registered are
+        ignored
+        :param traffic_configs: configs as accepted by
+                                TrafficApp.register_traffic, server and
+                                client lists can be iterators as well
+        :type traffic_configs: iterable
+        :param progress_callback: called with counters after every chunk
+        :type progress_callback: callable
+        :return: number of rules received and added
+        :rtype: dict
+        """
+        self._stats = {'servers': 0, 'servers_added': 0, 'clients': 0,
+                       'clients_added': 0, 'chunks': 0}
+        self._progress_callback = progress_callback
+        # Rules keyed by their identity, first occurrence wins
+        servers = {}
+        clients = {}
+        for config in traffic_configs:
+            endpoint = config['endpoint']
+            for item in config.get('servers', ()):
+                self._stats['servers'] += 1
+                key = (endpoint, int(item[0]), item[1])
+                if key not in servers:
+                    servers[key] = item[2] if len(item) > 2 else None
+                if len(servers) >= self._chunk_size:
+                    self._flush_servers(servers)
+                    servers = {}
+            for item in config.get('clients', ()):
+                self._stats['clients'] += 1
+                key = (endpoint, item[0], int(item[1]), item[2])
+                if key not in clients:
+                    clients[key] = (item[3], item[4], item[5])
+                if len(clients) >= self._chunk_size:
+                    self._flush_clients(clients)
+                    clients = {}
+        if servers:
+            self._flush_servers(servers)
+        if clients:
+            self._flush_clients(clients)
+        return self._stats
@@ -1,6 +1,9 @@
+import logging
+
 from sqlalchemy import (
-    Boolean, create_engine, Column, Integer,
-    MetaData, select, Table, Unicode)
+    Boolean, create_engine, Column, Index, inspect, Integer,
+    MetaData, PickleType, select, Table, Unicode)
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.exc import IntegrityError
 
 from axon.traffic.traffic_objects import TrafficRule, TrafficServer
@@ -9,15 +12,22 @@ from axon.traffic.traffic_objects import TrafficRule, TrafficServer
 class TrafficRulesStore(object):
     """
     Stores TrafficRules in a database table using SQLAlchemy.
+
+    A server is unique by (endpoint, port, protocol) and a client rule by
+    (source, destination, port, protocol). Every column a rule can be
+    filtered on leads at least one index.
     """
+    log = logging.getLogger(__name__)
 
     def __init__(self, url, engine_options=None):
         metadata = MetaData()
         self.engine = create_engine(url, **(engine_options or {}))
         self._servers_table = self._init_servers_table(metadata)
         self._clients_table = self._init_clients_table(metadata)
-        self._servers_table.create(self.engine, True)
-        self._clients_table.create(self.engine, True)
+        for table in (self._servers_table, self._clients_table):
+            table.create(self.engine, True)
+            self._create_columns(table)
+            self._create_indexes(table)
 
     @staticmethod
     def _init_servers_table(metadata):
@@ -28,7 +38,13 @@ class TrafficRulesStore(object):
             Column('endpoint', Unicode, nullable=False),
             Column('port', Integer, nullable=False),
             Column('protocol', Unicode, nullable=False),
-            Column('enabled', Boolean, nullable=False, default=True)
+            Column('enabled', Boolean, nullable=False, default=True),
+            Column('response_profile', PickleType, nullable=True),
+            Index('uq_servers_endpoint_port_protocol',
+                  'endpoint', 'port', 'protocol', unique=True),
+            Index('ix_servers_port_protocol', 'port', 'protocol'),
+            Index('ix_servers_protocol', 'protocol'),
+            Index('ix_servers_enabled', 'enabled')
         )
         return table
 
@@ -44,13 +60,57 @@ class TrafficRulesStore(object):
             Column('destination', Unicode, nullable=False),
             Column('allowed', Boolean, nullable=False),
             Column('enabled', Boolean, nullable=False, default=True),
-            Column('request_count', Integer, nullable=False, default=1)
+            Column('request_count', Integer, nullable=False, default=1),
+            Index('uq_clients_source_destination_port_protocol',
+                  'source', 'destination', 'port', 'protocol', unique=True),
+            Index('ix_clients_destination_port_protocol',
+                  'destination', 'port', 'protocol'),
+            Index('ix_clients_port_protocol', 'port', 'protocol'),
+            Index('ix_clients_protocol', 'protocol'),
+            Index('ix_clients_enabled_allowed', 'enabled', 'allowed'),
+            Index('ix_clients_allowed', 'allowed')
         )
         return table
 
+    def _create_columns(self, table):
+        """Add nullable columns missing from table created by older version"""
+        existing = {column['name'] for column in
+                    inspect(self.engine).get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=self.engine.dialect)
+            self.engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (
+                table.name, column.name, column_type))
+
+    def _create_indexes(self, table):
+        """Create indexes missing from a table created by older version"""
+        existing = {index['name'] for index in
+                    inspect(self.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(self.engine)
+            except IntegrityError:
+                self.log.warning(
+                    "Index %s not created, table %s has duplicate rules",
+                    index.name, table.name)
+
+    def _insert_ignore(self, table):
+        """Insert statement which skips rows conflicting with unique keys"""
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            return postgresql.insert(table).on_conflict_do_nothing()
+        if dialect == 'sqlite':
+            return table.insert().prefix_with('OR IGNORE')
+        if dialect == 'mysql':
+            return table.insert().prefix_with('IGNORE')
+        return table.insert()
+
     def add_client(self, client):
         """Add client to database"""
-        add = self._clients_table.insert.values(**{client.as_dict()})
+        add = self._clients_table.insert().values(**client.as_dict())
         try:
             self.engine.execute(add)
         except IntegrityError:
@@ -62,9 +122,21 @@ class TrafficRulesStore(object):
             self._clients_table.insert(),
             [client.as_dict() for client in clients])
 
+    def upsert_client_batch(self, clients):
+        """
+        Add clients in batch to database, clients which already exist are
+        skipped by the database
+        :return: number of clients added
+        :rtype: int
+        """
+        result = self.engine.execute(
+            self._insert_ignore(self._clients_table),
+            [client.as_dict() for client in clients])
+        return result.rowcount
+
     def add_server(self, server):
         """Add server to database"""
-        add = self._servers_table.insert().values(**{server.as_dict()})
+        add = self._servers_table.insert().values(**server.as_dict())
         try:
             self.engine.execute(add)
         except IntegrityError:
@@ -76,6 +148,18 @@ class TrafficRulesStore(object):
             self._servers_table.insert(),
             [server.as_dict() for server in servers])
 
+    def upsert_server_batch(self, servers):
+        """
+        Add servers in batch to database, servers which already exist are
+        skipped by the database
+        :return: number of servers added
+        :rtype: int
+        """
+        result = self.engine.execute(
+            self._insert_ignore(self._servers_table),
+            [server.as_dict() for server in servers])
+        return result.rowcount
+
     def delete_servers(self, endpoint, port=None, protocol=None, enabled=None):
         """
         Delete Servers
@@ -190,7 +274,8 @@ class TrafficRulesStore(object):
         return [
             TrafficServer(
                 server.id, server.endpoint, server.port,
-                server.protocol, server.enabled) for server in servers
+                server.protocol, server.enabled,
+                server.response_profile) for server in servers
         ]
 
     def get_clients(self, source=None, port=None, protocol=None,
@@ -256,6 +341,26 @@ class TrafficRulesStore(object):
         if result.rowcount == 0:
             raise Exception("No Server found with condition")
 
+    def update_response_profile(self, response_profile, endpoint=None,
+                                port=None, protocol=None):
+        """
+        Update response profile of servers matching given criteria
+        :param response_profile: response profile config
+        :type response_profile: dict
+        :param endpoint: Endpoint IP on which server is listening
+        :type endpoint: str
+        :param port: port on which server is listening
+        :type port: integer
+        :param protocol: protocol which server is serving
+        :type protocol: str
+        """
+        update = self._servers_table.update().values(
+            **{'response_profile': response_profile})
+        update = self.__where_server_query(update, endpoint, port, protocol)
+        result = self.engine.execute(update)
+        if result.rowcount == 0:
+            raise Exception("No Server found with condition")
+
     def disable_clients(self, source=None, port=None,
                         protocol=None, destination=None, allowed=None):
         """
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+import abc
+import os
+import random
+
+
+PAYLOAD_FILL_BYTE = b"x"
+
+
+class ResponseProfile(abc.ABC):
+    """
+    Describes the payload a server sends back for a request. Payload
+    buffers are allocated once when the profile is created and shared
+    by every connection which uses the profile.
+    """
+
+    # Set if payload is a file which should be sent using sendfile
+    sendfile_path = None
+
+    # Set if every payload has the same length
+    fixed = False
+
+    @abc.abstractmethod
+    def payload(self):
+        """
+        Payload for one response
+        :return: payload
+        :rtype: bytes or memoryview
+        """
+        pass
+
+    @abc.abstractmethod
+    def as_dict(self):
+        pass
+
+
+class FixedSizeProfile(ResponseProfile):
+    """Every response carries the same preallocated payload"""
+
+    fixed = True
+
+    def __init__(self, size=None, body=None):
+        self._body = body if body is not None else PAYLOAD_FILL_BYTE * size
+
+    def payload(self):
+        return self._body
+
+    def as_dict(self):
+        return {'type': 'fixed', 'size': len(self._body)}
+
+
+class RandomSizeProfile(ResponseProfile):
+    """
+    Response size is drawn from a distribution for every response. The
+    payload is a slice of a single buffer of max_size bytes, so no
+    buffer is allocated per response.
+    """
+
+    DISTRIBUTIONS = ('uniform', 'normal', 'exponential')
+
+    def __init__(self, min_size, max_size, distribution='uniform',
+                 mean=None, stddev=None):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError("Invalid distribution %s" % distribution)
+        if min_size > max_size:
+            raise ValueError("min_size %s is larger than max_size %s" %
+                             (min_size, max_size))
+        self._min = min_size
+        self._max = max_size
+        self._distribution = distribution
+        self._mean = mean if mean is not None else (min_size + max_size) / 2.0
+        self._stddev = stddev if stddev is not None else \
+            (max_size - min_size) / 4.0
+        self._buffer = memoryview(PAYLOAD_FILL_BYTE * max_size)
+
+    def _next_size(self):
+        if self._distribution == 'uniform':
+            return random.randint(self._min, self._max)
+        elif self._distribution == 'normal':
+            size = random.gauss(self._mean, self._stddev)
+        else:
+            size = random.expovariate(1.0 / max(self._mean, 1))
+        return int(min(max(size, self._min), self._max))
+
+    def payload(self):
+        return self._buffer[:self._next_size()]
+
+    def as_dict(self):
+        return {'type': 'random', 'min_size': self._min,
+                'max_size': self._max, 'distribution': self._distribution,
+                'mean': self._mean, 'stddev': self._stddev}
+
+
+class FileProfile(ResponseProfile):
+    """
+    Response payload is the content of a file. Stream servers send it
+    with sendfile, the content is only loaded in memory for datagram
+    servers or when the event loop has no sendfile support.
+    """
+
+    def __init__(self, path):
+        if not os.path.isfile(path):
+            raise ValueError("Response file %s does not exist" % path)
+        self.sendfile_path = path
+        self.size = os.path.getsize(path)
+        self._content = None
+
+    def payload(self):
+        if self._content is None:
+            with open(self.sendfile_path, 'rb') as payload_file:
+                self._content = payload_file.read()
+        return self._content
+
+    def as_dict(self):
+        return {'type': 'file', 'path': self.sendfile_path}
+
+
+_profile_types = {
+    'fixed': FixedSizeProfile,
+    'random': RandomSizeProfile,
+    'file': FileProfile,
+}
+
+# Profiles are cached so that all listeners in a worker using the same
+# profile share its buffers.
+_profiles = {}
+
+
+def create_response_profile(config):
+    """
+    Create or get cached response profile from its configuration
+    :param config: profile config, e.g. {'type': 'fixed', 'size': 1400},
+                   {'type': 'random', 'min_size': 64, 'max_size': 9000,
+                    'distribution': 'normal'} or
+                   {'type': 'file', 'path': '/tmp/payload.bin'}
+    :type config: dict
+    :return: response profile or None if no config given
+    :rtype: ResponseProfile
+    """
+    if not config:
+        return None
+    key = tuple(sorted(config.items()))
+    profile = _profiles.get(key)
+    if profile is None:
+        kwargs = dict(config)
+        profile_type = kwargs.pop('type', 'fixed')
+        try:
+            profile_cls = _profile_types[profile_type]
+        except KeyError:
+            raise ValueError("Invalid response profile type %s" %
+                             profile_type)
+        profile = profile_cls(**kwargs)
+        _profiles[key] = profile
+    return profile
@@ -4,90 +4,489 @@
 # The full license information can be found in LICENSE.txt
 # in the root directory of this project.
 import asyncio
+from collections import deque
+import functools
 import os
+import socket
 import ssl
 
+from axon.common.config import HTTP_RESPONSE_SIZE
+from axon.traffic.servers.profiles import create_response_profile, \
+    FixedSizeProfile
+
 
 DEFAULT_HTTP_RESPONSE = b"Hello From Axon"
+HTTP_HEADER_TERMINATOR = b"\r\n\r\n"
+MAX_HTTP_HEADER_SIZE = 8192
+HTTP_OK = 200
+HTTP_BAD_REQUEST = 400
+HTTP_NOT_ALLOWED = 405
 SERVER_CERT_FILE = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), 'axon.crt')
 SERVER_KEY_FILE = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), 'axon.key')
 
 
-class HTTPProtocol(asyncio.Protocol):
-    
+class HTTPResponses(object):
+    """
+    Preassembled HTTP responses for a listener. Built once and shared
+    by every connection accepted on that listener, so a response costs
+    a single transport write and no per request formatting.
+
+    Responses of fixed size profiles are fully preassembled. For other
+    profiles the header of each response length is assembled once and
+    sent along with a view of the profile payload, which is not copied.
+    """
+
+    def __init__(self, body=DEFAULT_HTTP_RESPONSE,
+                 content_type=b"text/html; charset=utf-8", profile=None):
+        self.profile = profile if profile else FixedSizeProfile(body=body)
+        self.sendfile_path = self.profile.sendfile_path
+        self.body = self.profile.payload() if self.profile.fixed else None
+        self._content_type = content_type
+        self._ok_headers = {}
+        if self.body is not None:
+            self.ok = self._build(b"200 OK", content_type, self.body, True)
+            self.ok_close = self._build(
+                b"200 OK", content_type, self.body, False)
+        self.not_allowed = self._build(
+            b"405 Method Not Allowed", content_type, b"405\r\n", True)
+        self.not_allowed_close = self._build(
+            b"405 Method Not Allowed", content_type, b"405\r\n", False)
+        self.bad_request = self._build(
+            b"400 Bad Request", content_type, b"400\r\n", False)
+
+    @staticmethod
+    def _header(status, content_type, length, keep_alive):
+        return b"".join([
+            b"HTTP/1.1 ", status,
+            b"\r\nContent-Type: ", content_type,
+            b"\r\nContent-Length: ", str(length).encode(),
+            b"\r\nConnection: ",
+            b"keep-alive" if keep_alive else b"close",
+            b"\r\n\r\n"])
+
+    @classmethod
+    def _build(cls, status, content_type, body, keep_alive):
+        return cls._header(status, content_type, len(body), keep_alive) + body
+
+    def _ok_header(self, length, keep_alive):
+        key = (length, keep_alive)
+        header = self._ok_headers.get(key)
+        if header is None:
+            header = self._header(b"200 OK", self._content_type, length,
+                                  keep_alive)
+            self._ok_headers[key] = header
+        return header
+
+    def ok_response(self, keep_alive):
+        """
+        Get a successful response. For file profiles only the header is
+        returned, body has to be sent with sendfile.
+        """
+        return b"".join(self.ok_buffers(keep_alive))
+
+    def ok_buffers(self, keep_alive):
+        """
+        Get the buffers of a successful response, to be written without
+        joining them. For file profiles only the header is returned.
+        :rtype: tuple
+        """
+        if self.body is not None:
+            return (self.ok if keep_alive else self.ok_close,)
+        if self.sendfile_path:
+            return (self._ok_header(self.profile.size, keep_alive),)
+        payload = self.profile.payload()
+        return self._ok_header(len(payload), keep_alive), payload
+
+    @classmethod
+    def of_size(cls, size):
+        """Build responses whose body is exactly `size` bytes long"""
+        if size is None:
+            return cls()
+        return cls(profile=FixedSizeProfile(size))
+
+
+def _sendfile(loop, transport, path, callback):
+    """
+    Send a file over transport using loop.sendfile and call callback
+    with transport once done. Falls back to writing the file content on
+    loops without sendfile support.
+    """
+    if not hasattr(loop, 'sendfile'):
+        with open(path, 'rb') as payload_file:
+            transport.write(payload_file.read())
+        callback()
+        return
+
+    async def send():
+        # A file object per response, the file position is not
+        # safe to share between concurrent sendfile calls.
+        with open(path, 'rb') as payload_file:
+            await loop.sendfile(transport, payload_file)
+
+    def done(future):
+        if future.cancelled() or future.exception():
+            transport.close()
+        callback()
+
+    asyncio.ensure_future(send(), loop=loop).add_done_callback(done)
+
+
+class ConnectionLimiter(object):
+    """
+    Caps the number of concurrent connections of a listener. Connections
+    above the cap are either rejected right away or queued with reading
+    paused until a slot frees up, depending on the overload policy.
+    Shed connections are counted. Only used from the event loop thread.
+    """
+
+    REJECT = 'reject'
+    QUEUE = 'queue'
+
+    def __init__(self, max_connections=None, policy=REJECT, max_queued=None):
+        if policy not in (self.REJECT, self.QUEUE):
+            raise ValueError("Invalid overload policy %s" % policy)
+        self.max_connections = max_connections
+        self.policy = policy
+        self.max_queued = max_queued if max_queued is not None else \
+            (max_connections or 0)
+        self.active = 0
+        self.shed = 0
+        self._waiting = deque()
+
+    def admit(self, protocol):
+        """
+        Try to admit a new connection
+        :return: True if admitted, False if queued and None if shed
+        """
+        if not self.max_connections or self.active < self.max_connections:
+            self.active += 1
+            return True
+        if self.policy == self.QUEUE and \
+                len(self._waiting) < self.max_queued:
+            self._waiting.append(protocol)
+            return False
+        self.shed += 1
+        return None
+
+    def release(self, protocol, admitted=True):
+        """Release slot of a closed connection and admit a queued one"""
+        if not admitted:
+            try:
+                self._waiting.remove(protocol)
+            except ValueError:
+                pass
+            return
+        self.active -= 1
+        while self._waiting and self.active < self.max_connections:
+            self.active += 1
+            self._waiting.popleft().admitted()
+
+    def stats(self):
+        return {'active': self.active, 'queued': len(self._waiting),
+                'shed': self.shed, 'max_connections': self.max_connections,
+                'policy': self.policy}
+
+
+class FlowControlledProtocol(asyncio.Protocol):
+    """
+    Base for stream server protocols. Stops reading from a connection
+    while the transport write buffer is above its high water mark, so a
+    slow reader can't make the server buffer unbounded responses, and
+    applies the listener connection limit.
+    """
+
+    def __init__(self, limiter=None):
+        self._limiter = limiter
+        self._admitted = True
+        self._read_pauses = set()
+        self.transport = None
+
     def connection_made(self, transport):
-        # peername = transport.get_extra_info('peername')
-        # print('Connection from {}'.format(peername))
         self.transport = transport
+        if self._limiter is None:
+            return
+        admitted = self._limiter.admit(self)
+        if admitted is None:
+            self._admitted = False
+            self._limiter = None
+            transport.abort()
+        elif not admitted:
+            self._admitted = False
+            self._pause_reading('queued')
+
+    def admitted(self):
+        """Called by limiter when a queued connection gets a slot"""
+        self._admitted = True
+        self._resume_reading('queued')
+
+    def connection_lost(self, exc):
+        if self._limiter is not None:
+            self._limiter.release(self, self._admitted)
+            self._limiter = None
+        self.transport = None
+
+    def pause_writing(self):
+        self._pause_reading('writing')
+
+    def resume_writing(self):
+        self._resume_reading('writing')
+
+    def _pause_reading(self, reason):
+        if self.transport is None:
+            return
+        if not self._read_pauses:
+            self.transport.pause_reading()
+        self._read_pauses.add(reason)
+
+    def _resume_reading(self, reason):
+        if self.transport is None or reason not in self._read_pauses:
+            return
+        self._read_pauses.discard(reason)
+        if not self._read_pauses and not self.transport.is_closing():
+            self.transport.resume_reading()
+
+
+class HTTPProtocol(FlowControlledProtocol):
+    """
+    Incremental HTTP/1.x server protocol supporting persistent
+    connections and pipelined requests.
+
+    Request bytes are accumulated in a bytearray and parsed in place;
+    only the request line and header block are copied for parsing.
+    All responses produced by one data_received call are sent with a
+    single transport write. File bodies are sent with sendfile, reading
+    is paused meanwhile so pipelined responses stay in order.
+    """
+
+    def __init__(self, responses=None, limiter=None):
+        super().__init__(limiter)
+        self._responses = responses if responses else _default_responses
+        self._buffer = bytearray()
+        self._sending_file = False
+        self._close_after_send = False
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self._buffer = bytearray()
 
     def data_received(self, data):
-        request_lines = data.decode().split("\n")
-        try:
-            method, path, proto = request_lines[0].split()
-            if method == 'GET':
-                self.start_response()
-                self.transport.write(DEFAULT_HTTP_RESPONSE)
+        self._buffer += data
+        if not self._sending_file:
+            self._process_buffer()
+
+    def _process_buffer(self):
+        out = []
+        close = False
+        while not close:
+            status, consumed, close = self._parse_request()
+            if status is None:
+                break
+            del self._buffer[:consumed]
+            if status == HTTP_OK:
+                out.extend(self._responses.ok_buffers(not close))
+                if self._responses.sendfile_path:
+                    self._send_file(out, close)
+                    return
+            elif status == HTTP_NOT_ALLOWED:
+                out.append(self._responses.not_allowed_close if close else
+                           self._responses.not_allowed)
             else:
-                self.start_response(status=b"405")
-                self.transport.write(b"405\r\n")
-        except Exception as e:
-            print(e)
-        self.transport.close()
+                out.append(self._responses.bad_request)
+        if self.transport is None:
+            return
+        if len(out) == 1:
+            self.transport.write(out[0])
+        elif self._responses.body is None:
+            # Keep payload views out of a joined copy
+            self.transport.writelines(out)
+        elif out:
+            self.transport.write(b"".join(out))
+        if close:
+            self.transport.close()
+
+    def _send_file(self, out, close):
+        """Write pending responses and send file body of the last one"""
+        self.transport.write(b"".join(out))
+        self._pause_reading('sendfile')
+        self._sending_file = True
+        self._close_after_send = close
+        _sendfile(asyncio.get_event_loop(), self.transport,
+                  self._responses.sendfile_path, self._file_sent)
 
-    def start_response(
-            self, content_type=b"text/html; charset=utf-8",  status=b"200"):
-        self.transport.write(b"HTTP/1.0 %b NA\r\n" % status)
-        self.transport.write(b"Content-Type: ")
-        self.transport.write(content_type)
-        self.transport.write(b"\r\n\r\n")
+    def _file_sent(self):
+        self._sending_file = False
+        if self.transport is None or self.transport.is_closing():
+            return
+        if self._close_after_send:
+            self.transport.close()
+            return
+        self._resume_reading('sendfile')
+        self._process_buffer()
+
+    def _parse_request(self):
+        """
+        Parse one request from the head of the buffer.
+        :return: tuple of (status, consumed bytes, close connection),
+                 status is None if the request is not complete yet
+        """
+        buf = self._buffer
+        # Empty lines before the request line are ignored, RFC 7230 3.5
+        start = 0
+        while buf.startswith(b"\r\n", start):
+            start += 2
+        end = buf.find(HTTP_HEADER_TERMINATOR, start)
+        if end < 0:
+            if len(buf) > MAX_HTTP_HEADER_SIZE:
+                return HTTP_BAD_REQUEST, len(buf), True
+            return None, 0, False
+        line_end = buf.find(b"\r\n", start, end)
+        if line_end < 0:
+            line_end = end
+        try:
+            method, _, version = bytes(buf[start:line_end]).split()
+        except ValueError:
+            return HTTP_BAD_REQUEST, len(buf), True
+        headers = bytes(buf[line_end:end]).lower()
+        consumed = end + len(HTTP_HEADER_TERMINATOR)
+        content_length = self._header_value(headers, b"content-length")
+        if content_length is not None:
+            # int() would take signs and blanks, a negative length would
+            # never consume the request
+            if not content_length.isdigit():
+                return HTTP_BAD_REQUEST, len(buf), True
+            consumed += int(content_length)
+            if consumed > len(buf):
+                return None, 0, False
+        connection = self._header_value(headers, b"connection")
+        if version == b"HTTP/1.1":
+            keep_alive = connection != b"close"
+        else:
+            keep_alive = connection == b"keep-alive"
+        status = HTTP_OK if method == b"GET" else HTTP_NOT_ALLOWED
+        return status, consumed, not keep_alive
+
+    @staticmethod
+    def _header_value(headers, name):
+        """Find value of a header in lower cased header block"""
+        start = headers.find(b"\r\n" + name + b":")
+        if start < 0:
+            return None
+        start += len(name) + 3
+        end = headers.find(b"\r\n", start)
+        return headers[start:end if end >= 0 else len(headers)].strip()
+
+
+_default_responses = HTTPResponses()
 
 
 class EchoServerProtocol:
+    """
+    UDP server which echoes the datagram back, or replies with the
+    payload of the response profile if one is given.
+    """
+
+    def __init__(self, profile=None):
+        self._profile = profile
+
     def connection_made(self, transport):
         self.transport = transport
 
     def datagram_received(self, data, addr):
+        if self._profile:
+            data = self._profile.payload()
         self.transport.sendto(data, addr)
 
 
-class EchoServerClientProtocol(asyncio.Protocol):
-    def connection_made(self, transport):
-        self.transport = transport
+class EchoServerClientProtocol(FlowControlledProtocol):
+    """
+    TCP server which echoes the received data back, or replies with the
+    payload of the response profile if one is given.
+    """
+
+    def __init__(self, profile=None, limiter=None):
+        super().__init__(limiter)
+        self._profile = profile
 
     def data_received(self, data):
-        self.transport.write(data)
+        if self._profile is None:
+            self.transport.write(data)
+        elif self._profile.sendfile_path:
+            self._pause_reading('sendfile')
+            _sendfile(asyncio.get_event_loop(), self.transport,
+                      self._profile.sendfile_path, self.transport.close)
+            return
+        else:
+            self.transport.write(self._profile.payload())
         self.transport.close()
 
 
-def tcp_serve(host, port, loop, reuse_port=True, sock=None, backlog=100):
+def create_listening_socket(host, port, protocol, backlog=100):
+    """
+    Create a non blocking socket bound to host and port, listening if it is
+    a stream socket. Used to create listeners up front, e.g. inside a
+    network namespace, and hand them to the serve functions via `sock`.
+    """
+    sock_type = socket.SOCK_DGRAM if protocol == 'UDP' else \
+        socket.SOCK_STREAM
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, sock_type)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+        if sock_type == socket.SOCK_STREAM:
+            sock.listen(backlog)
+        sock.setblocking(False)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def tcp_serve(host, port, loop, reuse_port=True, sock=None, backlog=100,
+              profile=None, limiter=None):
     server_coroutine = loop.create_server(
-        EchoServerClientProtocol, host, port,
+        functools.partial(EchoServerClientProtocol, profile, limiter),
+        host, port,
         reuse_port=reuse_port, sock=sock, backlog=backlog)
     return server_coroutine
 
 
-def udp_serve(host, port, loop, reuse_port=True, sock=None):
+def udp_serve(host, port, loop, reuse_port=True, sock=None, profile=None):
+    if sock is not None:
+        return loop.create_datagram_endpoint(
+            functools.partial(EchoServerProtocol, profile), sock=sock)
     server_coroutine = loop.create_datagram_endpoint(
-        EchoServerProtocol, local_addr=(host, port),
-        reuse_port=reuse_port, sock=sock)
+        functools.partial(EchoServerProtocol, profile),
+        local_addr=(host, port), reuse_port=reuse_port, sock=sock)
     return server_coroutine
 
 
-def http_serve(host, port, loop, reuse_port=True, sock=None, backlog=100):
+def _http_responses(response_size=None, profile=None):
+    if profile:
+        return HTTPResponses(profile=profile)
+    return HTTPResponses.of_size(response_size)
+
+
+def http_serve(host, port, loop, reuse_port=True, sock=None, backlog=100,
+               response_size=None, profile=None, limiter=None):
+    responses = _http_responses(response_size, profile)
     server_coroutine = loop.create_server(
-        HTTPProtocol, host, port,
+        functools.partial(HTTPProtocol, responses, limiter), host, port,
         reuse_port=reuse_port, sock=sock, backlog=backlog)
     return server_coroutine
 
 
-def https_serve(host, port, loop, reuse_port=True, sock=None, backlog=100):
+def https_serve(host, port, loop, reuse_port=True, sock=None, backlog=100,
+                response_size=None, profile=None, limiter=None):
     ssl_cntext = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
     ssl_cntext.load_cert_chain(SERVER_CERT_FILE, SERVER_KEY_FILE)
-    loop.debug = True
+    responses = _http_responses(response_size, profile)
     server_coroutine = loop.create_server(
-        HTTPProtocol, host, port,
+        functools.partial(HTTPProtocol, responses, limiter), host, port,
         reuse_port=reuse_port, sock=sock,
         backlog=backlog, ssl=ssl_cntext)
     return server_coroutine
@@ -98,12 +497,24 @@ class ServerFactory(object):
         print(server)
 
     @classmethod
-    def create_server(cls, server, loop):
+    def create_server(cls, server, loop, limiter=None, sock=None):
+        """
+        Create server coroutine for a server rule. If sock is given the
+        server uses that already bound socket instead of binding one.
+        """
+        profile = create_response_profile(server.response_profile)
+        host, port = ((None, None) if sock is not None else
+                      (server.endpoint, server.port))
         if server.protocol == 'TCP':
-            return tcp_serve(server.endpoint, server.port, loop)
+            return tcp_serve(host, port, loop, sock=sock,
+                             profile=profile, limiter=limiter)
         elif server.protocol == 'UDP':
-            return udp_serve(server.endpoint, server.port, loop)
+            return udp_serve(host, port, loop, sock=sock, profile=profile)
         elif server.protocol == 'HTTP':
-            return http_serve(server.endpoint, server.port, loop)
+            return http_serve(host, port, loop, sock=sock,
+                              response_size=HTTP_RESPONSE_SIZE,
+                              profile=profile, limiter=limiter)
         elif server.protocol == 'HTTPS':
-            return https_serve(server.endpoint, server.port, loop)
\ No newline at end of file
+            return https_serve(host, port, loop, sock=sock,
+                               response_size=HTTP_RESPONSE_SIZE,
+                               profile=profile, limiter=limiter)
@@ -1,58 +1,211 @@
 import asyncio
-from threading import Thread
+import logging
+import platform
+from threading import Event, Thread
 import time
 
-from axon.traffic.servers import ServerFactory
+from axon.common.config import EVENT_LOOP_DEBUG, LOOP_LAG_REPORT_INTERVAL, \
+    LOOP_LAG_SAMPLE_INTERVAL, LOOP_SLOW_CALLBACK_THRESHOLD, \
+    NAMESPACE_MODE, NAMESPACE_SHARED_LISTENERS, SERVER_MAX_CONNECTIONS, \
+    SERVER_MAX_QUEUED_CONNECTIONS, SERVER_OVERLOAD_POLICY, \
+    WORKER_HEARTBEAT_INTERVAL
+from axon.common.loop_monitor import LoopLagMonitor
+from axon.common.metric_cache import LoopLagReporter
+from axon.traffic.rpc_server import lock_free
+from axon.traffic.servers import ConnectionLimiter, \
+    create_listening_socket, ServerFactory
+from axon.utils.network_utils import NamespaceManager
+if "Linux" in platform.uname():  # noqa
+    from axon.utils.nsenter import NamespaceExecutor
 
 
 class TrafficServerWorker(object):
-    def __init__(self, uid):
+    log = logging.getLogger(__name__)
+
+    def __init__(self, uid, lag_exchange=None, hb_queue=None):
         self._uid = uid
+        self._hb_queue = hb_queue
         self._servers = list()
         self._running_servers = dict()
+        self._limiters = dict()
         self._loop = None
+        self._lag_exchange = lag_exchange
+        self._lag_monitor = None
+        self._ns_executor = None
+        self._endpoint_ns_map = None
+        self._rules_version = 0
 
     def initialize(self):
-        thread = Thread(target=self._run_servers)
+        loop_running = Event()
+        thread = Thread(target=self._run_servers, args=(loop_running,))
         thread.daemon = True
         thread.start()
-        time.sleep(1)
+        loop_running.wait()
+        self._start_lag_monitor()
+        if self._hb_queue is not None:
+            self._loop.call_soon_threadsafe(self._send_heartbeat)
+
+    def _send_heartbeat(self):
+        """
+        Send a heartbeat to the controller. It runs on the event loop, so
+        heartbeats stop when the loop hangs.
+        """
+        try:
+            self._hb_queue.put((self._uid, "OK", len(self._servers),
+                                time.time()))
+        except Exception:
+            self.log.exception("Failed to send heartbeat")
+        self._loop.call_later(WORKER_HEARTBEAT_INTERVAL, self._send_heartbeat)
+
+    def _start_lag_monitor(self):
+        """Start sampling event loop lag and reporting it to exchange"""
+        self._lag_monitor = LoopLagMonitor(
+            self._loop, LOOP_LAG_SAMPLE_INTERVAL,
+            LOOP_SLOW_CALLBACK_THRESHOLD, EVENT_LOOP_DEBUG)
+        self._lag_monitor.start()
+        if self._lag_exchange:
+            LoopLagReporter(self._lag_monitor, self._lag_exchange,
+                            self._uid, 'server', LOOP_LAG_REPORT_INTERVAL)
 
-    def _run_servers(self):
+    def _run_servers(self, loop_running=None):
         self._loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self._loop)
+        if loop_running:
+            # First callback of the loop, so the loop is serving
+            self._loop.call_soon(loop_running.set)
         self._loop.run_forever()
 
+    def _get_namespace(self, endpoint):
+        """
+        Get namespace owning endpoint IP, None if endpoint is in the
+        namespace of the worker itself
+        """
+        if not (NAMESPACE_MODE and NAMESPACE_SHARED_LISTENERS):
+            return None
+        if self._endpoint_ns_map is None:
+            self._endpoint_ns_map = \
+                NamespaceManager().get_endpoint_namespace_map()
+        return self._endpoint_ns_map.get(endpoint)
+
+    def _create_namespace_socket(self, server, namespace):
+        """
+        Create listening socket of server inside namespace. Only the
+        helper thread enters the namespace, the socket stays bound to
+        it and is served by this worker's loop.
+        """
+        if self._ns_executor is None:
+            self._ns_executor = NamespaceExecutor()
+        return self._ns_executor.run(
+            namespace, create_listening_socket,
+            server.endpoint, server.port, server.protocol)
+
     def add_servers(self, servers):
+        """
+        Start servers which are not running yet, a server is only kept
+        once its listener is bound
+        :return: servers which failed to start
+        :rtype: list
+        """
+        failed = []
         for server in servers:
-            if server not in self._servers:
-                self._servers.append(server)
-                async_server = ServerFactory.create_server(server, self._loop)
+            if server in self._servers:
+                continue
+            limiter = None
+            if server.protocol != 'UDP':
+                limiter = ConnectionLimiter(
+                    SERVER_MAX_CONNECTIONS, SERVER_OVERLOAD_POLICY,
+                    SERVER_MAX_QUEUED_CONNECTIONS)
+            try:
+                namespace = self._get_namespace(server.endpoint)
+                sock = (self._create_namespace_socket(server, namespace)
+                        if namespace else None)
+                async_server = ServerFactory.create_server(
+                    server, self._loop, limiter, sock)
                 server_instance = asyncio.run_coroutine_threadsafe(
-                    async_server, self._loop)
-                self._running_servers[server] = server_instance.result()
+                    async_server, self._loop).result()
+            except Exception:
+                self.log.exception("Failed to start server %s", server)
+                failed.append(server)
+                continue
+            self._running_servers[server] = server_instance
+            if limiter:
+                self._limiters[server] = limiter
+            self._servers.append(server)
+        return failed
 
     def delete_servers(self, servers):
         for server in servers:
-            if server in servers:
+            if server in self._servers:
                 self._stop_server(server)
                 self._servers.remove(server)
 
     def delete_all_servers(self):
-        for server in self._servers:
+        for server in list(self._servers):
             self._stop_server(server)
             self._servers.remove(server)
 
+    def apply_delta(self, delta):
+        """
+        Apply a rule set delta sent by controller
+        :param delta: servers removed and added since delta.base_version
+        :type delta: axon.traffic.rule_set.RuleDelta
+        :return: rules version of this worker, it differs from
+                 delta.version if delta was not made for current version
+        :rtype: int
+        """
+        if delta.reset:
+            self.delete_all_servers()
+        elif delta.base_version != self._rules_version:
+            return self._rules_version
+        self.delete_servers(delta.removed)
+        self.add_servers(delta.added)
+        self._rules_version = delta.version
+        return self._rules_version
+
+    @lock_free
+    def get_rules_version(self):
+        """Get version of rule set last applied by this worker"""
+        return self._rules_version
+
+    @staticmethod
+    async def _close_server(server_instance):
+        if isinstance(server_instance, tuple):
+            # UDP servers are (transport, protocol) of a datagram endpoint
+            server_instance[0].close()
+            # Let the transport release its socket, so the port can be
+            # bound again right away
+            await asyncio.sleep(0)
+        else:
+            server_instance.close()
+            await server_instance.wait_closed()
+
     def _stop_server(self, server):
         server_instance = self._running_servers[server]
-        server_instance.close()
         future = asyncio.run_coroutine_threadsafe(
-            server_instance.wait_closed(), self._loop)
+            self._close_server(server_instance), self._loop)
         future.result()
         del self._running_servers[server]
+        self._limiters.pop(server, None)
 
+    @lock_free
     def get_server_count(self):
         return len(self._servers)
 
+    @lock_free
     def has_server(self, server):
-        return server in self._servers
\ No newline at end of file
+        return server in self._servers
+
+    @lock_free
+    def get_loop_lag(self):
+        """Get event loop lag percentiles since the last report"""
+        return self._lag_monitor.snapshot(reset=False)
+
+    @lock_free
+    def get_connection_stats(self):
+        """
+        Get connection counters of every listener, including number
+        of connections shed because of the connection limit
+        """
+        return [dict(limiter.stats(), endpoint=server.endpoint,
+                     port=server.port, protocol=server.protocol)
+                for server, limiter in list(self._limiters.items())]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+import logging
+from queue import Empty
+from threading import Event, Lock, Thread
+import time
+
+from axon.common.config import WORKER_AUTOSCALE_INTERVAL, \
+    WORKER_HEARTBEAT_TIMEOUT, WORKER_STARTUP_GRACE, \
+    WORKER_SUPERVISOR_INTERVAL
+
+
+class WorkerSupervisor(Thread):
+    """
+    Watches traffic workers of a TrafficController. Drains heartbeats sent
+    by workers and every `interval` seconds restarts workers whose process
+    died or whose heartbeats stopped for `timeout` seconds. A worker which
+    sent no heartbeat `startup_grace` seconds after it started, e.g. as
+    it hung while starting, is restarted as well. Every
+    `autoscale_interval` seconds, if set, the worker pools are resized.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, controller, hb_queue,
+                 interval=WORKER_SUPERVISOR_INTERVAL,
+                 timeout=WORKER_HEARTBEAT_TIMEOUT,
+                 autoscale_interval=WORKER_AUTOSCALE_INTERVAL,
+                 startup_grace=WORKER_STARTUP_GRACE):
+        super(WorkerSupervisor, self).__init__()
+        self.daemon = True
+        self._controller = controller
+        self._hb_queue = hb_queue
+        self._interval = interval
+        self._timeout = timeout
+        self._autoscale_interval = autoscale_interval
+        self._startup_grace = startup_grace
+        self._heartbeats = {}
+        self._lock = Lock()
+        self._stop_event = Event()
+
+    def drain(self, timeout=0):
+        """Record heartbeats waiting in queue, wait `timeout` for first"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                uid, _, rule_count, _ = self._hb_queue.get(
+                    timeout=max(0, deadline - time.time()))
+            except Empty:
+                return
+            with self._lock:
+                self._heartbeats[uid] = (time.time(), rule_count)
+
+    def get_heartbeat(self, uid):
+        """
+        Get time and reported rule count of last heartbeat of a worker
+        :return: (time, rule count) or None if worker never sent one
+        :rtype: tuple
+        """
+        with self._lock:
+            return self._heartbeats.get(uid)
+
+    def forget(self, uid):
+        with self._lock:
+            self._heartbeats.pop(uid, None)
+
+    def is_healthy(self, context):
+        process = context.get('process')
+        if process is None or not process.is_running():
+            return False
+        heartbeat = self.get_heartbeat(context['uid'])
+        if heartbeat is None:
+            return time.time() - context.get('started', 0) <= \
+                self._startup_grace
+        return time.time() - heartbeat[0] <= self._timeout
+
+    def check(self):
+        """Restart every worker which is not healthy"""
+        for worker_type in ('server', 'client'):
+            for context in self._controller._get_worker_contexts(worker_type):
+                if self.is_healthy(context):
+                    continue
+                self.forget(context['uid'])
+                try:
+                    self._controller._restart_worker(context, worker_type)
+                except Exception:
+                    self.log.exception("Failed to restart %s worker %s",
+                                       worker_type, context['uid'])
+
+    def autoscale(self):
+        for worker_type in ('server', 'client'):
+            try:
+                self._controller.autoscale(worker_type)
+            except Exception:
+                self.log.exception("Failed to autoscale %s workers",
+                                   worker_type)
+
+    def run(self):
+        next_check = time.time() + self._interval
+        next_autoscale = time.time() + self._autoscale_interval
+        while not self._stop_event.is_set():
+            self.drain(max(0, next_check - time.time()))
+            if time.time() >= next_check:
+                self.check()
+                next_check = time.time() + self._interval
+            if self._autoscale_interval and time.time() >= next_autoscale:
+                self.autoscale()
+                next_autoscale = time.time() + self._autoscale_interval
+
+    def stop(self):
+        self._stop_event.set()
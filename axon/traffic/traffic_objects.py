@@ -1,19 +1,23 @@
 from collections import deque
 import logging
+from operator import attrgetter
 from threading import Lock
 import time
 import uuid
 
 
 class TrafficServer(object):
-    __slots__ = ('id', 'endpoint', 'port', 'protocol', 'enabled')
+    __slots__ = ('id', 'endpoint', 'port', 'protocol', 'enabled',
+                 'response_profile')
 
-    def __init__(self, id, endpoint, port, protocol, enabled=True):
+    def __init__(self, id, endpoint, port, protocol, enabled=True,
+                 response_profile=None):
         self.id = id
         self.endpoint = endpoint
         self.port = port
         self.protocol = protocol
         self.enabled = enabled
+        self.response_profile = response_profile
 
     def as_dict(self):
         return {
@@ -21,7 +25,8 @@ class TrafficServer(object):
             'endpoint': self.endpoint,
             'port': self.port,
             'protocol': self.protocol,
-            'enabled': self.enabled
+            'enabled': self.enabled,
+            'response_profile': self.response_profile
         }
 
     def __str__(self):
@@ -96,6 +101,56 @@ class TrafficRule(object):
         return hash(self.__str__())
 
 
+class RuleColumns(object):
+    """
+    Compact columnar form of a list of rules of the same type, one tuple
+    per attribute instead of one object per rule. Pickling it is much
+    cheaper than pickling rule objects one by one, so it is used to ship
+    large rule lists to workers.
+    """
+    __slots__ = ('rule_type', 'columns')
+
+    _rule_types = {cls.__name__: cls for cls in (TrafficServer, TrafficRule)}
+
+    def __init__(self, rule_type, columns):
+        self.rule_type = rule_type
+        self.columns = columns
+
+    def __getstate__(self):
+        return self.rule_type, self.columns
+
+    def __setstate__(self, state):
+        self.rule_type, self.columns = state
+
+    @classmethod
+    def from_rules(cls, rules):
+        """
+        Encode rules in columnar form
+        :param rules: rules to be encoded
+        :type rules: list
+        :return: encoded rules or None if they can't be encoded, e.g. they
+                 are empty or of mixed types
+        :rtype: RuleColumns
+        """
+        if not isinstance(rules, list) or not rules:
+            return None
+        rule_cls = type(rules[0])
+        if rule_cls.__name__ not in cls._rule_types or \
+                not all(type(rule) is rule_cls for rule in rules):
+            return None
+        # Constructor arguments of rule objects follow order of slots
+        columns = tuple(zip(*map(attrgetter(*rule_cls.__slots__), rules)))
+        return cls(rule_cls.__name__, columns)
+
+    def to_rules(self):
+        """Decode back to list of rule objects"""
+        rule_cls = self._rule_types[self.rule_type]
+        return [rule_cls(*values) for values in zip(*self.columns)]
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+
 class TrafficRuleCollection(object):
     log = logging.getLogger(__name__)
 
@@ -115,7 +170,7 @@ class TrafficRuleCollection(object):
 
     def __delete_rule(self, rule):
         try:
-            rule = self._rules_map[rule]
+            del self._rules_map[rule]
             self._rules.remove(rule)
         except KeyError:
             self.log.error(
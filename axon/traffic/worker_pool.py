@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+from collections import deque
+import logging
+from threading import Lock, Thread
+
+from axon.common.config import WORKER_WARM_POOL_SIZE
+
+
+class WarmWorkerPool(object):
+    """
+    Keeps idle workers which are started and initialized ahead of time,
+    so a worker taking on rules serves them right away instead of after
+    process start up. A worker taken from the pool is replaced in the
+    background.
+    """
+    log = logging.getLogger(__name__)
+
+    def __init__(self, start_worker, size=WORKER_WARM_POOL_SIZE):
+        """
+        :param start_worker: function starting a worker and returning its
+            context once the worker is ready
+        :type start_worker: callable
+        :param size: number of idle workers to keep
+        :type size: int
+        """
+        self._start_worker = start_worker
+        self._size = size
+        self._idle = deque()
+        self._lock = Lock()
+        self._filling = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._idle)
+
+    def fill(self, wait=False):
+        """Start missing idle workers in a background thread"""
+        with self._lock:
+            if self._filling is None and not self._closed and \
+                    len(self._idle) < self._size:
+                self._filling = Thread(target=self._fill)
+                self._filling.daemon = True
+                self._filling.start()
+            filling = self._filling
+        if wait and filling:
+            filling.join()
+
+    def _fill(self):
+        try:
+            while True:
+                with self._lock:
+                    if self._closed or len(self._idle) >= self._size:
+                        return
+                context = self._start_worker()
+                with self._lock:
+                    if not self._closed:
+                        self._idle.append(context)
+                        continue
+                context['process'].stop()
+        except Exception:
+            self.log.exception("Failed to start idle worker")
+        finally:
+            with self._lock:
+                self._filling = None
+
+    def acquire(self):
+        """
+        Take an idle worker out of the pool
+        :return: worker context, None if no worker is ready
+        :rtype: dict
+        """
+        context = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate['process'].is_running():
+                    context = candidate
+                    break
+        self.fill()
+        return context
+
+    def close(self):
+        """
+        Stop idle workers, no new ones are started
+        :return: contexts of stopped workers
+        :rtype: list
+        """
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for context in idle:
+            context['process'].stop()
+        return idle
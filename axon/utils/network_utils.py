@@ -96,6 +96,16 @@ class NamespaceManager(object):
     def get_namespace_interface_map(self):
         return self._namespace_interface_map
 
+    def get_endpoint_namespace_map(self):
+        """
+        Get mapping of interface IP address to the namespace owning it
+        :return: map of ip to namespace name
+        :rtype: dict
+        """
+        return {iface.address: ns for ns, interfaces in
+                self._namespace_interface_map.items()
+                for iface in (interfaces or [])}
+
     def get_all_namespaces(self):
         """
         Get the list of all namespaces presnt in the system
@@ -25,8 +25,10 @@ $ python
 >>>
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import contextlib
 import ctypes.util
+import errno
 import logging
 import os
 
@@ -67,3 +69,40 @@ def namespace(nspath, nstype):
         finally:
             logger.info("leaving %s namespace %s", nstype, nspath)
             setns(original_ns)
+
+
+class NamespaceExecutor(object):
+    """
+    Runs callables inside network namespaces on a dedicated helper thread.
+
+    setns only switches the namespace of the calling thread, so the rest
+    of the process stays where it is, and sockets created by the helper
+    keep the namespace they were created in. This lets a single process
+    own listening and client sockets of many namespaces.
+    """
+
+    NAMESPACE_PATH = '/var/run/netns/'
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, ns, func, args, kwargs):
+        if not ns:
+            return func(*args, **kwargs)
+        with namespace(self.NAMESPACE_PATH + ns, 'net'):
+            return func(*args, **kwargs)
+
+    def submit(self, ns, func, *args, **kwargs):
+        """
+        Run func inside namespace ns on the helper thread
+        :return: future of the func result
+        :rtype: concurrent.futures.Future
+        """
+        return self._executor.submit(self._run, ns, func, args, kwargs)
+
+    def run(self, ns, func, *args, **kwargs):
+        """Run func inside namespace ns and wait for its result"""
+        return self.submit(ns, func, *args, **kwargs).result()
+
+    def shutdown(self):
+        self._executor.shutdown()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 VMware, Inc. All Rights Reserved.
+# SPDX-License-Identifier: BSD-2 License
+# The full license information can be found in LICENSE.txt
+# in the root directory of this project.
+"""
+Micro-benchmark of the worker RPC wire format for large rule lists.
+
+Compares serializing a rule list the way RPC used to (pickled and then
+pickled again by Connection.send), a single highest protocol pickle and
+the columnar RuleColumns encoding, then times a real round trip through
+an RPCServer.
+
+    PYTHONPATH=. python tools/rpc_benchmark.py --rules 100000
+"""
+import argparse
+import pickle
+import time
+
+from axon.traffic.rpc_server import RPCClient, RPCServer
+from axon.traffic.traffic_objects import RuleColumns, TrafficRule
+
+
+class CountingHandler(object):
+
+    def add_clients(self, rules):
+        return len(rules)
+
+
+def make_rules(count):
+    return [TrafficRule(str(i), '10.0.%d.%d' % (i // 250 % 250, i % 250),
+                        '20.0.%d.%d' % (i // 250 % 250, i % 250),
+                        1024 + i % 60000, 'TCP') for i in range(count)]
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_encodings(rules, repeat):
+    def double_pickle():
+        payload = pickle.dumps(pickle.dumps(rules))
+        pickle.loads(pickle.loads(payload))
+        return len(payload)
+
+    def single_pickle():
+        payload = pickle.dumps(rules, pickle.HIGHEST_PROTOCOL)
+        pickle.loads(payload)
+        return len(payload)
+
+    def columnar():
+        payload = pickle.dumps(RuleColumns.from_rules(rules),
+                               pickle.HIGHEST_PROTOCOL)
+        pickle.loads(payload).to_rules()
+        return len(payload)
+
+    for name, func in (('double pickle', double_pickle),
+                       ('single pickle', single_pickle),
+                       ('columnar', columnar)):
+        elapsed, size = timed(func, repeat)
+        print("%-16s %8.1f ms %10d bytes" % (name, elapsed * 1000, size))
+
+
+def bench_round_trip(rules, repeat):
+    server = RPCServer('rpc_benchmark', CountingHandler())
+    server.start()
+    try:
+        for compact in (False, True):
+            with RPCClient(server.address, compact_rules=compact) as client:
+                elapsed, _ = timed(lambda: client.add_clients(rules), repeat)
+            print("%-16s %8.1f ms" % (
+                'rpc columnar' if compact else 'rpc objects', elapsed * 1000))
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rules', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    rules = make_rules(args.rules)
+    print("%d rules, best of %d" % (args.rules, args.repeat))
+    bench_encodings(rules, args.repeat)
+    bench_round_trip(rules, args.repeat)
+
+
+if __name__ == '__main__':
+    main()